@@ -1,4 +1,4 @@
-from .core import (tokens, stems, tags)
+from .core import (tokens, stems, tags, correct, similarity, sentiment, sentiment_batch)
 
-__all__ = (tokens, stems, tags)
+__all__ = (tokens, stems, tags, correct, similarity, sentiment, sentiment_batch)
 __version__ = '0.0.1'
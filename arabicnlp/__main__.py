@@ -0,0 +1,189 @@
+"""
+Command line tools::
+
+    python -m arabicnlp sentiment-train tweets.csv sentiment.npz --epochs 5
+    python -m arabicnlp sentiment-benchmark sentiment.npz tweets.csv
+    python -m arabicnlp pos-fast-train articles.txt pos_fast.npz --epochs 5
+    python -m arabicnlp pos-fast-benchmark pos_fast.npz articles.txt
+    python -m arabicnlp pos-evaluate treebank.conllu --backend fast --output tagged.conllu
+    python -m arabicnlp job-create /data/job corpus-*.txt --steps tokens,stems,tags
+    python -m arabicnlp job-run /data/job --workers 8
+"""
+
+import argparse
+import sys
+
+
+def _sentiment_train(args):
+    from .models.sentiment import SentimentModel, read_csv
+
+    model = SentimentModel.fit_csv(args.csv, epochs=args.epochs, text_column=args.text_column,
+                                   label_column=args.label_column, n_features=args.n_features,
+                                   ngram_range=(1, args.max_n))
+    model.save(args.model)
+    print('training accuracy: %.4f' % model.score_rows(read_csv(args.csv, args.text_column, args.label_column)))
+
+
+def _sentiment_benchmark(args):
+    from .models.sentiment import SentimentModel, evaluate, read_csv
+
+    model = SentimentModel.load(args.model)
+    result = evaluate(model, read_csv(args.csv, args.text_column, args.label_column), args.batch_size)
+    print('%d messages, %.0f messages/s, accuracy %.4f'
+          % (result['messages'], result['messages_per_second'], result['accuracy']))
+
+
+def _read_lines(filename):
+    with open(filename, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _pos_fast_train(args):
+    from .models.perceptron import distill
+
+    model = distill(_read_lines(args.texts), version=args.version, epochs=args.epochs,
+                    n_features=args.n_features, seed=args.seed)
+    model.save(args.model)
+    print('%d tags, %d words' % (len(model.classes), len(model.words)))
+
+
+def _pos_fast_benchmark(args):
+    from .models.perceptron import PerceptronTagger, benchmark
+
+    model = PerceptronTagger.load(args.model)
+    result = benchmark(model, _read_lines(args.texts))
+    print('%d tokens, %.0f tokens/s' % (result['tokens'], result['tokens_per_second']))
+
+
+def _pos_evaluate(args):
+    from .models.conllu import ConlluCorpus
+    from .models.evaluation import evaluate
+
+    result = evaluate(ConlluCorpus(args.conllu, args.column), version=args.version, backend=args.backend,
+                      chunk_size=args.chunk_size, output=args.output)
+    print('%d sentences, %d tokens, %.0f tokens/s' % (result['sentences'], result['tokens'], result['tokens_per_second']))
+    print('accuracy %.4f' % result['accuracy'])
+    print('-PAD- rate %.4f' % result['pad_rate'])
+    print('OOV rate %.4f, OOV error rate %.4f, known error rate %.4f'
+          % (result['oov_rate'], result['oov_error_rate'], result['known_error_rate']))
+    print()
+    print('gold\tcount\taccuracy\tmost frequent errors')
+    for gold, predicted in sorted(result['confusion'].items()):
+        total = sum(predicted.values())
+        errors = sorted(((n, tag) for tag, n in predicted.items() if tag != gold), reverse=True)[:3]
+        print('%s\t%d\t%.4f\t%s' % (gold, total, predicted.get(gold, 0) / total,
+                                     ' '.join('%s:%d' % (tag, n) for n, tag in errors)))
+
+
+def _job_create(args):
+    from .jobs import create_manifest
+
+    manifest = create_manifest(args.directory, args.inputs, args.steps.split(','), args.documents_per_shard)
+    print('%d shards, %d documents' % (len(manifest['shards']), sum(s['documents'] for s in manifest['shards'])))
+
+
+def _print_shard(result):
+    eta = '-' if result['eta'] is None else '%d:%02d:%02d' % (result['eta'] // 3600, result['eta'] % 3600 // 60,
+                                                              result['eta'] % 60)
+    print('shard %s %s: %d documents, %.0f documents/s, %d/%d shards done, ETA %s'
+          % (result['id'], result['status'], result['documents'], result['documents_per_second'],
+             result['shards_done'], result['shards'], eta))
+    sys.stdout.flush()
+
+
+def _job_run(args):
+    from .jobs import run
+
+    _print_status(run(args.directory, workers=args.workers, lease=args.lease, report=_print_shard,
+                      store=args.store, store_bytes=args.store_mb * 2 ** 20))
+
+
+def _print_status(result):
+    print('%(done)d/%(shards)d shards done (%(documents_done)d/%(documents)d documents), '
+          '%(claimed)d claimed, %(pending)d pending' % result)
+
+
+def _job_status(args):
+    from .jobs import status
+
+    _print_status(status(args.directory))
+
+
+def _csv_columns(parser):
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--label-column', default='label')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m arabicnlp')
+    commands = parser.add_subparsers(dest='command')
+
+    train = commands.add_parser('sentiment-train', help='train a sentiment model on a labeled CSV file')
+    train.add_argument('csv')
+    train.add_argument('model', help='output .npz file')
+    train.add_argument('--epochs', type=int, default=5)
+    train.add_argument('--n-features', type=int, default=2 ** 18)
+    train.add_argument('--max-n', type=int, default=2, help='longest stem n-gram')
+    _csv_columns(train)
+    train.set_defaults(run=_sentiment_train)
+
+    bench = commands.add_parser('sentiment-benchmark', help='measure sentiment messages per second on a CSV file')
+    bench.add_argument('model')
+    bench.add_argument('csv')
+    bench.add_argument('--batch-size', type=int, default=1024)
+    _csv_columns(bench)
+    bench.set_defaults(run=_sentiment_benchmark)
+
+    train = commands.add_parser('pos-fast-train',
+                                help='train the fast POS tagger on the LSTM tags of a text file (one document per line)')
+    train.add_argument('texts')
+    train.add_argument('model', help='output .npz file')
+    train.add_argument('--version', help='LSTM tagger version')
+    train.add_argument('--epochs', type=int, default=5)
+    train.add_argument('--n-features', type=int, default=2 ** 20)
+    train.add_argument('--seed', type=int)
+    train.set_defaults(run=_pos_fast_train)
+
+    bench = commands.add_parser('pos-fast-benchmark', help='measure fast POS tagger tokens per second on a text file')
+    bench.add_argument('model')
+    bench.add_argument('texts')
+    bench.set_defaults(run=_pos_fast_benchmark)
+
+    evaluate = commands.add_parser('pos-evaluate', help='evaluate the POS tagger on a CoNLL-U file')
+    evaluate.add_argument('conllu', help='CoNLL-U file, optionally gzipped')
+    evaluate.add_argument('--version', help='model version')
+    evaluate.add_argument('--backend', choices=('lstm', 'fast'), default='lstm')
+    evaluate.add_argument('--column', choices=('upos', 'xpos'), default='upos', help='gold tag column')
+    evaluate.add_argument('--chunk-size', type=int, default=1024, help='sentences tagged at a time')
+    evaluate.add_argument('--output', help='write the predicted tags to this CoNLL-U file')
+    evaluate.set_defaults(run=_pos_evaluate)
+
+    create = commands.add_parser('job-create', help='cut text files (one document per line) into the shards of a job')
+    create.add_argument('directory', help='job directory')
+    create.add_argument('inputs', nargs='+')
+    create.add_argument('--steps', default='tokens,stems,tags', help="comma-separated steps, or 'module:function'")
+    create.add_argument('--documents-per-shard', type=int, default=10000)
+    create.set_defaults(run=_job_create)
+
+    job = commands.add_parser('job-run', help='process the unfinished shards of a job, resuming after interruptions')
+    job.add_argument('directory')
+    job.add_argument('--workers', type=int, help='worker processes, defaults to the number of CPUs')
+    job.add_argument('--lease', type=float, default=600, help='seconds before the claim of a silent worker expires')
+    job.add_argument('--store', help='result store (SQLite file on a local disk) to skip unchanged documents')
+    job.add_argument('--store-mb', type=int, default=1024, help='size budget of the result store')
+    job.set_defaults(run=_job_run)
+
+    job_status = commands.add_parser('job-status', help='show the progress of a job')
+    job_status.add_argument('directory')
+    job_status.set_defaults(run=_job_status)
+
+    args = parser.parse_args(argv)
+    if not getattr(args, 'run', None):
+        parser.print_help()
+        return 1
+    args.run(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,32 +1,83 @@
-import re
-from .preprocessing import ArabicStemmer
+from .preprocessing import ArabicStemmer, ScriptStemmer, SpellChecker
 from .models import tags as _tags
+from .models.pos_tagger import tokenizer
+from .models import default_registry
+from .features import HashingVectorizer
+
+
+def available_models():
+    """Return the ``(name, version)`` pairs of the locally available models."""
+    return default_registry.available()
 
-available_models = (
-    ('POST', 'LSTM')
-)
 
 stemmer = ArabicStemmer()
+script_stemmer = ScriptStemmer(arabic=stemmer)
+_similarity_vectorizer = HashingVectorizer(alternate_sign=False, sublinear_tf=True)
+_spell_checker = None
+
+def tokens(text, vocabulary=None, output='numpy'):
+    """
+    Return the tokens of ``text``.
 
-def tokens(text):
-    r = re.compile(r'\w+|[^\w\s]+', re.UNICODE | re.MULTILINE | re.DOTALL)
-    return r.findall(text)
+    :param vocabulary: :class:`~arabicnlp.preprocessing.Vocabulary` to
+                       return the token ids from instead, growing it
+    :param output: ``'numpy'`` (int32 array) or ``'array'`` (``array('i')``)
+                   ids when a vocabulary is given
+    """
+    result = tokenizer.tokenize(text)
+    return result if vocabulary is None else vocabulary.ids(result, output=output)
 
-def stems(text):
-    return [stemmer.stem(token) for token in tokens(text)]
+def stems(text, vocabulary=None, output='numpy'):
+    """Return the stems of the tokens of ``text``, or their ids, see :func:`tokens`."""
+    result = script_stemmer.stem_batch(tokenizer.tokenize(text))
+    return result if vocabulary is None else vocabulary.ids(result, output=output)
 
 
-def tags(text):
-    return _tags(text)
+def tags(text, version=None, clitics=False, backend='lstm'):
+    """
+    Return the POS tag of every token of ``text`` as a dict.
+
+    :param version: version of the ``pos`` model with ``backend='lstm'``,
+                    of the ``pos-fast`` model with ``backend='fast'``
+    :param backend: ``'lstm'`` or ``'fast'``, see :func:`arabicnlp.models.pos_tagger.tag_document`
+    """
+    return _tags(text, version=version, clitics=clitics, backend=backend)
     
 
-def correct(text):
-    return False
+def spell_checker():
+    """Return the default spell checker, built from the tagger vocabulary on first use."""
+    global _spell_checker
+    if _spell_checker is None:
+        _, files = default_registry.files('pos')
+        _spell_checker = SpellChecker.from_word2index(files['word2index'])
+    return _spell_checker
+
+
+def correct(text, checker=None):
+    """
+    Correct the spelling of every word of ``text``.
+
+    :param checker: :class:`SpellChecker` to use, defaults to one built
+                    from the tagger vocabulary
+    """
+    return (checker or spell_checker()).correct(text)
+
+
+def sentiment(text, version=None):
+    """Return the sentiment label of ``text`` predicted by the installed sentiment model."""
+    return sentiment_batch([text], version=version)[0]
+
 
+def sentiment_batch(texts, version=None):
+    """
+    Return the sentiment label of every text, scoring the whole batch at once.
 
-def sentiment(text):
-    return False
+    :raise LookupError: if no sentiment model is installed
+    """
+    return default_registry.load('sentiment', version).predict(texts)
 
 
 def similarity(text1, text2):
-    return False
+    """Cosine similarity of the stem vectors of two texts, between 0 and 1."""
+    X = _similarity_vectorizer.transform([text1, text2])
+    return float(X[0].multiply(X[1]).sum())
@@ -0,0 +1,5 @@
+from .hashing import HashingVectorizer
+from .similarity import TfidfVectorizer, similarity_matrix, top_k
+from .minhash import MinHash, MinHashLSH
+from .search import InvertedIndex
+from .gazetteer import Gazetteer
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Gazetteer matching with an Aho-Corasick automaton over tokens.
+
+Phrases (names, places, keywords...) are tokenized, normalized like
+:class:`ArabicStemmer` normalizes words (harakat, tatweel and hamza
+forms) and optionally stemmed, then compiled into an Aho-Corasick
+automaton whose symbols are the ids of the normalized tokens. A document
+is matched against every phrase at once in a single pass over its
+tokens, whatever the number of phrases::
+
+    gazetteer = Gazetteer(stem=True)
+    gazetteer.update([('محمد بن سلمان', 'PERSON'), ('الرياض', 'LOCATION')])
+    gazetteer.find('وصل محمد بن سلمان إلى الرياض')
+    # [(4, 17, 'PERSON'), (22, 28, 'LOCATION')]   character spans and labels
+    gazetteer.save('/data/gazetteer')
+    gazetteer = Gazetteer.load('/data/gazetteer')
+
+A saved gazetteer is a directory of ``.npy`` files (the automaton as
+sorted transition keys, failure links and outputs, plus a
+:class:`~arabicnlp.preprocessing.Vocabulary` of the tokens) that is
+memory-mapped when loaded: nothing is built until the first match, and
+only the states a worker actually visits are ever read.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from ..preprocessing.stemmer import ArabicStemmer
+from ..preprocessing.tokenizer import _NORMALIZE, Tokenizer
+from ..preprocessing.vocabulary import Vocabulary
+from .hashing import _stem_batch
+
+MANIFEST = 'manifest.json'
+_FORMAT = 1
+
+_ARRAYS = ('phrase_tokens', 'phrase_offsets', 'labels', 'transitions', 'targets', 'fail', 'report',
+           'output_offsets', 'output_phrases')
+
+
+class Gazetteer():
+    """
+    Multi-phrase matcher over normalized, optionally stemmed, tokens.
+
+    :param phrases: initial phrases, see :meth:`update`
+    :param stem: match the stems of the tokens rather than the normalized
+                 tokens, so that inflected forms of a phrase match too
+    """
+
+    # distinct text tokens whose id is remembered between documents
+    max_memo = 2 ** 20
+
+    def __init__(self, phrases=(), stem=False):
+        self.stem = stem
+        self.vocabulary = Vocabulary()
+        self._tokenizer = Tokenizer()
+        self._normalizer = ArabicStemmer()
+        # phrases of a loaded gazetteer, and those added in this process
+        self._base_tokens = np.zeros(0, dtype=np.int32)
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._base_labels = np.zeros(0, dtype=np.str_)
+        self._added_tokens = []
+        self._added_labels = []
+        self._compiled = False
+        self.update(phrases)
+
+    def __len__(self):
+        return len(self._base_labels) + len(self._added_labels)
+
+    def _keys(self, tokens):
+        """Return the normalized (or stemmed) form of every token."""
+        tokens = [t.translate(_NORMALIZE) for t in tokens]
+        if self.stem:
+            return _stem_batch(tokens)
+        normalize = self._normalizer.normalize
+        return [normalize(t) for t in tokens]
+
+    def add(self, phrase, label=None):
+        """
+        Add a phrase.
+
+        :param label: returned with the matches of the phrase, defaults to
+                      the phrase itself
+        :return: id of the phrase
+        """
+        tokens = self._tokenizer.tokenize(phrase)
+        if not tokens:
+            raise ValueError('Phrase %r has no tokens.' % (phrase,))
+        self._added_tokens.append(self.vocabulary.ids(self._keys(tokens)).tolist())
+        self._added_labels.append(phrase if label is None else label)
+        self._compiled = False
+        return len(self) - 1
+
+    def update(self, phrases):
+        """Add phrases, given as strings or ``(phrase, label)`` pairs."""
+        for phrase in phrases:
+            if isinstance(phrase, str):
+                self.add(phrase)
+            else:
+                self.add(*phrase)
+
+    def label(self, i):
+        """Return the label of phrase ``i``."""
+        base = len(self._base_labels)
+        return str(self._base_labels[i]) if i < base else self._added_labels[i - base]
+
+    def _phrases(self):
+        """Return the token ids of all the phrases and their offsets."""
+        if not self._added_tokens:
+            return self._base_tokens, self._base_offsets
+        lengths = [len(tokens) for tokens in self._added_tokens]
+        offsets = np.concatenate((self._base_offsets, self._base_offsets[-1] + np.cumsum(lengths)))
+        added = np.array([t for tokens in self._added_tokens for t in tokens], dtype=np.int32)
+        return np.concatenate((self._base_tokens, added)), offsets
+
+    def compile(self):
+        """
+        Build the automaton of the phrases.
+
+        Called by :meth:`find` and :meth:`save` after phrases were added.
+        """
+        tokens, offsets = self._phrases()
+        tokens = tokens.tolist()
+        bounds = offsets.tolist()
+        # the trie of the phrases
+        children = [{}]
+        own = [[]]
+        for i in range(len(bounds) - 1):
+            state = 0
+            for token in tokens[bounds[i]:bounds[i + 1]]:
+                child = children[state].get(token)
+                if child is None:
+                    child = children[state][token] = len(children)
+                    children.append({})
+                    own.append([])
+                state = child
+            own[state].append(i)
+        # failure links (longest proper suffix in the trie) and report links
+        # (longest proper suffix with phrases ending there), breadth first
+        n = len(children)
+        fail = [0] * n
+        report = [0] * n
+        queue = deque(children[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, child in children[state].items():
+                if state:
+                    suffix = fail[state]
+                    while suffix and token not in children[suffix]:
+                        suffix = fail[suffix]
+                    fail[child] = children[suffix].get(token, 0)
+                    report[child] = fail[child] if own[fail[child]] else report[fail[child]]
+                queue.append(child)
+        n_tokens = len(self.vocabulary)
+        keys = [state * n_tokens + token for state in range(n) for token in children[state]]
+        targets = [child for state in range(n) for child in children[state].values()]
+        order = np.argsort(np.array(keys, dtype=np.int64), kind='stable')
+        self._arrays = {
+            'transitions': np.array(keys, dtype=np.int64)[order],
+            'targets': np.array(targets, dtype=np.int32)[order],
+            'fail': np.array(fail, dtype=np.int32),
+            'report': np.array(report, dtype=np.int32),
+            'output_offsets': np.concatenate(([0], np.cumsum([len(o) for o in own]))).astype(np.int64),
+            'output_phrases': np.array([i for o in own for i in o], dtype=np.int32),
+        }
+        self._phrase_offsets = offsets
+        self._reset(n_tokens)
+
+    def _reset(self, n_tokens):
+        self._n_tokens = n_tokens
+        # transitions and states visited so far, and ids of the text tokens
+        self._goto = {}
+        self._states = {}
+        self._memo = {}
+        self._compiled = True
+
+    def _state(self, state):
+        """Return the failure link of ``state`` and the ``(phrase, length)`` of the phrases ending there."""
+        info = self._states.get(state)
+        if info is None:
+            arrays = self._arrays
+            offsets = arrays['output_offsets']
+            phrase_offsets = self._phrase_offsets
+            outputs = []
+            s = state
+            while s:
+                for i in arrays['output_phrases'][offsets[s]:offsets[s + 1]].tolist():
+                    outputs.append((i, int(phrase_offsets[i + 1] - phrase_offsets[i])))
+                s = int(arrays['report'][s])
+            info = self._states[state] = (int(arrays['fail'][state]), outputs)
+        return info
+
+    def _next(self, key):
+        transitions = self._arrays['transitions']
+        i = int(np.searchsorted(transitions, key))
+        target = int(self._arrays['targets'][i]) if i < len(transitions) and transitions[i] == key else -1
+        self._goto[key] = target
+        return target
+
+    def _token_ids(self, tokens):
+        memo = self._memo
+        try:
+            return [memo[t] for t in tokens]
+        except KeyError:
+            pass
+        if len(memo) > self.max_memo:
+            memo.clear()
+        missing = list(set(t for t in tokens if t not in memo))
+        memo.update(zip(missing, self.vocabulary.ids(self._keys(missing), grow=False).tolist()))
+        return [memo[t] for t in tokens]
+
+    def find(self, text, overlapping=True):
+        """
+        Return the matches of the phrases in ``text``.
+
+        :param overlapping: return every match, ordered by end; otherwise
+                            the leftmost longest matches that do not overlap
+        :return: list of ``(start, end, label)``, character offsets in ``text``
+        """
+        if not self._compiled:
+            self.compile()
+        starts, ends = self._tokenizer.spans(text)
+        starts = starts.tolist()
+        ends = ends.tolist()
+        ids = self._token_ids([text[s:e] for s, e in zip(starts, ends)])
+        goto = self._goto
+        n_tokens = self._n_tokens
+        found = []
+        state = 0
+        for position, token in enumerate(ids):
+            if token < 0:
+                state = 0
+                continue
+            while True:
+                key = state * n_tokens + token
+                target = goto.get(key)
+                if target is None:
+                    target = self._next(key)
+                if target >= 0 or not state:
+                    break
+                state = self._state(state)[0]
+            state = max(target, 0)
+            if state:
+                for i, length in self._state(state)[1]:
+                    found.append((position - length + 1, position, i))
+        if not overlapping:
+            found.sort(key=lambda match: (match[0], -match[1]))
+            kept = []
+            end = -1
+            for match in found:
+                if match[0] > end:
+                    kept.append(match)
+                    end = match[1]
+            found = kept
+        return [(starts[first], ends[last], self.label(i)) for first, last, i in found]
+
+    def find_batch(self, texts, overlapping=True):
+        """Return the matches of every text, see :meth:`find`."""
+        return [self.find(text, overlapping) for text in texts]
+
+    def save(self, directory):
+        """
+        Write the gazetteer to ``directory`` (replaced if it exists).
+
+        The files are written to a temporary sibling directory and renamed
+        into place, so processes loading it never see a partial gazetteer.
+        """
+        if not self._compiled:
+            self.compile()
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.arabicnlp-gazetteer-', dir=parent)
+        try:
+            tokens, offsets = self._phrases()
+            labels = np.array([self.label(i) for i in range(len(self))], dtype=np.str_)
+            arrays = dict(self._arrays, phrase_tokens=tokens, phrase_offsets=offsets, labels=labels)
+            for name in _ARRAYS:
+                np.save(os.path.join(staging, name + '.npy'), arrays[name])
+            self.vocabulary.save(os.path.join(staging, 'vocabulary'))
+            with open(os.path.join(staging, MANIFEST), 'w') as f:
+                json.dump({'format': _FORMAT, 'stem': self.stem, 'phrases': len(self),
+                           'states': len(arrays['fail']), 'tokens': self._n_tokens}, f)
+            if os.path.isdir(directory):
+                old = tempfile.mkdtemp(prefix='.arabicnlp-gazetteer-old-', dir=parent)
+                os.rename(directory, os.path.join(old, 'gazetteer'))
+                os.rename(staging, directory)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a saved gazetteer.
+
+        :param mmap: map the files read-only instead of reading them, so
+                     that processes loading the same gazetteer share it
+        """
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != _FORMAT:
+            raise ValueError("Unsupported gazetteer format in '%s'." % directory)
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode) for name in _ARRAYS}
+        gazetteer = cls(stem=manifest['stem'])
+        gazetteer.vocabulary = Vocabulary.load(os.path.join(directory, 'vocabulary'), mmap=mmap)
+        gazetteer._base_tokens = arrays.pop('phrase_tokens')
+        gazetteer._base_offsets = gazetteer._phrase_offsets = arrays.pop('phrase_offsets')
+        gazetteer._base_labels = arrays.pop('labels')
+        gazetteer._arrays = arrays
+        gazetteer._reset(manifest['tokens'])
+        return gazetteer
+
+    def __repr__(self):
+        return '<Gazetteer %d phrases%s>' % (len(self), ', stemmed' if self.stem else '')
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Feature hashing of Arabic stems into sparse matrices.
+
+Documents are tokenized and stemmed like :func:`arabicnlp.stems`, stem
+n-grams are hashed with CRC32 (stable across processes, unlike Python's
+``hash``) into ``n_features`` columns and the counts are assembled into a
+``scipy.sparse`` CSR matrix in a single pass.
+
+:class:`HashingVectorizer` follows the scikit-learn transformer protocol
+(``fit``/``transform``/``get_params``/``set_params``), so it can be used
+in pipelines and grid searches without scikit-learn being a dependency
+of this package::
+
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import make_pipeline
+
+    model = make_pipeline(HashingVectorizer(ngram_range=(1, 2), n_jobs=4), SGDClassifier())
+    model.fit(texts, labels)
+
+Documents are consumed from any iterable, ``chunk_size`` at a time;
+with ``n_jobs`` the chunks are vectorized by worker processes.
+"""
+
+import multiprocessing
+import os
+import zlib
+from array import array
+from collections import deque
+from itertools import islice
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def _stems(text):
+    from ..core import stems
+    return stems(text)
+
+
+def _tokens(text):
+    from ..core import tokenizer
+    return tokenizer.tokenize(text)
+
+
+def _stem_batch(tokens):
+    from ..core import script_stemmer
+    return script_stemmer.stem_batch(tokens)
+
+
+def _chunks(docs, chunk_size):
+    iterator = iter(docs)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _int64(values):
+    # an array('q') as a NumPy array, without copying
+    return np.frombuffer(values, dtype=np.int64) if len(values) else np.zeros(0, dtype=np.int64)
+
+
+# the vectorizer of a worker process, see HashingVectorizer.transform_chunks
+_worker = None
+
+
+def _init_worker(vectorizer):
+    global _worker
+    _worker = vectorizer
+
+
+def _transform_worker(docs):
+    return _worker._transform(docs)
+
+
+def ngrams(tokens, ngram_range=(1, 1)):
+    """Return the ``ngram_range`` n-grams of ``tokens`` joined by spaces."""
+    low, high = ngram_range
+    if low == high == 1:
+        return tokens
+    result = []
+    for n in range(low, high + 1):
+        result.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return result
+
+
+def l2_normalize(X):
+    """Scale the rows of a CSR matrix to unit length, in place."""
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    X.data /= np.repeat(norms, np.diff(X.indptr)).astype(X.dtype)
+    return X
+
+
+class HashingVectorizer():
+    """
+    Hash stem n-grams of documents into a sparse ``(n_docs, n_features)`` matrix.
+
+    :param n_features: number of columns
+    :param ngram_range: ``(min_n, max_n)`` of the stem n-grams
+    :param alternate_sign: give each feature a hash-derived sign so that
+                           collisions cancel out on average
+    :param norm: ``'l2'`` to normalize rows, ``None`` for raw counts
+    :param sublinear_tf: replace counts ``tf`` by ``1 + log(tf)``
+    :param analyzer: callable mapping a document to its tokens, defaults
+                     to :func:`arabicnlp.stems`
+    :param n_jobs: number of worker processes, ``-1`` for one per CPU;
+                   ``None`` vectorizes in this process
+    :param chunk_size: number of documents vectorized at a time
+    """
+
+    # distinct features whose column is remembered between documents
+    max_memo = 2 ** 20
+
+    _PARAMS = ('n_features', 'ngram_range', 'alternate_sign', 'norm', 'sublinear_tf', 'analyzer', 'dtype',
+               'n_jobs', 'chunk_size')
+
+    def __init__(self, n_features=2 ** 20, ngram_range=(1, 1), alternate_sign=True,
+                 norm='l2', sublinear_tf=False, analyzer=None, dtype=np.float32, n_jobs=None, chunk_size=1000):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.alternate_sign = alternate_sign
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.analyzer = analyzer
+        self.dtype = dtype
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self._clear_memo()
+
+    def _clear_memo(self):
+        self._memo = {}
+        # token -> column of its stem, for stem unigrams
+        self._token_memo = {}
+
+    def get_params(self, deep=True):
+        """Return the constructor parameters, as scikit-learn estimators do."""
+        return {name: getattr(self, name) for name in self._PARAMS}
+
+    def set_params(self, **params):
+        for name, value in params.items():
+            if name not in self._PARAMS:
+                raise ValueError('Invalid parameter %r for %s.' % (name, type(self).__name__))
+            setattr(self, name, value)
+        # columns depend on n_features and alternate_sign
+        self._clear_memo()
+        return self
+
+    def __getstate__(self):
+        # the memos are rebuilt on use rather than sent to worker processes
+        state = dict(self.__dict__)
+        state['_memo'] = {}
+        state['_token_memo'] = {}
+        return state
+
+    def _column(self, feature):
+        """Return the signed ``column + 1`` of ``feature`` (never 0)."""
+        h = zlib.crc32(feature.encode('utf-8'))
+        column = (h & 0x7fffffff) % self.n_features + 1
+        return -column if self.alternate_sign and h & 0x80000000 else column
+
+    def features(self, doc):
+        """Return the signed ``column + 1`` of every feature of ``doc``."""
+        if self.analyzer is None and tuple(self.ngram_range) == (1, 1):
+            return self._unigram_features(_tokens(doc))
+        memo = self._memo
+        if len(memo) > self.max_memo:
+            memo.clear()
+        analyzer = self.analyzer or _stems
+        result = []
+        for feature in ngrams(analyzer(doc), self.ngram_range):
+            column = memo.get(feature)
+            if column is None:
+                column = memo[feature] = self._column(feature)
+            result.append(column)
+        return result
+
+    def _unigram_features(self, tokens):
+        # every token is stemmed and hashed once, then looked up directly
+        memo = self._token_memo
+        try:
+            return [memo[t] for t in tokens]
+        except KeyError:
+            pass
+        if len(memo) > self.max_memo:
+            memo.clear()
+        missing = list(set(t for t in tokens if t not in memo))
+        for token, stem in zip(missing, _stem_batch(missing)):
+            memo[token] = self._column(stem)
+        return [memo[t] for t in tokens]
+
+    def transform(self, docs):
+        """
+        Vectorize an iterable of documents.
+
+        :return: ``scipy.sparse.csr_matrix`` of shape ``(n_docs, n_features)``
+        """
+        if self.n_jobs is None or self.n_jobs == 1:
+            return self._transform(docs)
+        chunks = list(self.transform_chunks(docs))
+        if not chunks:
+            return self._transform([])
+        return sp.vstack(chunks, format='csr')
+
+    def _transform(self, docs):
+        columns = array('q')
+        lengths = array('q')
+        for doc in docs:
+            features = self.features(doc)
+            columns.extend(features)
+            lengths.append(len(features))
+        return self._matrix(_int64(columns), _int64(lengths))
+
+    def transform_chunks(self, docs, chunk_size=None):
+        """
+        Vectorize a stream of documents chunk by chunk.
+
+        With ``n_jobs``, at most two chunks per worker are in flight, so
+        memory stays bounded however long the stream is.
+
+        :return: iterator of CSR matrices of ``chunk_size`` rows, in order
+        """
+        chunks = _chunks(docs, chunk_size or self.chunk_size)
+        if self.n_jobs is None or self.n_jobs == 1:
+            for chunk in chunks:
+                yield self._transform(chunk)
+            return
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs < 0 else self.n_jobs
+        with multiprocessing.Pool(n_jobs, _init_worker, (self,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_transform_worker, (chunk,)))
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def _matrix(self, signed, lengths):
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        X = sp.csr_matrix((np.sign(signed).astype(self.dtype), (rows, np.abs(signed) - 1)),
+                          shape=(len(lengths), self.n_features))
+        X.sum_duplicates()
+        X.eliminate_zeros()
+        if self.sublinear_tf:
+            X.data = (np.sign(X.data) * (1 + np.log(np.abs(X.data)))).astype(self.dtype)
+        if self.norm == 'l2':
+            l2_normalize(X)
+        elif self.norm is not None:
+            raise ValueError("Unsupported norm '%s'." % self.norm)
+        return X
+
+    def fit(self, docs=None, y=None):
+        """Hashing needs no fitting; present for API symmetry."""
+        return self
+
+    def fit_transform(self, docs, y=None):
+        return self.transform(docs)
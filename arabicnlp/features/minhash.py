@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+MinHash signatures and an LSH index for near-duplicate detection.
+
+Documents are reduced to sets of stem shingles (consecutive stem
+n-grams), and every set to a fixed-size MinHash signature whose agreement
+rate with another signature estimates the Jaccard similarity of the two
+sets. Signatures are cut into bands; documents sharing any whole band are
+candidates, and only candidates are compared, so a query costs about the
+same whatever the size of the index::
+
+    index = MinHashLSH(threshold=0.8)
+    ids = index.insert_batch(articles)
+    index.query(new_article)          # [(id, estimated_jaccard), ...]
+    index.save('/data/dedup')
+    index = MinHashLSH.load('/data/dedup')
+
+Saved indexes are memory-mapped: the signatures and the sorted band keys
+stay on disk and documents inserted afterwards are kept in memory until
+the next :meth:`MinHashLSH.save`.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import zlib
+
+import numpy as np
+
+from .hashing import _stems
+
+_META = 'meta.json'
+
+# upper bound on the number of shingles hashed at once per permutation
+_CHUNK = 2 ** 14
+
+# signature value of documents without shingles
+_EMPTY = 0xffffffff
+
+_SHIFT = np.uint64(32)
+
+# odd multipliers combining the stem hashes of a shingle
+_COMBINE = np.random.RandomState(0).randint(1, 2 ** 62, size=16, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+_token_hashes = {}
+
+
+def _hash_tokens(tokens):
+    memo = _token_hashes
+    if len(memo) > 2 ** 20:
+        memo.clear()
+    for token in set(tokens).difference(memo):
+        memo[token] = zlib.crc32(token.encode('utf-8'))
+    return np.array([memo[t] for t in tokens], dtype=np.uint64)
+
+
+def shingles(doc, size=3, analyzer=None):
+    """
+    Return the distinct hashed stem shingles of ``doc`` as a uint64 array
+    of 32-bit values.
+
+    Every stem is hashed once and the hashes of ``size`` consecutive stems
+    are combined arithmetically. Documents shorter than ``size`` stems are
+    represented by their stems.
+    """
+    hashes = _hash_tokens((analyzer or _stems)(doc))
+    n = len(hashes) - size + 1
+    if n < 1:
+        return np.unique(hashes)
+    combined = np.zeros(n, dtype=np.uint64)
+    for i in range(size):
+        combined += hashes[i:i + n] * _COMBINE[i % len(_COMBINE)]
+    return np.unique(combined >> _SHIFT)
+
+
+def _bands_for(num_perm, threshold):
+    """Pick the ``(bands, rows)`` split whose S-curve midpoint is closest to ``threshold``."""
+    splits = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(splits, key=lambda s: abs((1.0 / s[0]) ** (1.0 / s[1]) - threshold))
+
+
+class MinHash():
+    """
+    Vectorized MinHash over ``num_perm`` multiply-shift hash functions
+    ``(a * x + b) >> 32`` computed in wrapping 64-bit arithmetic.
+
+    :param num_perm: signature length
+    :param seed: seed of the hash functions; signatures are only
+                 comparable between hashers with the same seed and length
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.seed = seed
+        self.a = (rng.randint(1, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) | np.uint64(1))[:, None]
+        self.b = rng.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)[:, None]
+
+    def signature(self, hashes):
+        """Return the uint32 signature of one array of shingle hashes."""
+        return self.signatures([hashes])[0]
+
+    def signatures(self, hash_sets):
+        """
+        Return the ``(n, num_perm)`` signatures of a list of shingle hash arrays.
+
+        Empty sets get a signature of ``0xffffffff`` everywhere.
+        """
+        result = np.full((len(hash_sets), self.num_perm), _EMPTY, dtype=np.uint32)
+        start = 0
+        while start < len(hash_sets):
+            # take documents until the chunk holds _CHUNK shingles
+            stop, size = start, 0
+            while stop < len(hash_sets) and (size == 0 or size + len(hash_sets[stop]) <= _CHUNK):
+                size += len(hash_sets[stop])
+                stop += 1
+            chunk = hash_sets[start:stop]
+            lengths = np.array([len(h) for h in chunk], dtype=np.int64)
+            full = np.flatnonzero(lengths)
+            if len(full):
+                values = self.a * np.concatenate([chunk[i] for i in full]).astype(np.uint64)
+                values += self.b
+                values >>= _SHIFT
+                offsets = np.concatenate(([0], np.cumsum(lengths[full])[:-1]))
+                result[start + full] = np.minimum.reduceat(values, offsets, axis=1).T
+            start = stop
+        return result
+
+
+class MinHashLSH():
+    """
+    Near-duplicate index over MinHash signatures of stem shingles.
+
+    :param threshold: estimated Jaccard similarity above which documents
+                      are near-duplicates
+    :param num_perm: signature length
+    :param shingle_size: number of consecutive stems in a shingle
+    :param bands: number of LSH bands, derived from ``threshold`` by default
+    :param seed: seed of the MinHash functions
+    :param analyzer: callable mapping a document to its tokens, defaults
+                     to :func:`arabicnlp.stems`
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle_size=3, bands=None, seed=1, analyzer=None):
+        if not 0 < threshold <= 1:
+            raise ValueError('threshold must be in (0, 1]')
+        if bands is None:
+            bands = _bands_for(num_perm, threshold)[0]
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.analyzer = analyzer
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.minhash = MinHash(num_perm, seed)
+        multipliers = np.random.RandomState(seed + 1).randint(1, 2 ** 62, size=num_perm, dtype=np.int64)
+        self._multipliers = (multipliers.astype(np.uint64) | np.uint64(1)).reshape(bands, self.rows)
+        # saved part of the index, possibly memory-mapped
+        self._base = np.zeros((0, num_perm), dtype=np.uint32)
+        self._base_keys = np.zeros((bands, 0), dtype=np.uint64)
+        self._base_ids = np.zeros((bands, 0), dtype=np.int64)
+        # documents inserted since
+        self._extra = np.zeros((64, num_perm), dtype=np.uint32)
+        self._n_extra = 0
+        self._tables = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self._base) + self._n_extra
+
+    def _band_keys(self, signatures):
+        """Hash every band of ``signatures`` to one uint64, shape ``(bands, n)``."""
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (bands * self._multipliers).sum(axis=2, dtype=np.uint64).T
+
+    def signatures(self, docs):
+        """Return the ``(len(docs), num_perm)`` signatures of ``docs``."""
+        return self.minhash.signatures([shingles(d, self.shingle_size, self.analyzer) for d in docs])
+
+    def insert(self, doc):
+        """Add a document and return its id."""
+        return self.insert_signatures(self.signatures([doc]))[0]
+
+    def insert_batch(self, docs):
+        """Add a list of documents and return their ids."""
+        return self.insert_signatures(self.signatures(docs))
+
+    def insert_signatures(self, signatures):
+        """Add precomputed signatures and return their ids."""
+        n = len(signatures)
+        if self._n_extra + n > len(self._extra):
+            grown = np.zeros((max(2 * len(self._extra), self._n_extra + n), self._extra.shape[1]), dtype=np.uint32)
+            grown[:self._n_extra] = self._extra[:self._n_extra]
+            self._extra = grown
+        self._extra[self._n_extra:self._n_extra + n] = signatures
+        first = len(self)
+        self._n_extra += n
+        ids = list(range(first, first + n))
+        for table, keys in zip(self._tables, self._band_keys(signatures).tolist()):
+            for key, i in zip(keys, ids):
+                table.setdefault(key, []).append(i)
+        return ids
+
+    def signature_of(self, ids):
+        """Return the stored signatures of ``ids``."""
+        ids = np.asarray(ids, dtype=np.int64)
+        n_base = len(self._base)
+        result = np.empty((len(ids), self._extra.shape[1]), dtype=np.uint32)
+        old = ids < n_base
+        result[old] = self._base[ids[old]]
+        result[~old] = self._extra[ids[~old] - n_base]
+        return result
+
+    def candidates(self, signature):
+        """Return the ids sharing at least one band with ``signature``."""
+        found = set()
+        keys = self._band_keys(signature[None, :])[:, 0]
+        for band, key in enumerate(keys.tolist()):
+            if self._base_keys.shape[1]:
+                row = self._base_keys[band]
+                lo = np.searchsorted(row, key, side='left')
+                hi = np.searchsorted(row, key, side='right')
+                found.update(self._base_ids[band, lo:hi].tolist())
+            found.update(self._tables[band].get(key, ()))
+        return found
+
+    def query_signature(self, signature, threshold=None):
+        """
+        Return the near-duplicates of a signature.
+
+        :return: list of ``(id, estimated_jaccard)``, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        ids = np.array(sorted(self.candidates(signature)), dtype=np.int64)
+        if not len(ids):
+            return []
+        scores = (self.signature_of(ids) == signature).mean(axis=1)
+        keep = scores >= threshold
+        order = np.argsort(-scores[keep], kind='mergesort')
+        return list(zip(ids[keep][order].tolist(), scores[keep][order].tolist()))
+
+    def query(self, doc, threshold=None):
+        """
+        Return the indexed near-duplicates of ``doc``.
+
+        :param threshold: overrides the index threshold; values below it
+                          find fewer candidates than they should
+        :return: list of ``(id, estimated_jaccard)``, most similar first
+        """
+        return self.query_signature(self.signatures([doc])[0], threshold)
+
+    def save(self, directory):
+        """
+        Write the index to ``directory`` (replaced if it exists).
+
+        The files are written to a temporary sibling directory and renamed
+        into place, so processes loading the index never see signatures
+        and band tables of different versions; a process that has the
+        previous version memory-mapped keeps reading it.
+        """
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        signatures = np.concatenate([self._base, self._extra[:self._n_extra]])
+        keys = self._band_keys(signatures)
+        order = np.argsort(keys, axis=1, kind='mergesort')
+        arrays = {
+            'signatures.npy': signatures,
+            'band_keys.npy': np.take_along_axis(keys, order, axis=1),
+            'band_ids.npy': order.astype(np.int64),
+        }
+        meta = {
+            'threshold': self.threshold,
+            'num_perm': self.minhash.num_perm,
+            'shingle_size': self.shingle_size,
+            'bands': self.bands,
+            'seed': self.minhash.seed,
+        }
+        staging = tempfile.mkdtemp(prefix='.arabicnlp-minhash-', dir=parent)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, name), array)
+            with open(os.path.join(staging, _META), 'w') as f:
+                json.dump(meta, f, indent=2)
+            if os.path.isdir(directory):
+                old = tempfile.mkdtemp(prefix='.arabicnlp-minhash-old-', dir=parent)
+                os.rename(directory, os.path.join(old, 'index'))
+                os.rename(staging, directory)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True, analyzer=None):
+        """
+        Open an index written by :meth:`save`.
+
+        :param mmap: memory-map the arrays instead of reading them
+        """
+        with open(os.path.join(directory, _META)) as f:
+            meta = json.load(f)
+        index = cls(analyzer=analyzer, **meta)
+        mode = 'r' if mmap else None
+        index._base = np.load(os.path.join(directory, 'signatures.npy'), mmap_mode=mode)
+        index._base_keys = np.load(os.path.join(directory, 'band_keys.npy'), mmap_mode=mode)
+        index._base_ids = np.load(os.path.join(directory, 'band_ids.npy'), mmap_mode=mode)
+        return index
+
+    def __repr__(self):
+        return '<MinHashLSH %d documents, %d bands x %d rows>' % (len(self), self.bands, self.rows)
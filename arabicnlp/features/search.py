@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Inverted index with BM25 ranking over stemmed tokens.
+
+Documents are analyzed like :func:`arabicnlp.stems` (tokens stemmed by
+:class:`ArabicStemmer`, punctuation dropped). New documents go to an
+in-memory buffer; :meth:`InvertedIndex.save` flushes the buffer into an
+immutable *segment* on disk::
+
+    <directory>/meta.json
+    <directory>/deleted.npy
+    <directory>/segment_000000/terms.npy      sorted terms
+    <directory>/segment_000000/offsets.npy    byte offset of every postings list
+    <directory>/segment_000000/postings.npy   varint-coded postings (uint8)
+    <directory>/segment_000000/lengths.npy    length of every document
+
+A postings list holds ``(doc id delta, term frequency)`` pairs encoded as
+variable-length integers, so frequent terms cost about two bytes per
+document. Segments are memory-mapped when the index is loaded, and
+decoding, scoring and top-k selection are vectorized with NumPy::
+
+    index = InvertedIndex()
+    index.add_batch(articles)
+    index.search('الانتخابات البرلمانية', k=10)   # [(doc_id, score), ...]
+    index.save('/data/search')
+
+Deleted documents are filtered out of results right away and purged
+from the segments by :meth:`InvertedIndex.compact`.
+
+A save writes the whole directory next to the old one and renames it
+into place; segments already on disk are hard-linked into it rather than
+rewritten, so a save costs about the size of the new documents.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+from .hashing import _stems
+
+_META = 'meta.json'
+_FORMAT = 1
+_SEGMENT_ARRAYS = ('terms', 'offsets', 'postings', 'lengths')
+
+
+def encode_varints(values):
+    """Encode non-negative integers as LEB128 variable-length bytes (uint8 array)."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= np.uint64(1 << shift)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    remaining = values.copy()
+    for i in range(int(sizes.max()) if len(sizes) else 0):
+        active = np.flatnonzero(sizes > i)
+        more = (sizes[active] > i + 1).astype(np.uint8) << 7
+        out[starts[active] + i] = (remaining[active] & np.uint64(0x7f)).astype(np.uint8) | more
+        remaining[active] >>= np.uint64(7)
+    return out
+
+
+def decode_varints(data):
+    """Decode a uint8 array of LEB128 variable-length integers."""
+    data = np.asarray(data, dtype=np.uint8)
+    if not (data & 0x80).any():
+        return data.astype(np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (7 * (np.arange(len(data)) - starts[group])).astype(np.uint64)
+    return np.add.reduceat((data & 0x7f).astype(np.uint64) << shifts, starts)
+
+
+def analyze(text):
+    """Return the index terms of ``text``: its stems, without punctuation."""
+    return [stem for stem in _stems(text) if any(ch.isalnum() for ch in stem)]
+
+
+class _Segment():
+    """Immutable postings of the documents ``base`` to ``base + len(lengths) - 1``."""
+
+    def __init__(self, base, terms, offsets, postings, lengths, path=None):
+        self.base = base
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.lengths = lengths
+        self.path = path
+
+    @classmethod
+    def build(cls, base, lengths, postings):
+        """
+        Build a segment from a dict of term -> ``(doc ids, frequencies)``
+        with doc ids increasing within each term.
+        """
+        terms = sorted(postings)
+        counts = np.array([len(postings[t][0]) for t in terms], dtype=np.int64)
+        docs = np.concatenate([postings[t][0] for t in terms] or [np.zeros(0, np.int64)]).astype(np.int64)
+        tfs = np.concatenate([postings[t][1] for t in terms] or [np.zeros(0, np.int64)]).astype(np.int64)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        deltas = docs.copy()
+        deltas[1:] -= docs[:-1]
+        # the first posting of every term is relative to the segment base
+        firsts = starts[counts > 0]
+        deltas[firsts] = docs[firsts] - base
+        pairs = np.empty(2 * len(docs), dtype=np.int64)
+        pairs[0::2] = deltas
+        pairs[1::2] = tfs
+        encoded = encode_varints(pairs)
+        # byte offset of every encoded value, then of the first pair of every term
+        value_starts = np.concatenate(([0], np.flatnonzero(encoded < 0x80) + 1))
+        offsets = value_starts[np.concatenate((2 * starts, [2 * len(docs)]))]
+        return cls(base, np.array(terms, dtype=np.str_), offsets.astype(np.int64), encoded,
+                   np.asarray(lengths, dtype=np.int32))
+
+    def lookup(self, term):
+        """Return the ``(doc ids, frequencies)`` of ``term`` in this segment."""
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        pairs = decode_varints(self.postings[self.offsets[i]:self.offsets[i + 1]]).astype(np.int64)
+        return np.cumsum(pairs[0::2]) + self.base, pairs[1::2]
+
+    def items(self):
+        """Yield every ``(term, doc ids, frequencies)`` of the segment."""
+        for term in self.terms.tolist():
+            docs, tfs = self.lookup(term)
+            yield term, docs, tfs
+
+    def save(self, directory):
+        """Write the segment to ``directory``, linking the files of a saved segment."""
+        os.makedirs(directory)
+        for name in _SEGMENT_ARRAYS:
+            filename = os.path.join(directory, name + '.npy')
+            if self.path is not None:
+                # segments are immutable, so their files can be shared
+                try:
+                    os.link(os.path.join(self.path, name + '.npy'), filename)
+                    continue
+                except OSError:
+                    pass
+            np.save(filename, getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, base, mmap=True):
+        mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode) for name in _SEGMENT_ARRAYS]
+        return cls(base, *arrays, path=directory)
+
+
+class InvertedIndex():
+    """
+    Incremental inverted index with BM25 ranking.
+
+    :param analyzer: callable mapping a document to its terms, defaults
+                     to :func:`analyze`
+    :param k1: BM25 term frequency saturation
+    :param b: BM25 length normalization
+    """
+
+    def __init__(self, analyzer=None, k1=1.2, b=0.75):
+        self.analyzer = analyzer or analyze
+        self.k1 = k1
+        self.b = b
+        self.segments = []
+        self.deleted = set()
+        self._next_id = 0
+        self._total_length = 0
+        self._buffer_base = 0
+        self._buffer = {}
+        self._buffer_lengths = array('i')
+
+    def __len__(self):
+        return self._next_id - len(self.deleted)
+
+    def add(self, doc):
+        """Index a document and return its id."""
+        return self.add_batch([doc])[0]
+
+    def add_batch(self, docs):
+        """Index a list of documents and return their ids."""
+        ids = []
+        buffer = self._buffer
+        for doc in docs:
+            doc_id = self._next_id
+            self._next_id += 1
+            terms = self.analyzer(doc)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                postings = buffer.get(term)
+                if postings is None:
+                    postings = buffer[term] = array('i')
+                postings.append(doc_id)
+                postings.append(tf)
+            self._buffer_lengths.append(len(terms))
+            self._total_length += len(terms)
+            ids.append(doc_id)
+        return ids
+
+    def delete(self, doc_id):
+        """Remove a document from the results."""
+        if not 0 <= doc_id < self._next_id:
+            raise KeyError(doc_id)
+        self.deleted.add(doc_id)
+
+    def flush(self):
+        """Turn the in-memory buffer into an (in-memory) segment."""
+        if not len(self._buffer_lengths):
+            return
+        postings = {}
+        for term, pairs in self._buffer.items():
+            pairs = np.frombuffer(pairs, dtype=np.int32)
+            postings[term] = (pairs[0::2], pairs[1::2])
+        self.segments.append(_Segment.build(self._buffer_base, self._buffer_lengths, postings))
+        self._buffer = {}
+        self._buffer_lengths = array('i')
+        self._buffer_base = self._next_id
+
+    def postings(self, term):
+        """Return the ``(doc ids, frequencies)`` of ``term`` over the whole index."""
+        docs = []
+        tfs = []
+        for segment in self.segments:
+            d, f = segment.lookup(term)
+            docs.append(d)
+            tfs.append(f)
+        pairs = self._buffer.get(term)
+        if pairs is not None:
+            pairs = np.frombuffer(pairs, dtype=np.int32).astype(np.int64)
+            docs.append(pairs[0::2])
+            tfs.append(pairs[1::2])
+        if not docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def _lengths(self, docs):
+        result = np.empty(len(docs), dtype=np.float64)
+        for segment in self.segments:
+            inside = (docs >= segment.base) & (docs < segment.base + len(segment.lengths))
+            result[inside] = segment.lengths[docs[inside] - segment.base]
+        buffered = docs >= self._buffer_base
+        result[buffered] = np.frombuffer(self._buffer_lengths, dtype=np.int32)[docs[buffered] - self._buffer_base]
+        return result
+
+    def search(self, query, k=10):
+        """
+        Return the ``k`` best documents for ``query`` by BM25.
+
+        Document frequencies and the average length count deleted
+        documents until :meth:`compact` purges them.
+
+        :return: list of ``(doc_id, score)``, best first
+        """
+        n = self._next_id
+        if not n or k <= 0:
+            return []
+        avgdl = self._total_length / float(n) or 1.0
+        all_docs = []
+        all_scores = []
+        for term in set(self.analyzer(query)):
+            docs, tfs = self.postings(term)
+            if not len(docs):
+                continue
+            idf = np.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._lengths(docs) / avgdl)
+            all_docs.append(docs)
+            all_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not all_docs:
+            return []
+        if len(all_docs) == 1:
+            docs, scores = all_docs[0], all_scores[0]
+        elif sum(len(d) for d in all_docs) * 16 > n:
+            # long postings lists: accumulate into one slot per document
+            scores = np.bincount(np.concatenate(all_docs), weights=np.concatenate(all_scores), minlength=n)
+            docs = np.flatnonzero(scores)
+            scores = scores[docs]
+        else:
+            docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+            scores = np.bincount(inverse.reshape(-1), weights=np.concatenate(all_scores))
+        if self.deleted:
+            live = ~np.isin(docs, np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))
+            docs, scores = docs[live], scores[live]
+        if len(docs) > k:
+            # keep ties with the k-th score so that they are broken by doc id
+            keep = scores >= np.partition(scores, len(scores) - k)[len(scores) - k]
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((docs, -scores))[:k]
+        return list(zip(docs[order].tolist(), scores[order].tolist()))
+
+    def compact(self):
+        """
+        Merge every segment and the buffer into one segment without the
+        deleted documents, which renumbers the remaining ones.
+
+        :return: array mapping old document ids to new ones (``-1`` for
+                 deleted documents)
+        """
+        self.flush()
+        deleted = np.array(sorted(self.deleted), dtype=np.int64)
+        merged = {}
+        for segment in self.segments:
+            for term, docs, tfs in segment.items():
+                merged.setdefault(term, []).append((docs, tfs))
+        # renumber the live documents 0..n-1
+        lengths = self._lengths(np.arange(self._next_id))
+        live = np.ones(self._next_id, dtype=bool)
+        live[deleted] = False
+        new_ids = np.cumsum(live) - 1
+        postings = {}
+        for term, parts in merged.items():
+            docs = np.concatenate([d for d, _ in parts])
+            tfs = np.concatenate([f for _, f in parts])
+            keep = live[docs]
+            if keep.any():
+                postings[term] = (new_ids[docs[keep]], tfs[keep])
+        self.segments = [_Segment.build(0, lengths[live], postings)]
+        self._next_id = int(live.sum())
+        self._total_length = int(lengths[live].sum())
+        self._buffer_base = self._next_id
+        self.deleted = set()
+        return np.where(live, new_ids, -1)
+
+    def save(self, directory):
+        """
+        Write the index to ``directory`` (replaced if it exists).
+
+        The buffer becomes a new segment. The segments, the deleted
+        documents and the metadata are written to a temporary sibling
+        directory that is renamed into place, so processes loading the
+        index never see parts of different versions; segments merged away
+        by :meth:`compact` are dropped with the old directory.
+        """
+        self.flush()
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        names = ['segment_%06d' % i for i in range(len(self.segments))]
+        staging = tempfile.mkdtemp(prefix='.arabicnlp-index-', dir=parent)
+        try:
+            for name, segment in zip(names, self.segments):
+                segment.save(os.path.join(staging, name))
+            np.save(os.path.join(staging, 'deleted.npy'), np.array(sorted(self.deleted), dtype=np.int64))
+            meta = {
+                'format': _FORMAT,
+                'k1': self.k1,
+                'b': self.b,
+                'segments': [[name, segment.base] for name, segment in zip(names, self.segments)],
+                'documents': self._next_id,
+                'total_length': self._total_length,
+            }
+            with open(os.path.join(staging, _META), 'w') as f:
+                json.dump(meta, f, indent=2)
+            if os.path.isdir(directory):
+                old = tempfile.mkdtemp(prefix='.arabicnlp-index-old-', dir=parent)
+                os.rename(directory, os.path.join(old, 'index'))
+                os.rename(staging, directory)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        for name, segment in zip(names, self.segments):
+            segment.path = os.path.join(directory, name)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True, analyzer=None):
+        """
+        Open an index written by :meth:`save`.
+
+        :param mmap: memory-map the segments instead of reading them
+        """
+        with open(os.path.join(directory, _META)) as f:
+            meta = json.load(f)
+        if meta.get('format') != _FORMAT:
+            raise ValueError("Unsupported index format in '%s'." % directory)
+        index = cls(analyzer=analyzer, k1=meta['k1'], b=meta['b'])
+        index.segments = [_Segment.load(os.path.join(directory, name), base, mmap)
+                          for name, base in meta['segments']]
+        index.deleted = set(np.load(os.path.join(directory, 'deleted.npy')).tolist())
+        index._next_id = index._buffer_base = meta['documents']
+        index._total_length = meta['total_length']
+        return index
+
+    def __repr__(self):
+        return '<InvertedIndex %d documents, %d segments>' % (len(self), len(self.segments))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Stem-based TF-IDF vectors and batched cosine similarity.
+
+Documents become L2-normalized sparse TF-IDF vectors over hashed stems,
+so the cosine similarity of two documents is the dot product of their
+rows. Similarities for a whole corpus are computed block by block with
+sparse matrix products, keeping only the top-k neighbours of every
+document, so memory stays ``O(block_size * n_docs)`` instead of ``n_docs²``::
+
+    vectorizer = TfidfVectorizer().fit(corpus)
+    X = vectorizer.transform(corpus)
+    neighbours, scores = top_k(X, k=5, threshold=0.8)
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+from .hashing import HashingVectorizer, l2_normalize
+
+
+class TfidfVectorizer():
+    """
+    TF-IDF over hashed stem n-grams.
+
+    :param n_features: number of hashed columns
+    :param ngram_range: ``(min_n, max_n)`` of the stem n-grams
+    :param sublinear_tf: use ``1 + log(tf)`` term frequencies
+    :param analyzer: callable mapping a document to its tokens, defaults
+                     to :func:`arabicnlp.stems`
+    """
+
+    def __init__(self, n_features=2 ** 20, ngram_range=(1, 1), sublinear_tf=True, analyzer=None):
+        self.hasher = HashingVectorizer(n_features=n_features, ngram_range=ngram_range,
+                                        alternate_sign=False, norm=None,
+                                        sublinear_tf=sublinear_tf, analyzer=analyzer)
+        self.idf_ = None
+
+    def _fit_counts(self, X):
+        df = np.bincount(X.indices, minlength=X.shape[1])
+        n = X.shape[0]
+        self.idf_ = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+
+    def _weight(self, X):
+        if self.idf_ is None:
+            raise ValueError('The vectorizer is not fitted yet.')
+        X.data *= self.idf_[X.indices]
+        return l2_normalize(X)
+
+    def fit(self, docs, y=None):
+        """Learn the document frequencies of ``docs``."""
+        self._fit_counts(self.hasher.transform(docs))
+        return self
+
+    def transform(self, docs):
+        """Return the L2-normalized TF-IDF CSR matrix of ``docs``."""
+        return self._weight(self.hasher.transform(docs))
+
+    def fit_transform(self, docs, y=None):
+        X = self.hasher.transform(docs)
+        self._fit_counts(X)
+        return self._weight(X)
+
+    def save(self, filename):
+        """Save the fitted IDF weights (``.npz``)."""
+        np.savez(filename, idf=self.idf_,
+                 ngram_range=np.array(self.hasher.ngram_range),
+                 sublinear_tf=np.array(self.hasher.sublinear_tf))
+
+    @classmethod
+    def load(cls, filename, analyzer=None):
+        data = np.load(filename)
+        vectorizer = cls(n_features=len(data['idf']), ngram_range=tuple(data['ngram_range'].tolist()),
+                         sublinear_tf=bool(data['sublinear_tf']), analyzer=analyzer)
+        vectorizer.idf_ = data['idf']
+        return vectorizer
+
+
+def cosine(X, Y=None):
+    """
+    Cosine similarities between the rows of L2-normalized matrices.
+
+    :return: sparse ``(len(X), len(Y))`` matrix
+    """
+    return X.dot((X if Y is None else Y).T).tocsr()
+
+
+def top_k(X, Y=None, k=10, threshold=0.0, block_size=1024):
+    """
+    Return the ``k`` most similar rows of ``Y`` for every row of ``X``.
+
+    With ``Y=None`` the rows of ``X`` are compared with each other and a
+    row is never its own neighbour. The products are computed
+    ``block_size`` rows at a time, so the full similarity matrix is never
+    materialized.
+
+    :param threshold: ignore similarities below this value
+    :return: ``(indices, scores)`` arrays of shape ``(len(X), k)``, best
+             first, padded with ``-1`` / ``0``
+    """
+    exclude_self = Y is None
+    YT = (X if Y is None else Y).T.tocsr()
+    n = X.shape[0]
+    indices = np.full((n, k), -1, dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    for start in range(0, n, block_size):
+        block = X[start:start + block_size].dot(YT).tocsr()
+        for row in range(block.shape[0]):
+            lo, hi = block.indptr[row], block.indptr[row + 1]
+            cols = block.indices[lo:hi]
+            vals = block.data[lo:hi]
+            keep = vals >= threshold
+            if exclude_self:
+                keep &= cols != start + row
+            cols, vals = cols[keep], vals[keep]
+            if len(vals) > k:
+                best = np.argpartition(-vals, k - 1)[:k]
+                cols, vals = cols[best], vals[best]
+            order = np.argsort(-vals, kind='mergesort')
+            indices[start + row, :len(order)] = cols[order]
+            scores[start + row, :len(order)] = vals[order]
+    return indices, scores
+
+
+def similarity_matrix(docs, k=10, threshold=0.0, vectorizer=None, block_size=1024):
+    """
+    Sparse top-k similarity graph of a corpus.
+
+    :param docs: list of documents
+    :param vectorizer: fitted vectorizer, defaults to a TF-IDF fitted on ``docs``
+    :return: ``(n_docs, n_docs)`` CSR matrix holding, for every document,
+             its ``k`` most similar other documents
+    """
+    if vectorizer is None:
+        X = TfidfVectorizer().fit_transform(docs)
+    else:
+        X = vectorizer.transform(docs)
+    indices, scores = top_k(X, k=k, threshold=threshold, block_size=block_size)
+    rows = np.repeat(np.arange(len(indices)), k)
+    found = indices.ravel() >= 0
+    return sp.csr_matrix((scores.ravel()[found], (rows[found], indices.ravel()[found])),
+                         shape=(len(indices), len(indices)))
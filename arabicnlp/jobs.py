@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable, sharded batch jobs over large corpora.
+
+Input files hold one document per line. A manifest cuts them into shards
+of ``documents_per_shard`` lines (byte ranges, found in one pass) and
+lists the processing steps; every shard is processed on a pool of worker
+processes and its output written as one JSON line per document::
+
+    python -m arabicnlp job-create /data/job corpus-*.txt --steps tokens,stems,tags
+    python -m arabicnlp job-run /data/job --workers 8
+    python -m arabicnlp job-status /data/job
+
+The job directory is the checkpoint. A shard's output is written to a
+temporary file and renamed to ``<shard>.jsonl`` when complete, then a
+``<shard>.done`` marker records its statistics; an interrupted job is
+resumed by running it again, and only the unfinished shards are redone.
+
+Several machines can run the same job directory on a shared filesystem.
+A worker claims a shard by creating ``<shard>.lock`` exclusively and
+touches it while it works; a claim that has not been touched for
+``lease`` seconds belongs to a dead worker and is taken over. If a slow
+worker loses its claim the shard is processed twice, with the same output.
+
+With a :class:`~arabicnlp.store.ResultStore` (``--store``), documents
+already processed by the same pipeline, in this job or an earlier one,
+are not processed again. SQLite files should not be shared over a
+network filesystem: every machine uses a store on its local disk.
+"""
+
+import json
+import multiprocessing
+import os
+import socket
+import time
+from itertools import islice
+
+from .pipeline import Pipeline, resolve_step
+from .store import ResultStore
+
+MANIFEST = 'manifest.json'
+_FORMAT = 1
+# documents processed (and looked up in the result store) at a time
+_CHUNK = 1000
+
+
+def _write_json(filename, value):
+    # written next to the destination and renamed, never seen half-written
+    tmp = '%s.tmp-%s-%d' % (filename, socket.gethostname(), os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp, filename)
+
+
+def _read_json(filename):
+    with open(filename, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _cut(filename, documents_per_shard):
+    """Yield the ``(start, end, documents)`` byte ranges of the shards of a file."""
+    start = position = 0
+    count = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            position += len(line)
+            count += 1
+            if count == documents_per_shard:
+                yield start, position, count
+                start, count = position, 0
+    if count:
+        yield start, position, count
+
+
+def create_manifest(directory, inputs, steps=('tokens', 'stems', 'tags'), documents_per_shard=10000):
+    """
+    Create a job: cut the input files into shards and write the manifest.
+
+    :param directory: job directory, created if needed; holds the manifest,
+                      the outputs and the checkpoints
+    :param inputs: text files with one document per line
+    :param steps: names of the processing steps, see :data:`arabicnlp.pipeline.STEPS`
+    :param documents_per_shard: number of lines of a shard
+    :return: the manifest
+    """
+    for step in steps:
+        resolve_step(step)
+    os.makedirs(directory, exist_ok=True)
+    shards = []
+    for filename in inputs:
+        for start, end, count in _cut(filename, documents_per_shard):
+            shards.append({'id': '%05d' % len(shards), 'input': os.path.abspath(filename),
+                           'start': start, 'end': end, 'documents': count})
+    manifest = {'format': _FORMAT, 'steps': list(steps), 'shards': shards}
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    return manifest
+
+
+def load_manifest(directory):
+    manifest = _read_json(os.path.join(directory, MANIFEST))
+    if manifest.get('format') != _FORMAT:
+        raise ValueError("Unsupported job manifest format in '%s'." % directory)
+    return manifest
+
+
+def _path(directory, shard_id, extension):
+    return os.path.join(directory, '%s.%s' % (shard_id, extension))
+
+
+def _owner():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def _claim(directory, shard_id, lease):
+    """Claim a shard for this process; return the lock file, or ``None`` if it is done or taken."""
+    lock = _path(directory, shard_id, 'lock')
+    for _ in range(2):
+        if os.path.exists(_path(directory, shard_id, 'done')):
+            return None
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.stat(lock).st_mtime
+            except FileNotFoundError:
+                continue
+            if age < lease:
+                return None
+            # the claim of a dead worker: whoever moves it away first retries
+            stale = '%s.stale-%s' % (lock, _owner().replace(':', '-'))
+            try:
+                os.rename(lock, stale)
+            except FileNotFoundError:
+                return None
+            os.remove(stale)
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(_owner())
+        if os.path.exists(_path(directory, shard_id, 'done')):
+            _release(lock)
+            return None
+        return lock
+    return None
+
+
+def _release(lock):
+    try:
+        with open(lock) as f:
+            mine = f.read() == _owner()
+        if mine:
+            os.remove(lock)
+    except FileNotFoundError:
+        pass
+
+
+def _lines(f, start, end):
+    f.seek(start)
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            return
+        position += len(line)
+        yield line.decode('utf-8').rstrip('\r\n')
+
+
+_stores = {}
+
+
+def _open_store(path, max_bytes):
+    # one store (and connection) per worker process
+    if path not in _stores:
+        _stores[path] = ResultStore(path, max_bytes)
+    return _stores[path]
+
+
+def _process(task):
+    """Process one shard in a worker; return its statistics."""
+    directory, shard, steps, lease, store = task
+    lock = _claim(directory, shard['id'], lease)
+    if lock is None:
+        return {'id': shard['id'], 'status': 'skipped', 'documents': 0, 'seconds': 0.0}
+    output = _path(directory, shard['id'], 'jsonl')
+    tmp = '%s.tmp-%s' % (output, _owner().replace(':', '-'))
+    try:
+        pipeline = Pipeline(steps)
+        results = _open_store(*store) if store is not None else None
+        start = time.perf_counter()
+        heartbeat = time.time()
+        with open(shard['input'], 'rb') as f, open(tmp, 'w', encoding='utf-8') as out:
+            lines = _lines(f, shard['start'], shard['end'])
+            while True:
+                texts = list(islice(lines, _CHUNK))
+                if not texts:
+                    break
+                for result in pipeline.process(texts, results):
+                    out.write(json.dumps(result, ensure_ascii=False))
+                    out.write('\n')
+                if time.time() - heartbeat > lease / 4:
+                    os.utime(lock)
+                    heartbeat = time.time()
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, output)
+        seconds = time.perf_counter() - start
+        result = {'id': shard['id'], 'status': 'done', 'documents': shard['documents'], 'seconds': seconds,
+                  'host': _owner(), 'finished': time.time()}
+        _write_json(_path(directory, shard['id'], 'done'), result)
+        return result
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        _release(lock)
+
+
+def status(directory):
+    """
+    Return the progress of a job.
+
+    :return: dict with the number of ``shards``, of ``done``, ``claimed``
+             and ``pending`` shards, and the number of ``documents`` and
+             ``documents_done``
+    """
+    manifest = load_manifest(directory)
+    result = {'shards': len(manifest['shards']), 'done': 0, 'claimed': 0, 'pending': 0,
+              'documents': 0, 'documents_done': 0}
+    for shard in manifest['shards']:
+        result['documents'] += shard['documents']
+        if os.path.exists(_path(directory, shard['id'], 'done')):
+            result['done'] += 1
+            result['documents_done'] += shard['documents']
+        elif os.path.exists(_path(directory, shard['id'], 'lock')):
+            result['claimed'] += 1
+        else:
+            result['pending'] += 1
+    return result
+
+
+def run(directory, workers=None, lease=600, report=None, initializer=None, store=None, store_bytes=2 ** 30):
+    """
+    Process the unfinished shards of a job.
+
+    Shards claimed by live workers of other machines are skipped; they
+    are finished there, or taken over by a later run once their lease
+    expires.
+
+    :param workers: number of worker processes, defaults to the number of
+                    CPUs; ``0`` processes the shards in this process
+    :param lease: seconds after which the claim of a silent worker expires
+    :param report: callable receiving the statistics of every shard, with
+                   ``documents_per_second``, the job progress
+                   (``shards_done``, ``shards``) and the ``eta`` in seconds
+    :param initializer: callable run once in every worker process, e.g.
+                        to attach a shared tagger store
+    :param store: path of a :class:`~arabicnlp.store.ResultStore` to look
+                  the documents up in, ``None`` processes every document
+    :param store_bytes: size budget of the result store
+    :return: the job :func:`status`
+    """
+    manifest = load_manifest(directory)
+    shards = manifest['shards']
+    pending = [s for s in shards if not os.path.exists(_path(directory, s['id'], 'done'))]
+    store = (store, store_bytes) if store is not None else None
+    tasks = [(directory, shard, manifest['steps'], lease, store) for shard in pending]
+    shards_done = len(shards) - len(pending)
+    remaining = sum(s['documents'] for s in pending)
+    processed = 0
+    start = time.perf_counter()
+
+    def progress(result):
+        nonlocal shards_done, remaining, processed
+        if result['status'] == 'done':
+            shards_done += 1
+            remaining -= result['documents']
+            processed += result['documents']
+        rate = processed / (time.perf_counter() - start)
+        result.update(documents_per_second=result['documents'] / result['seconds'] if result['seconds'] else 0.0,
+                      shards_done=shards_done, shards=len(shards), eta=remaining / rate if rate else None)
+        if report is not None:
+            report(result)
+
+    if workers == 0:
+        if initializer is not None:
+            initializer()
+        for task in tasks:
+            progress(_process(task))
+    else:
+        with multiprocessing.Pool(workers, initializer) as pool:
+            for result in pool.imap_unordered(_process, tasks):
+                progress(result)
+    return status(directory)
@@ -1 +1,7 @@
-from .pos_tagger import tags
\ No newline at end of file
+from .pos_tagger import tags, tag_document, tag_sentences, tag_probabilities, tag_names, clitic_report
+from .conllu import ConlluCorpus, read_conllu, write_conllu
+from .perceptron import PerceptronTagger
+from .pool import ReplicaPool
+from .probabilities import TagProbabilities
+from .registry import ModelRegistry, default_registry
+from .sentiment import SentimentModel
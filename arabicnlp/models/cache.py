@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded result cache in front of the POS tagger.
+
+Entries are keyed by a hash of the model version and the tokenized,
+lower-cased sentence (exactly what the tagger sees), and hold the tag id
+of every token as compact bytes. Repeated sentences therefore skip
+inference entirely::
+
+    from arabicnlp.models import cache
+
+    cache.enable(max_bytes=64 * 2 ** 20, ttl=24 * 3600, path='/var/cache/arabicnlp/tags.db')
+    ...
+    cache.current().stats()
+
+Both tiers evict their least recently used entries: the in-memory tier
+once ``max_bytes`` is reached, the optional on-disk tier (SQLite) once
+``disk_bytes`` is. The disk tier survives restarts and is shared by every
+process that opens the same file.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# rough per-entry bookkeeping cost of the in-memory tier (dict slot,
+# OrderedDict link, tuple and bytes headers)
+_ENTRY_OVERHEAD = 200
+# rough per-entry cost of a row of the on-disk tier and its index entries
+_DISK_ENTRY_OVERHEAD = 64
+# SQLite limits the number of parameters of a statement
+_CHUNK = 500
+# last-use times on disk are only refreshed when older than this (seconds)
+_TOUCH = 60
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS tags '
+    '(key BLOB PRIMARY KEY, value BLOB, created REAL, size INTEGER, used REAL)',
+    'CREATE INDEX IF NOT EXISTS tags_used ON tags (used)',
+    'CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)',
+    'INSERT OR IGNORE INTO totals VALUES (0, 0)',
+    # the running total of the stored sizes, kept by the database itself
+    'CREATE TRIGGER IF NOT EXISTS tags_insert AFTER INSERT ON tags '
+    'BEGIN UPDATE totals SET bytes = bytes + NEW.size WHERE id = 0; END',
+    'CREATE TRIGGER IF NOT EXISTS tags_delete AFTER DELETE ON tags '
+    'BEGIN UPDATE totals SET bytes = bytes - OLD.size WHERE id = 0; END',
+)
+
+_cache = None
+
+
+def sentence_key(words, version=None):
+    """
+    Return the cache key of a tokenized sentence.
+
+    :param words: the lower-cased tokens fed to the tagger
+    :param version: model version the result belongs to
+    :return: 20 bytes SHA-1 digest
+    """
+    digest = hashlib.sha1(('%s\0' % version).encode('utf-8'))
+    digest.update('\x1f'.join(words).encode('utf-8'))
+    return digest.digest()
+
+
+class TaggerCache():
+    """
+    LRU/TTL cache of tagger results with an optional persistent tier.
+
+    :param max_bytes: approximate memory budget of the in-memory tier
+    :param ttl: seconds an entry stays valid, ``None`` keeps entries forever
+    :param path: SQLite file of the on-disk tier, ``None`` disables it
+    :param disk_bytes: approximate budget of the on-disk tier
+    """
+
+    def __init__(self, max_bytes=64 * 2 ** 20, ttl=None, path=None, disk_bytes=2 ** 30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path is not None:
+            with self._db() as db:
+                columns = [row[1] for row in db.execute('PRAGMA table_info(tags)')]
+                if columns and 'size' not in columns:
+                    # written by an unbounded version of the cache: start afresh
+                    db.execute('DROP TABLE tags')
+                for statement in _SCHEMA:
+                    db.execute(statement)
+
+    def _db(self):
+        # sqlite connections may not be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+        return db
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        """Return the cached value of ``key`` or ``None``."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._discard(key)
+
+        if self.path is not None:
+            db = self._db()
+            row = db.execute('SELECT value, created, used FROM tags WHERE key = ?', (key,)).fetchone()
+            if row is not None and not self._expired(row[1], now):
+                value = bytes(row[0])
+                if now - row[2] > _TOUCH:
+                    with db:
+                        db.execute('UPDATE tags SET used = ? WHERE key = ?', (now, key))
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value, row[1])
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Cache ``value`` (bytes) under ``key`` in every tier."""
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        if self.path is not None:
+            with self._db() as db:
+                # REPLACE would not fire the delete trigger that keeps the total
+                db.execute('DELETE FROM tags WHERE key = ?', (key,))
+                db.execute('INSERT INTO tags VALUES (?, ?, ?, ?, ?)',
+                           (key, sqlite3.Binary(value), now, len(key) + len(value) + _DISK_ENTRY_OVERHEAD, now))
+            self._evict_disk()
+
+    @property
+    def disk_size(self):
+        """Approximate bytes used by the on-disk tier."""
+        if self.path is None:
+            return 0
+        return self._db().execute('SELECT bytes FROM totals').fetchone()[0]
+
+    def _evict_disk(self):
+        excess = self.disk_size - self.disk_bytes
+        if excess <= 0:
+            return
+        # evict down to 90% of the budget, so that eviction is not run on every insert
+        excess += self.disk_bytes // 10
+        with self._db() as db:
+            while excess > 0:
+                rows = db.execute('SELECT key, size FROM tags ORDER BY used LIMIT ?', (_CHUNK,)).fetchall()
+                if not rows:
+                    break
+                evicted = []
+                for key, size in rows:
+                    evicted.append(key)
+                    excess -= size
+                    if excess <= 0:
+                        break
+                db.execute('DELETE FROM tags WHERE key IN (%s)' % ','.join('?' * len(evicted)), evicted)
+                with self._lock:
+                    self.disk_evictions += len(evicted)
+
+    def _store(self, key, value, created):
+        if key in self._entries:
+            self._discard(key)
+        size = len(key) + len(value) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, created, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def prune(self):
+        """Drop expired entries from both tiers."""
+        if self.ttl is None:
+            return
+        now = time.time()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if self._expired(e[1], now)]:
+                self._discard(key)
+        if self.path is not None:
+            with self._db() as db:
+                db.execute('DELETE FROM tags WHERE created < ?', (now - self.ttl,))
+
+    def clear(self):
+        """Empty both tiers and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.disk_hits = self.misses = self.evictions = self.disk_evictions = 0
+        if self.path is not None:
+            with self._db() as db:
+                db.execute('DELETE FROM tags')
+
+    @property
+    def hit_rate(self):
+        with self._lock:
+            hits, disk_hits, misses = self.hits, self.disk_hits, self.misses
+        lookups = hits + disk_hits + misses
+        return (hits + disk_hits) / lookups if lookups else 0.0
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            stats = {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+            }
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        stats['disk_size'] = self.disk_size
+        return stats
+
+
+def enable(max_bytes=64 * 2 ** 20, ttl=None, path=None, disk_bytes=2 ** 30):
+    """
+    Put a :class:`TaggerCache` in front of ``tags`` for this process.
+
+    :return: the new cache
+    """
+    global _cache
+    _cache = TaggerCache(max_bytes=max_bytes, ttl=ttl, path=path, disk_bytes=disk_bytes)
+    return _cache
+
+
+def disable():
+    """Remove the tagger cache."""
+    global _cache
+    _cache = None
+
+
+def current():
+    """Return the active tagger cache, or ``None``."""
+    return _cache
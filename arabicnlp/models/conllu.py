@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming CoNLL-U reader and writer.
+
+Treebanks are read one sentence at a time, so files of any size can be
+used for training and evaluation with bounded memory. ``.gz`` files are
+decompressed on the fly::
+
+    corpus = ConlluCorpus('ar_padt-ud-train.conllu.gz')   # sentences of (form, UPOS) pairs
+    batches = training.batches(corpus, word2index, tag2index, repeat=True)
+
+    for sentence in read_conllu('ar_padt-ud-test.conllu'):   # all the fields
+        ...
+    write_conllu(tagged_sentences, 'tagged.conllu')
+
+Only the syntactic words of a sentence are read: comments, multiword
+token ranges (``1-2``) and empty nodes (``1.1``) are skipped.
+"""
+
+import gzip
+from contextlib import contextmanager
+
+FIELDS = ('id', 'form', 'lemma', 'upos', 'xpos', 'feats', 'head', 'deprel', 'deps', 'misc')
+
+
+@contextmanager
+def _open(source, mode):
+    """Open a file name (``.gz`` included), or pass a file object through."""
+    if not isinstance(source, str):
+        yield source
+        return
+    if source.endswith('.gz'):
+        f = gzip.open(source, mode + 't', encoding='utf-8')
+    else:
+        f = open(source, mode, encoding='utf-8')
+    with f:
+        yield f
+
+
+def read_conllu(source):
+    """
+    Yield the sentences of a CoNLL-U file, lazily.
+
+    :param source: file name or text file object
+    :return: iterator of sentences, lists of 10-field tuples (see :data:`FIELDS`)
+    """
+    with _open(source, 'r') as f:
+        sentence = []
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line:
+                if sentence:
+                    yield sentence
+                    sentence = []
+                continue
+            if line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            if len(fields) != len(FIELDS):
+                raise ValueError('Line %d has %d fields instead of %d.' % (number, len(fields), len(FIELDS)))
+            if not fields[0].isdigit():
+                # multiword token range or empty node
+                continue
+            sentence.append(tuple(fields))
+        if sentence:
+            yield sentence
+
+
+def write_conllu(sentences, destination):
+    """
+    Write sentences in CoNLL-U format, one at a time.
+
+    :param sentences: iterable of sentences; a token is either a 10-field
+                      tuple, or a ``(form, tag)`` pair written as the form
+                      and UPOS of a word with the other fields empty (``_``)
+    :param destination: file name or text file object
+    :return: number of sentences written
+    """
+    count = 0
+    with _open(destination, 'w') as f:
+        for sentence in sentences:
+            lines = []
+            for i, token in enumerate(sentence, 1):
+                if len(token) == 2:
+                    token = (str(i), token[0], '_', token[1], '_', '_', '_', '_', '_', '_')
+                lines.append('\t'.join(token))
+            lines.append('\n')
+            f.write('\n'.join(lines))
+            count += 1
+    return count
+
+
+class ConlluCorpus():
+    """
+    Re-iterable tagged corpus over a CoNLL-U file.
+
+    Every iteration reads the file again, so the corpus can be passed to
+    :func:`arabicnlp.models.training.batches` with ``repeat=True`` or
+    trained on for several epochs without being held in memory.
+
+    :param source: file name
+    :param tag: field used as the tag, ``'upos'`` or ``'xpos'``
+    """
+
+    def __init__(self, source, tag='upos'):
+        if tag not in FIELDS:
+            raise ValueError('Unknown CoNLL-U field %r.' % (tag,))
+        self.source = source
+        self.tag = tag
+        self._column = FIELDS.index(tag)
+
+    def __iter__(self):
+        column = self._column
+        for sentence in read_conllu(self.source):
+            yield [(token[1], token[column]) for token in sentence]
+
+    def __repr__(self):
+        return '<ConlluCorpus %s %s>' % (self.source, self.tag)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of the POS tagger on a tagged corpus.
+
+The corpus is streamed in chunks of sentences, every chunk is tagged as
+one batch and only counts are kept, so memory stays bounded whatever the
+size of the corpus::
+
+    python -m arabicnlp pos-evaluate ar_padt-ud-test.conllu --backend fast
+
+Besides the accuracy, the report separates the two known failure modes
+of the tagger: tokens tagged ``-PAD-`` (the padding class) and
+out-of-vocabulary tokens.
+"""
+
+import time
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from .conllu import write_conllu
+from .pos_tagger import _model, _segmenter, _tag_sentences
+
+PAD = '-PAD-'
+
+
+def _chunks(sentences, chunk_size):
+    iterator = iter(sentences)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate(sentences, version=None, backend='lstm', chunk_size=1024, tag_map=None, output=None):
+    """
+    Tag a corpus and compare the tags with its gold tags.
+
+    :param sentences: iterable of sentences of ``(word, tag)`` pairs, e.g.
+                      a :class:`~arabicnlp.models.conllu.ConlluCorpus`
+    :param backend: ``'lstm'`` or ``'fast'``
+    :param chunk_size: number of sentences tagged at a time
+    :param tag_map: dict mapping the tagger's tags to the corpus tag set
+    :param output: file name or file object to write the predicted tags
+                   to, in CoNLL-U format
+    :return: dict with ``sentences``, ``tokens``, ``accuracy``, ``pad_rate``
+             (share of tokens tagged ``-PAD-``), ``oov_rate``,
+             ``oov_error_rate`` and ``known_error_rate`` (error rates of
+             out-of-vocabulary and known tokens), ``confusion`` (gold tag
+             -> predicted tag -> count), ``seconds`` and
+             ``tokens_per_second`` (tagging time only)
+    """
+    model = _model(backend, version)
+    counts = Counter()
+    confusion = Counter()
+    predictions = _predictions(model, backend, sentences, chunk_size, tag_map, counts, confusion)
+    if output is not None:
+        write_conllu(predictions, output)
+    else:
+        for _ in predictions:
+            pass
+    seconds = counts.pop('seconds', 0.0)
+    tokens = counts['tokens']
+    oov = counts['oov']
+    result = {
+        'sentences': counts['sentences'],
+        'tokens': tokens,
+        'accuracy': counts['correct'] / tokens if tokens else 0.0,
+        'pad_rate': counts['pad'] / tokens if tokens else 0.0,
+        'oov_rate': oov / tokens if tokens else 0.0,
+        'oov_error_rate': counts['oov_errors'] / oov if oov else 0.0,
+        'known_error_rate': (counts['errors'] - counts['oov_errors']) / (tokens - oov) if tokens > oov else 0.0,
+        'confusion': {},
+        'seconds': seconds,
+        'tokens_per_second': tokens / seconds if seconds else 0.0,
+    }
+    for (gold, predicted), count in sorted(confusion.items()):
+        result['confusion'].setdefault(gold, {})[predicted] = count
+    return result
+
+
+def _predictions(model, backend, sentences, chunk_size, tag_map, counts, confusion):
+    """Tag ``sentences`` chunk by chunk, update the counts and yield the tagged sentences."""
+    segmenter = _segmenter(model)
+    for chunk in _chunks(sentences, chunk_size):
+        words = [[w for w, _ in sentence] for sentence in chunk]
+        start = time.perf_counter()
+        tagged = _tag_sentences(model, backend, words)
+        counts['seconds'] += time.perf_counter() - start
+        predicted = np.concatenate(tagged) if tagged else np.zeros(0, dtype=np.str_)
+        counts['pad'] += int((predicted == PAD).sum())
+        if tag_map:
+            predicted = np.array([tag_map.get(t, t) for t in predicted.tolist()], dtype=np.str_)
+        gold = np.array([t for sentence in chunk for _, t in sentence], dtype=np.str_)
+        known = segmenter.known([w.lower() for sentence in words for w in sentence])
+        errors = predicted != gold
+        counts['sentences'] += len(chunk)
+        counts['tokens'] += len(gold)
+        counts['correct'] += int(len(gold) - errors.sum())
+        counts['errors'] += int(errors.sum())
+        counts['oov'] += int((~known).sum())
+        counts['oov_errors'] += int((errors & ~known).sum())
+        if len(gold):
+            pairs, pair_counts = np.unique(np.char.add(np.char.add(gold, '\t'), predicted), return_counts=True)
+            confusion.update({tuple(pair.split('\t')): int(n) for pair, n in zip(pairs.tolist(), pair_counts.tolist())})
+        position = 0
+        for sentence in words:
+            yield list(zip(sentence, predicted[position:position + len(sentence)].tolist()))
+            position += len(sentence)
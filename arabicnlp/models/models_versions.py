@@ -1 +1,3 @@
-__pos_model__ = 'post_lstm_march_2019_.h5'
\ No newline at end of file
+# Default versions of the packaged models, resolved through the registry
+__pos_version__ = 'march_2019'
+__pos_model__ = 'post_ngram_march_2019.h5'
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Fast feature-based POS tagger (averaged perceptron).
+
+Every token is described by hashed features of the word itself (the
+word, its first and last letters, its script and length) and of its
+neighbours (the two words on each side and their last letters). None
+of them depend on the previous tags, so a whole document is scored
+with a handful of row gathers from a ``(n_features, n_tags)`` weight
+array and one ``argmax``, without any per-token Python loop. Word
+features are computed once per distinct word and cached; the cache is
+shared by the threads using the model.
+
+The tagger is trained offline, either on a gold corpus (sentences of
+``(word, tag)`` pairs, as in :mod:`arabicnlp.models.training`) or on the
+LSTM tagger's own predictions on raw text::
+
+    python -m arabicnlp pos-fast-train articles.txt pos_fast.npz --epochs 5
+    python -m arabicnlp pos-fast-benchmark pos_fast.npz articles.txt
+
+and installed like any other model, as ``<model dir>/pos-fast/<version>/``
+with a manifest whose ``model`` role is the ``.npz`` file. It is then
+used with ``tags(text, backend='fast')``.
+"""
+
+import threading
+import time
+import zlib
+from itertools import islice
+
+import numpy as np
+
+from ..preprocessing.script import script_of
+from .registry import default_registry
+
+# features of the word itself, computed once per distinct word
+_WORD_FEATURES = ('bias', 'word', 'suffix1', 'suffix2', 'suffix3', 'prefix1', 'prefix2', 'prefix3', 'shape')
+# features of the neighbours: offset of the neighbour, and whether its
+# word (0) or its last two letters (1) are used
+_OFFSETS = np.array([-1, 1, -2, 2, -1, 1])
+_VALUES = np.array([0, 0, 0, 0, 1, 1])
+_SALTS = np.array([0x9e3779b1, 0x85ebca6b, 0xc2b2ae35, 0x27d4eb2f, 0x165667b1, 0xd3a2646c], dtype=np.uint64)
+_MULTIPLIER = np.uint64(0x9e3779b97f4a7c15)
+_BOUNDARY = 0x5bd1e995  # hash of the words beyond the sentence
+
+
+def _hash(s):
+    return zlib.crc32(s.encode('utf-8'))
+
+
+def _word_features(word):
+    """Return the hashes of the word-level features of ``word`` and of its word and suffix context values."""
+    values = ('', word, word[-1:], word[-2:], word[-3:], word[:1], word[:2], word[:3],
+              '%d:%d' % (script_of(word), min(len(word), 6)))
+    features = [_hash('%d\x1f%s' % (slot, value)) for slot, value in enumerate(values)]
+    return features, (_hash(word), _hash(word[-2:]))
+
+
+class PerceptronTagger():
+    """
+    Averaged perceptron tagger over hashed features.
+
+    :param classes: tag names
+    :param n_features: number of hashed features (rows of the weights)
+    :param max_cache: number of distinct words whose features are kept
+    """
+
+    def __init__(self, classes, n_features=2 ** 20, max_cache=2 ** 20):
+        self.classes = np.array(sorted(set(classes)))
+        self.n_features = n_features
+        self.max_cache = max_cache
+        self.weights = np.zeros((n_features, len(self.classes)), dtype=np.float32)
+        self.words = np.zeros(0, dtype=np.str_)
+        self.version = None
+        self._lock = threading.Lock()
+        self._clear_cache()
+
+    @property
+    def tag_names(self):
+        return self.classes
+
+    def _clear_cache(self):
+        self._index = {}
+        self._table = np.zeros((1024, len(_WORD_FEATURES)), dtype=np.int64)
+        self._hashes = np.zeros((1024, 2), dtype=np.uint64)
+
+    def _rows(self, words):
+        """
+        Return the feature cache rows of ``words``, adding the new words,
+        with the feature and hash tables they index.
+
+        Tables are only ever grown or replaced, never overwritten, so the
+        returned rows stay valid in the returned tables whatever other
+        threads add to the cache afterwards.
+        """
+        with self._lock:
+            return self._add_rows(words), self._table, self._hashes
+
+    def _add_rows(self, words):
+        index = self._index
+        try:
+            return np.array([index[w] for w in words], dtype=np.int64)
+        except KeyError:
+            pass
+        new = [w for w in set(words) if w not in index]
+        if len(index) + len(new) > self.max_cache:
+            self._clear_cache()
+            index = self._index
+            new = list(set(words))
+        first = len(index)
+        if first + len(new) > len(self._table):
+            size = max(2 * len(self._table), first + len(new))
+            self._table = np.resize(self._table, (size, len(_WORD_FEATURES)))
+            self._hashes = np.resize(self._hashes, (size, 2))
+        for i, word in enumerate(new, first):
+            features, hashes = _word_features(word)
+            self._table[i] = features
+            self._hashes[i] = hashes
+            index[word] = i
+        self._table[first:first + len(new)] %= self.n_features
+        return np.array([index[w] for w in words], dtype=np.int64)
+
+    def features(self, words, starts=None):
+        """
+        Return the ``(len(words), n)`` feature ids of a token stream.
+
+        :param words: lower-cased tokens
+        :param starts: boolean array marking the first token of every
+                       sentence; neighbours are never looked up across a
+                       sentence start. The stream is one sentence by default.
+        """
+        n = len(words)
+        rows, table, hashes = self._rows(words)
+        neighbours = np.arange(n)[:, None] + _OFFSETS
+        inside = (neighbours >= 0) & (neighbours < n)
+        neighbours = np.clip(neighbours, 0, max(n - 1, 0))
+        if starts is not None:
+            sentence = np.cumsum(starts)
+            inside &= sentence[neighbours] == sentence[:, None]
+        context = np.where(inside, hashes[rows[neighbours], _VALUES], _BOUNDARY)
+        context = ((context ^ _SALTS) * _MULTIPLIER >> np.uint64(32)) % np.uint64(self.n_features)
+        return np.hstack((table[rows], context.astype(np.int64)))
+
+    def _scores(self, ids, weights=None):
+        weights = self.weights if weights is None else weights
+        return weights[ids].sum(axis=1)
+
+    def predict_ids(self, words, starts=None, chunk_size=4096):
+        """Return the tag id (index in :attr:`classes`) of every token."""
+        ids = self.features(words, starts)
+        result = np.empty(len(words), dtype=np.int64)
+        # scores are computed in chunks to bound the temporary arrays
+        for start in range(0, len(words), chunk_size):
+            result[start:start + chunk_size] = self._scores(ids[start:start + chunk_size]).argmax(axis=1)
+        return result
+
+    def predict(self, words, starts=None):
+        """Return the tag of every token of a list of lower-cased tokens."""
+        return self.classes[self.predict_ids(words, starts)].tolist()
+
+    def fit(self, sentences, epochs=5, batch_size=32, chunk_size=10000, seed=None):
+        """
+        Train on a tagged corpus.
+
+        Mistakes of every batch of ``batch_size`` tokens are corrected at
+        once, and the weights are averaged over all the updates (lazily,
+        per feature row).
+
+        :param sentences: re-iterable corpus of sentences of ``(word, tag)`` pairs
+        :param chunk_size: number of sentences whose features are held in
+                           memory at a time
+        """
+        rng = np.random.RandomState(seed)
+        weights = np.zeros_like(self.weights)
+        totals = np.zeros_like(self.weights)
+        stamps = np.zeros(self.n_features, dtype=np.int64)
+        step = 0
+        words = set()
+        for _ in range(epochs):
+            iterator = iter(sentences)
+            while True:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                chunk = [s for s in chunk if s]
+                if not chunk:
+                    continue
+                tokens = [w.lower() for s in chunk for w, _ in s]
+                words.update(tokens)
+                starts = np.zeros(len(tokens), dtype=bool)
+                starts[np.cumsum([0] + [len(s) for s in chunk[:-1]])] = True
+                X = self.features(tokens, starts)
+                y = self._labels([t for s in chunk for _, t in s])
+                order = rng.permutation(len(tokens))
+                for begin in range(0, len(order), batch_size):
+                    batch = order[begin:begin + batch_size]
+                    ids = X[batch]
+                    predicted = self._scores(ids, weights).argmax(axis=1)
+                    wrong = predicted != y[batch]
+                    step += 1
+                    if not wrong.any():
+                        continue
+                    ids = ids[wrong]
+                    rows = np.unique(ids)
+                    # bring the running totals of the touched rows up to date
+                    totals[rows] += (step - stamps[rows])[:, None] * weights[rows]
+                    stamps[rows] = step
+                    np.add.at(weights, (ids, y[batch][wrong][:, None]), 1.0)
+                    np.add.at(weights, (ids, predicted[wrong][:, None]), -1.0)
+        totals += (step - stamps)[:, None] * weights
+        self.weights = (totals / max(step, 1)).astype(np.float32)
+        self.words = np.array(sorted(words), dtype=np.str_)
+        return self
+
+    def _labels(self, tags):
+        positions = np.minimum(np.searchsorted(self.classes, tags), len(self.classes) - 1)
+        if not (self.classes[positions] == np.asarray(tags)).all():
+            raise ValueError('Tags outside of %s.' % ', '.join(map(str, self.classes)))
+        return positions
+
+    def score(self, sentences):
+        """Return the accuracy on a tagged corpus."""
+        sentences = [s for s in sentences if s]
+        tokens = [w.lower() for s in sentences for w, _ in s]
+        if not tokens:
+            return 0.0
+        starts = np.zeros(len(tokens), dtype=bool)
+        starts[np.cumsum([0] + [len(s) for s in sentences[:-1]])] = True
+        expected = np.array([t for s in sentences for _, t in s])
+        return float(np.mean(self.classes[self.predict_ids(tokens, starts)] == expected))
+
+    def save(self, filename):
+        """Save the model (``.npz``)."""
+        np.savez(filename, weights=self.weights, classes=self.classes, words=self.words)
+
+    @classmethod
+    def load(cls, filename, version=None):
+        data = np.load(filename)
+        model = cls(data['classes'].tolist(), n_features=data['weights'].shape[0])
+        model.weights = data['weights']
+        model.words = data['words']
+        model.version = version
+        return model
+
+    def __repr__(self):
+        return '<PerceptronTagger %d tags>' % len(self.classes)
+
+
+def distill(texts, version=None, **kwargs):
+    """
+    Train a :class:`PerceptronTagger` on the predictions of the LSTM tagger.
+
+    Every text is tagged with :func:`arabicnlp.models.pos_tagger.tag_document`;
+    tokens it tags ``-PAD-`` are left out.
+
+    :param texts: iterable of raw texts
+    :param version: LSTM model version
+    :param kwargs: ``n_features`` goes to the constructor, the rest to
+                   :meth:`PerceptronTagger.fit`
+    """
+    from .pos_tagger import tag_document
+
+    sentences = []
+    for text in texts:
+        sentence = [(token, tag) for token, tag, _, _ in tag_document(text, version) if tag != '-PAD-']
+        if sentence:
+            sentences.append(sentence)
+    options = {k: kwargs.pop(k) for k in ('n_features',) if k in kwargs}
+    classes = set(tag for sentence in sentences for _, tag in sentence)
+    return PerceptronTagger(classes, **options).fit(sentences, **kwargs)
+
+
+def benchmark(model, texts, repeat=3):
+    """
+    Measure the tagging throughput of ``model`` on ``texts``.
+
+    :return: dict with the best ``tokens_per_second`` over ``repeat``
+             runs and the number of tokens
+    """
+    from .pos_tagger import _tokens
+
+    documents = [[w.lower() for w in _tokens(text)] for text in texts]
+    model.predict_ids(documents[0] if documents else [])
+    n = sum(len(d) for d in documents)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for words in documents:
+            model.predict_ids(words)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'tokens': n, 'tokens_per_second': n / best if best else float('inf')}
+
+
+def _load_perceptron_tagger(files, version):
+    return PerceptronTagger.load(files['model'], version)
+
+
+default_registry.register('pos-fast', _load_perceptron_tagger)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of tagger replicas for multi-threaded servers.
+
+A Keras model is tied to the TensorFlow graph and session it was loaded
+in, and a single model called from many threads either serializes or
+fails. A :class:`ReplicaPool` holds ``size`` independent copies of the
+tagger, each in its own graph and session with its own intra-op and
+inter-op thread counts, and hands every prediction a replica of its own::
+
+    from arabicnlp.models import pool
+
+    pool.enable(size=4, intra_op_threads=2, timeout=5)
+    ...
+    tags(text)   # from any thread; waits at most 5 seconds for a free replica
+    pool.current().stats()
+
+Requests beyond ``size`` wait in line for a replica to be checked back in
+and fail with :class:`TimeoutError` after ``timeout`` seconds, or at once
+when ``max_waiting`` requests are already waiting.
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+_pool = None
+
+
+class ReplicaPool():
+    """
+    Fixed set of tagger replicas, each used by one thread at a time.
+
+    The pool has the ``lookup``/``predict``/``tag_names`` interface of a
+    single tagger. Vocabulary lookups are read-only and go to the first
+    replica; every ``predict`` call runs on a checked out replica.
+
+    :param replicas: tagger replicas (:class:`~arabicnlp.models.pos_tagger.PosModel`
+                     or :class:`~arabicnlp.models.shared.SharedStore`)
+    :param timeout: default number of seconds to wait for a free replica,
+                    ``None`` waits forever
+    :param max_waiting: maximum number of requests waiting for a replica,
+                        ``None`` for no limit
+    """
+
+    def __init__(self, replicas, timeout=None, max_waiting=None):
+        self.replicas = list(replicas)
+        if not self.replicas:
+            raise ValueError('A replica pool needs at least one replica.')
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.checkouts = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._waiting = 0
+        self._lock = threading.Lock()
+        # the most recently used replica is handed out first, with warm caches
+        self._free = queue.LifoQueue()
+        for replica in self.replicas:
+            self._free.put(replica)
+
+    def __getattr__(self, name):
+        # version, max_length, tag_names, vocabularies...
+        if name == 'replicas':
+            raise AttributeError(name)
+        return getattr(self.replicas[0], name)
+
+    def checkout(self, timeout=None):
+        """
+        Take a replica out of the pool, waiting for one to be checked in if needed.
+
+        :param timeout: seconds to wait, defaults to the pool's timeout
+        :raise TimeoutError: if no replica became free in time, or too
+                             many requests are already waiting
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self.max_waiting is not None and self._waiting >= self.max_waiting and self._free.empty():
+                self.rejected += 1
+                raise TimeoutError('%d tagging requests are already waiting for a replica.' % self._waiting)
+            self._waiting += 1
+        start = time.perf_counter()
+        try:
+            replica = self._free.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError('No tagger replica became free within %s seconds.' % timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.wait_seconds += time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+        return replica
+
+    def checkin(self, replica):
+        """Return a replica taken with :meth:`checkout` to the pool."""
+        self._free.put(replica)
+
+    @contextmanager
+    def replica(self, timeout=None):
+        """Context manager checking a replica out and back in."""
+        replica = self.checkout(timeout)
+        try:
+            yield replica
+        finally:
+            self.checkin(replica)
+
+    def lookup(self, words):
+        return self.replicas[0].lookup(words)
+
+    def predict(self, sequences, timeout=None):
+        """Run the tagger on a padded id matrix with the first free replica."""
+        with self.replica(timeout) as replica:
+            return replica.predict(sequences)
+
+    def stats(self):
+        """Return the pool counters as a dict."""
+        return {
+            'replicas': len(self.replicas),
+            'available': self._free.qsize(),
+            'waiting': self._waiting,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'mean_wait': self.wait_seconds / self.checkouts if self.checkouts else 0.0,
+        }
+
+    def __repr__(self):
+        return '<ReplicaPool %d replicas>' % len(self.replicas)
+
+
+def enable(size=None, version=None, intra_op_threads=1, inter_op_threads=1, timeout=None, max_waiting=None,
+           loader=None):
+    """
+    Serve ``tags`` from a pool of tagger replicas in this process.
+
+    :param size: number of replicas, defaults to the number of CPUs
+                 divided by ``intra_op_threads``
+    :param version: POS model version, defaults to the registry default
+    :param intra_op_threads: threads a replica uses inside one operation
+    :param inter_op_threads: threads a replica uses to run independent
+                             operations
+    :param loader: callable ``(version, intra_op_threads, inter_op_threads)``
+                   returning a replica, defaults to loading the Keras tagger
+                   (:func:`arabicnlp.models.pos_tagger.load_replica`)
+    :return: the new :class:`ReplicaPool`
+    """
+    global _pool
+    if loader is None:
+        from .pos_tagger import load_replica as loader
+    if size is None:
+        size = max(1, (os.cpu_count() or 1) // intra_op_threads)
+    replicas = [loader(version, intra_op_threads, inter_op_threads) for _ in range(size)]
+    _pool = ReplicaPool(replicas, timeout=timeout, max_waiting=max_waiting)
+    return _pool
+
+
+def disable():
+    """Remove the replica pool; ``tags`` goes back to the single registry model."""
+    global _pool
+    _pool = None
+
+
+def current():
+    """Return the active replica pool, or ``None``."""
+    return _pool
@@ -1,22 +1,21 @@
 # -*- coding: utf-8 -*-
 
 import pickle
-import re
 import numpy as np
 from itertools import chain
 from pickle import loads
-import keras
-import numpy as np
-from keras import backend as K
-from keras.models import load_model
-from keras.preprocessing.sequence import pad_sequences
-import tensorflow as tf
-from os import path
-from pathlib import Path
 
-tf.logging.set_verbosity(tf.logging.ERROR)
+from . import cache, perceptron, pool, shared, training
+from ..preprocessing.clitics import CliticSegmenter
+from .probabilities import TagProbabilities
+from ..preprocessing.segmenter import segment
+from ..preprocessing.tokenizer import FUNCTION_WORDS, Tokenizer
+from .models_versions import __pos_version__
+from .registry import BUNDLED_DIR, default_registry
 
 def _ignore_class_accuracy(to_ignore=0):
+    from keras import backend as K
+
     def ignore_accuracy(y_true, y_pred):
         y_true_class = K.argmax(y_true, axis=-1)
         y_pred_class = K.argmax(y_pred, axis=-1)
@@ -40,45 +39,360 @@ def _logits_to_tokens(sequences, index):
 
     ## One-Hot Encoded tags
 def to_categorical(sequences, categories):
-    cat_sequences = []
-    for s in sequences:
-        cats = []
-        for item in s:
-            cats.append(np.zeros(categories))
-            cats[-1][item] = 1.0
-        cat_sequences.append(cats)
-    return np.array(cat_sequences)
-
-def _string_to_sequence(string):
-    s_int = []
-    for w in _tokens(string):
-        try:
-            s_int.append(word2index[w.lower()])
-        except KeyError:
-            s_int.append(word2index['-OOV-'])
-    return pad_sequences([s_int], maxlen=_MAX_LENGTH, padding='post')
+    return training.to_categorical(sequences, categories)
 
-def _tokens(text):
-    r = re.compile(r'\w+|[^\w\s]+', re.UNICODE | re.MULTILINE | re.DOTALL)
-    return r.findall(text)
+def _pad_sequences(sequences, maxlen):
+    """Post-pad and pre-truncate like ``keras.preprocessing.sequence.pad_sequences``."""
+    result = np.zeros((len(sequences), maxlen), dtype=np.int32)
+    for i, s in enumerate(sequences):
+        s = s[-maxlen:]
+        result[i, :len(s)] = s
+    return result
 
-here = Path(__file__).parent.parent.parent
+def _string_to_sequence(string, version=None, clitics=False):
+    backend = _backend(version)
+    words = [w.lower() for w in _tokens(string)]
+    if clitics:
+        words = _segmenter(backend).split(words)
+    return _pad_sequences([backend.lookup(words)], backend.max_length)
 
-model = load_model(path.join(here, 'models/post_lstm_march_2019_.h5'), custom_objects={'ignore_accuracy': _ignore_class_accuracy()})
-global graph
-graph = tf.get_default_graph() 
+# the tokenizer of the package (arabicnlp.tokens), so that the tagger tags
+# exactly those tokens; only a conjunction in front of a particle or
+# pronoun (وقد, فهو) is split
+tokenizer = Tokenizer(clitics=('و', 'ف'), lexicon=FUNCTION_WORDS)
+
+def _tokens(text):
+    return tokenizer.tokenize(text)
+
+def _token_spans(text):
+    starts, ends = tokenizer.spans(text, clitics=True)
+    return [(text[s:e], s, e) for s, e in zip(starts.tolist(), ends.tolist())]
 
-word2index = pickle.load(open(path.join(here,'models/word2index.bin'), 'rb'))
-tag2index = pickle.load(open(path.join(here, 'models/tag2index.bin'), 'rb'))
 _MAX_LENGTH = 398 # check the training article
+_BATCH_SIZE = 64
+
+
+class PosModel():
+    """
+    The Keras tagger and its vocabularies, as loaded by the model registry.
+
+    Exposes the same ``lookup``/``predict``/``tag_names`` interface as
+    :class:`arabicnlp.models.shared.SharedStore`.
+    """
+
+    def __init__(self, model, graph, word2index, tag2index, max_length=_MAX_LENGTH, version=None, session=None):
+        self.version = version
+        self.model = model
+        self.graph = graph
+        self.session = session
+        self.word2index = word2index
+        self.tag2index = tag2index
+        self.max_length = max_length
+        self.oov = word2index['-OOV-']
+        names = [''] * (max(tag2index.values()) + 1)
+        for tag, i in tag2index.items():
+            names[i] = tag
+        self.tag_names = np.array(names)
+
+    def lookup(self, words):
+        get = self.word2index.get
+        return np.array([get(w, self.oov) for w in words], dtype=np.int32)
+
+    def predict(self, sequences):
+        # the model only exists in the graph (and session) it was loaded in,
+        # which are not the defaults of other threads
+        if self.graph is None:
+            return self.model.predict(sequences)
+        with self.graph.as_default():
+            if self.session is None:
+                return self.model.predict(sequences)
+            with self.session.as_default():
+                return self.model.predict(sequences)
+
+
+def _read_vocabularies(files):
+    with open(files['word2index'], 'rb') as f:
+        word2index = pickle.load(f)
+    with open(files['tag2index'], 'rb') as f:
+        tag2index = pickle.load(f)
+    return word2index, tag2index
+
+
+def _weights(files, version):
+    # the bundled model directory only ships the vocabularies
+    if 'model' not in files:
+        raise LookupError("The weights of POS model version '%s' are not installed; put them in "
+                          "'<model dir>/pos/%s/' with a manifest (see write_manifest)." % (version, version))
+    return files['model']
+
+
+def _load_pos_model(files, version):
+    # Keras and TensorFlow are imported here, on first use, so that
+    # processes attached to a shared store never import them.
+    import tensorflow as tf
+    from keras.models import load_model
+
+    weights = _weights(files, version)
+    tf.logging.set_verbosity(tf.logging.ERROR)
+    model = load_model(weights, custom_objects={'ignore_accuracy': _ignore_class_accuracy()})
+    # Keras builds the predict function lazily, which is not thread-safe
+    model._make_predict_function()
+    graph = tf.get_default_graph()
+    word2index, tag2index = _read_vocabularies(files)
+    return PosModel(model, graph, word2index, tag2index, version=version)
+
+
+def load_replica(version=None, intra_op_threads=1, inter_op_threads=1):
+    """
+    Load an independent copy of the Keras tagger, in a graph and session of its own.
+
+    Used by :func:`arabicnlp.models.pool.enable`; replicas can predict
+    from different threads at the same time.
+
+    :param intra_op_threads: threads used inside one operation
+    :param inter_op_threads: threads used to run independent operations
+    :return: :class:`PosModel`
+    """
+    import tensorflow as tf
+    from keras.models import load_model
+
+    tf.logging.set_verbosity(tf.logging.ERROR)
+    version, files = default_registry.files('pos', version)
+    weights = _weights(files, version)
+    graph = tf.Graph()
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                            inter_op_parallelism_threads=inter_op_threads)
+    session = tf.Session(graph=graph, config=config)
+    with graph.as_default(), session.as_default():
+        model = load_model(weights, custom_objects={'ignore_accuracy': _ignore_class_accuracy()})
+        model._make_predict_function()
+    word2index, tag2index = _read_vocabularies(files)
+    return PosModel(model, graph, word2index, tag2index, version=version, session=session)
+
+
+default_registry.register('pos', _load_pos_model, default_version=__pos_version__)
+default_registry.bundled[('pos', __pos_version__)] = BUNDLED_DIR
+
+
+def _backend(version=None):
+    replicas = pool.current()
+    if replicas is not None and version in (None, replicas.version):
+        return replicas
+    store = shared.current()
+    if store is not None and version in (None, store.version):
+        return store
+    return default_registry.load('pos', version)
+
+
+def _segmenter(backend):
+    """Return the clitic segmenter over the vocabulary of ``backend``, built on first use."""
+    segmenter = getattr(backend, 'segmenter', None)
+    if segmenter is None:
+        vocabulary = backend.word2index if hasattr(backend, 'word2index') else backend.words
+        segmenter = backend.segmenter = CliticSegmenter(vocabulary)
+    return segmenter
+
+
+def _split_spans(backend, spans):
+    """Split the clitics of ``(token, start, end)`` spans into spans of their own."""
+    pieces = _segmenter(backend).analyze([token.lower() for token, _, _ in spans])
+    result = []
+    for (token, start, end), split in zip(spans, pieces):
+        if len(split) == 1:
+            result.append((token, start, end))
+        else:
+            result.extend((form, start + a, start + b) for form, a, b in split)
+    return result
+
+
+def clitic_report(texts, version=None):
+    """
+    Measure how much clitic segmentation reduces the out-of-vocabulary
+    rate of the tagger on ``texts``.
+
+    :return: dict, see :meth:`arabicnlp.preprocessing.clitics.CliticSegmenter.report`
+    """
+    backend = _backend(version)
+    words = [token.lower() for text in texts for token in _tokens(text)]
+    return _segmenter(backend).report(words)
+
+
+def _tag_segments(backend, segments):
+    """
+    Return the tag ids of every token of every segment (list of word lists).
+
+    Cached segments are answered from the tagger cache; the others are
+    sorted by length and predicted in batches of ``_BATCH_SIZE``.
+    """
+    results = [None] * len(segments)
+    tag_cache = cache.current()
+    keys = {}
+    pending = []
+    for i, words in enumerate(segments):
+        if tag_cache is not None:
+            keys[i] = cache.sentence_key(words, backend.version)
+            value = tag_cache.get(keys[i])
+            if value is not None:
+                results[i] = np.frombuffer(value, dtype=np.uint8)
+                continue
+        pending.append(i)
+
+    pending.sort(key=lambda i: len(segments[i]))
+    for start in range(0, len(pending), _BATCH_SIZE):
+        batch = pending[start:start + _BATCH_SIZE]
+        sequences = _pad_sequences([backend.lookup(segments[i]) for i in batch], backend.max_length)
+        predictions = backend.predict(sequences)
+        for row, i in enumerate(batch):
+            ids = np.argmax(predictions[row, :len(segments[i])], axis=-1).astype(np.uint8)
+            results[i] = ids
+            if tag_cache is not None:
+                tag_cache.put(keys[i], ids.tobytes())
+    return results
+
+
+def _predict_segments(backend, segments):
+    """
+    Return the tag probabilities of every token of every segment, as one
+    ``(n_tokens, n_tags)`` array with the segments in order.
+
+    The segments are sorted by length and predicted in batches of
+    ``_BATCH_SIZE``; the real tokens of every batch are copied into place
+    at once.
+    """
+    lengths = np.array([len(words) for words in segments], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = np.zeros((int(offsets[-1]), len(backend.tag_names)), dtype=np.float32)
+    order = np.argsort(lengths, kind='stable').tolist()
+    for start in range(0, len(order), _BATCH_SIZE):
+        batch = order[start:start + _BATCH_SIZE]
+        sizes = lengths[batch]
+        if not sizes.sum():
+            continue
+        predictions = backend.predict(_pad_sequences([backend.lookup(segments[i]) for i in batch], backend.max_length))
+        longest = int(sizes.max())
+        real = np.arange(longest) < sizes[:, None]
+        # row of every real token in ``values``
+        rows = np.repeat(offsets[batch] - np.concatenate(([0], np.cumsum(sizes)[:-1])), sizes) + np.arange(sizes.sum())
+        values[rows] = predictions[:, :longest][real]
+    return values
+
+
+def tag_probabilities(texts, version=None, clitics=False):
+    """
+    Return the tag probabilities of every token of a batch of texts.
+
+    Texts are tokenized and segmented like in :func:`tag_document`. The
+    tagger cache is not used.
+
+    :param texts: list of strings
+    :param version: POS model version, defaults to the registry default
+    :param clitics: split the clitics of out-of-vocabulary words first
+    :return: :class:`~arabicnlp.models.probabilities.TagProbabilities`
+    """
+    backend = _backend(version)
+    documents = []
+    segments = []
+    for text in texts:
+        spans = _token_spans(text)
+        if clitics:
+            spans = _split_spans(backend, spans)
+        documents.append([token for token, _, _ in spans])
+        words = [token.lower() for token, _, _ in spans]
+        segments.extend(words[a:b] for a, b in segment(words, backend.max_length))
+    offsets = np.concatenate(([0], np.cumsum([len(tokens) for tokens in documents], dtype=np.int64)))
+    return TagProbabilities(_predict_segments(backend, segments), offsets, backend.tag_names, documents)
+
+
+def tag_names(version=None):
+    """Return the array of tag names of the tagger, indexed by tag id."""
+    return _backend(version).tag_names
+
+
+def _model(backend, version):
+    if backend == 'fast':
+        return default_registry.load('pos-fast', version)
+    if backend == 'lstm':
+        return _backend(version)
+    raise ValueError("Unknown tagger backend %r, expected 'lstm' or 'fast'." % (backend,))
+
+
+def tag_sentences(sentences, version=None, backend='lstm'):
+    """
+    Tag pre-tokenized sentences, e.g. the words of a treebank.
+
+    All the sentences are tagged as one batch; sentences longer than the
+    model's input length are segmented like in :func:`tag_document`.
+
+    :param sentences: list of lists of tokens
+    :param backend: ``'lstm'`` or ``'fast'``, see :func:`tag_document`
+    :return: list of arrays of tag names, one per sentence
+    """
+    return _tag_sentences(_model(backend, version), backend, sentences)
+
+
+def _tag_sentences(model, backend, sentences):
+    words = [token.lower() for tokens in sentences for token in tokens]
+    if not words:
+        return [model.tag_names[:0] for _ in sentences]
+    if backend == 'fast':
+        starts = np.zeros(len(words), dtype=bool)
+        position = 0
+        for tokens in sentences:
+            starts[[position + a for a, _ in segment(tokens, _MAX_LENGTH)]] = True
+            position += len(tokens)
+        ids = model.predict_ids(words, starts)
+    else:
+        segments = []
+        position = 0
+        for tokens in sentences:
+            segments.extend(words[position + a:position + b] for a, b in segment(tokens, model.max_length))
+            position += len(tokens)
+        ids = np.concatenate(_tag_segments(model, segments))
+    names = model.tag_names[ids]
+    offsets = np.cumsum([len(tokens) for tokens in sentences])[:-1]
+    return np.split(names, offsets)
+
+
+def tag_document(text, version=None, clitics=False, backend='lstm'):
+    """
+    Tag every token of ``text``, however long.
+
+    The text is split into sentences/segments no longer than the model's
+    input length (see :func:`arabicnlp.preprocessing.segmenter.segment`),
+    the segments are tagged as a batch and the results are stitched back
+    in document order.
+
+    :param text: string
+    :param version: version of the model of ``backend``: of ``pos`` for
+                    ``'lstm'``, of ``pos-fast`` for ``'fast'``; defaults to
+                    the registry default of that model
+    :param clitics: split the conjunctions, prepositions and article of
+                    out-of-vocabulary words into tokens of their own
+                    before tagging (see :mod:`arabicnlp.preprocessing.clitics`)
+    :param backend: ``'lstm'`` for the Keras tagger, ``'fast'`` for the
+                    averaged perceptron distilled from it (model ``pos-fast``,
+                    see :mod:`arabicnlp.models.perceptron`)
+    :return: list of ``(token, tag, start, end)`` with character offsets
+    """
+    model = _model(backend, version)
+    spans = _token_spans(text)
+    if clitics:
+        spans = _split_spans(model, spans)
+    words = [token.lower() for token, _, _ in spans]
+    if not words:
+        return []
+    names = _tag_sentences(model, backend, [words])[0]
+    return [(token, str(tag), start, end) for (token, start, end), tag in zip(spans, names)]
+
 
+def tags(sentence, version=None, clitics=False, backend='lstm'):
+    """
+    Return the tag of every token of ``sentence`` as a dict.
 
-def tags( sentence):
-    predictions = model.predict(_string_to_sequence(sentence))
-    pre_result = _logits_to_tokens(predictions, {i: t for t, i in tag2index.items()})[0]
+    ``version`` is the version of the model of ``backend``, see :func:`tag_document`.
+    """
     result = {}
-    for idx, value in enumerate(_tokens(sentence)):
-        if pre_result[idx] == '-PAD-':
-            break
-        result[value] = pre_result[idx]
+    for token, tag, _, _ in tag_document(sentence, version, clitics, backend):
+        if tag != '-PAD-':
+            result[token] = tag
     return result
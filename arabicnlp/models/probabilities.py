@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Per-token tag probabilities of a batch of texts.
+
+:func:`arabicnlp.models.pos_tagger.tag_probabilities` keeps the softmax
+output of the tagger instead of only its argmax. The rows of all the
+texts are held in a single ``(n_tokens, n_tags)`` array, ragged rows
+delimited by ``offsets``, so the probabilities of one text are a view
+of that array, trimmed to its real tokens, and every statistic is
+computed for the whole batch at once::
+
+    probabilities = tag_probabilities(texts)
+    probabilities[0]                  # (len(tokens of text 0), n_tags) view
+    ids, p = probabilities.top_k(3)   # best three tags of every token
+    probabilities.confidence('min')   # one score per text
+    probabilities.tag_names[ids]      # tag ids to names
+"""
+
+import numpy as np
+
+CONFIDENCE_METHODS = ('min', 'mean', 'product', 'margin')
+
+
+class TagProbabilities():
+    """
+    Tag probabilities of the tokens of a batch of texts.
+
+    :param values: ``(n_tokens, n_tags)`` array, the tokens of all the
+                   texts in order
+    :param offsets: ``n_texts + 1`` row offsets; text ``i`` has rows
+                    ``offsets[i]:offsets[i + 1]``
+    :param tag_names: array of the tag names, indexed by tag id
+    :param tokens: tokens of every text
+    """
+
+    def __init__(self, values, offsets, tag_names, tokens=None):
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.tag_names = tag_names
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """Return the probabilities of text ``i``, a view of :attr:`values`."""
+        if not -len(self) <= i < len(self):
+            raise IndexError('text index %d out of range' % i)
+        i %= len(self)
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def lengths(self):
+        """Number of tokens of every text."""
+        return np.diff(self.offsets)
+
+    def split(self, array):
+        """Cut a per-token array (such as :meth:`tag_ids`) into per-text views."""
+        return [array[a:b] for a, b in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def tag_ids(self):
+        """Return the most probable tag id of every token."""
+        return self.values.argmax(axis=1)
+
+    def tags(self):
+        """Return the most probable tag names of every text."""
+        return [names.tolist() for names in self.split(self.tag_names[self.tag_ids()])]
+
+    def top_k(self, k=3):
+        """
+        Return the ``k`` most probable tags of every token.
+
+        :return: ``(ids, probabilities)``, two ``(n_tokens, k)`` arrays,
+                 most probable first
+        """
+        k = min(k, self.values.shape[1])
+        if not len(self.values) or not k:
+            return (np.zeros((len(self.values), k), dtype=np.int64),
+                    np.zeros((len(self.values), k), dtype=self.values.dtype))
+        ids = np.argpartition(-self.values, k - 1, axis=1)[:, :k]
+        probabilities = np.take_along_axis(self.values, ids, axis=1)
+        order = np.argsort(-probabilities, axis=1, kind='stable')
+        return np.take_along_axis(ids, order, axis=1), np.take_along_axis(probabilities, order, axis=1)
+
+    def confidence(self, method='min'):
+        """
+        Return a confidence score for every text.
+
+        :param method: ``'min'``, the lowest best-tag probability of its
+                       tokens; ``'mean'``, their mean; ``'product'``, their
+                       product (the probability of the whole best tagging);
+                       ``'margin'``, the smallest gap between the two most
+                       probable tags of a token
+        :return: float array, ``nan`` for texts without tokens
+        """
+        if method not in CONFIDENCE_METHODS:
+            raise ValueError('Unknown confidence method %r, expected one of %s.'
+                             % (method, ', '.join(CONFIDENCE_METHODS)))
+        result = np.full(len(self), np.nan)
+        lengths = self.lengths
+        filled = lengths > 0
+        if not filled.any():
+            return result
+        if method == 'margin':
+            _, best = self.top_k(2)
+            scores = best[:, 0] - best[:, 1] if best.shape[1] > 1 else best[:, 0]
+        else:
+            scores = self.values.max(axis=1)
+        # empty texts share their offset with the next text and are left out
+        starts = self.offsets[:-1][filled]
+        if method in ('min', 'margin'):
+            result[filled] = np.minimum.reduceat(scores, starts)
+        elif method == 'mean':
+            result[filled] = np.add.reduceat(scores.astype(np.float64), starts) / lengths[filled]
+        else:
+            result[filled] = np.exp(np.add.reduceat(np.log(np.maximum(scores, 1e-30), dtype=np.float64), starts))
+        return result
+
+    def __repr__(self):
+        return '<TagProbabilities %d texts, %d tokens>' % (len(self), len(self.values))
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Local, versioned model registry.
+
+Models are resolved by name and version from the model directory
+(``ARABICNLP_MODEL_DIR``, or ``~/arabicnlp_models`` by default)::
+
+    <model_dir>/<name>/<version>/manifest.json
+    <model_dir>/<name>/<version>/<model files>
+
+``manifest.json`` maps the roles a loader expects to file names and
+records the SHA-256 checksum of every file::
+
+    {
+        "files": {"model": "model.h5", "word2index": "word2index.bin", ...},
+        "sha256": {"model.h5": "9f86d081...", ...}
+    }
+
+Use :func:`write_manifest` to create one. Models are only ever read from
+local directories; nothing is downloaded. Loaded models are cached per
+process and several versions of the same model can be loaded side by
+side, e.g. ``tags(text, version='march_2019')``.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from ..utils import DEFAULT_MODEL_DIR
+
+MANIFEST = 'manifest.json'
+MODEL_DIR_ENV = 'ARABICNLP_MODEL_DIR'
+
+# models shipped inside the source tree, used when the model directory
+# does not provide the requested version
+BUNDLED_DIR = str(Path(__file__).parent.parent.parent / 'models')
+
+
+def sha256(filename, chunk_size=1 << 20):
+    """Return the hex SHA-256 digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_manifest(directory, files):
+    """
+    Write ``manifest.json`` for a model version directory.
+
+    :param directory: the version directory holding the model files
+    :param files: dict mapping loader roles to file names in ``directory``
+    :return: path of the manifest
+    :raise ValueError: if a file is empty, e.g. a placeholder for weights
+                       that were never downloaded
+    """
+    for f in files.values():
+        if os.path.getsize(os.path.join(directory, f)) == 0:
+            raise ValueError("Model file '%s' is empty." % os.path.join(directory, f))
+    manifest = {
+        'files': dict(files),
+        'sha256': {f: sha256(os.path.join(directory, f)) for f in files.values()},
+    }
+    filename = os.path.join(directory, MANIFEST)
+    with open(filename, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    return filename
+
+
+class ModelRegistry():
+    """
+    Resolve, verify and cache models by ``(name, version)``.
+
+    :param model_dir: root of the versioned model directories
+    :param bundled: dict mapping ``(name, version)`` to a directory used
+                    when the version is missing from ``model_dir``
+    """
+
+    def __init__(self, model_dir=None, bundled=None):
+        self.model_dir = model_dir or os.environ.get(MODEL_DIR_ENV) or DEFAULT_MODEL_DIR
+        self.bundled = dict(bundled or {})
+        self._loaders = {}
+        self._defaults = {}
+        self._verified = set()
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, default_version=None):
+        """
+        Register the loader of a model.
+
+        :param loader: callable taking a dict of role -> absolute file path
+                       and the resolved version
+        :param default_version: version used when none is requested
+        """
+        self._loaders[name] = loader
+        if default_version is not None:
+            self._defaults[name] = default_version
+
+    def versions(self, name):
+        """Return the sorted versions of ``name`` available locally."""
+        found = set(v for n, v in self.bundled if n == name)
+        root = os.path.join(self.model_dir, name)
+        if os.path.isdir(root):
+            found.update(v for v in os.listdir(root)
+                         if os.path.isfile(os.path.join(root, v, MANIFEST)))
+        return sorted(found)
+
+    def available(self):
+        """Return every locally available ``(name, version)`` pair."""
+        names = set(self._loaders) | set(n for n, _ in self.bundled)
+        if os.path.isdir(self.model_dir):
+            names.update(os.listdir(self.model_dir))
+        return [(name, version) for name in sorted(names) for version in self.versions(name)]
+
+    def resolve(self, name, version=None):
+        """
+        Return ``(version, directory)`` for a model.
+
+        :raise LookupError: if the model or version is not available locally
+        """
+        if version is None:
+            version = self._defaults.get(name)
+            if version is None:
+                versions = self.versions(name)
+                if not versions:
+                    raise LookupError("No versions of model '%s' in '%s'." % (name, self.model_dir))
+                version = versions[-1]
+
+        directory = os.path.join(self.model_dir, name, version)
+        if os.path.isfile(os.path.join(directory, MANIFEST)):
+            return version, directory
+        if (name, version) in self.bundled:
+            return version, self.bundled[(name, version)]
+        raise LookupError("Model '%s' version '%s' not found in '%s'." % (name, version, self.model_dir))
+
+    def files(self, name, version=None):
+        """
+        Return ``(version, files)`` with ``files`` mapping roles to verified paths.
+
+        Checksums are verified once per directory and process.
+
+        :raise ValueError: if a file is empty or does not match its
+                           recorded checksum
+        """
+        version, directory = self.resolve(name, version)
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+
+        with self._lock:
+            if directory not in self._verified:
+                for filename, expected in manifest['sha256'].items():
+                    if os.path.getsize(os.path.join(directory, filename)) == 0:
+                        raise ValueError("Model file '%s' of model '%s' version '%s' is empty."
+                                         % (filename, name, version))
+                    actual = sha256(os.path.join(directory, filename))
+                    if actual != expected:
+                        raise ValueError("Checksum mismatch for '%s' of model '%s' version '%s'."
+                                         % (filename, name, version))
+                self._verified.add(directory)
+
+        return version, {role: os.path.join(directory, f) for role, f in manifest['files'].items()}
+
+    def load(self, name, version=None):
+        """Load a model (once per process) and return it."""
+        try:
+            loader = self._loaders[name]
+        except KeyError:
+            raise LookupError("No loader registered for model '%s'." % name)
+        version, directory = self.resolve(name, version)
+        key = (name, version)
+        with self._lock:
+            if key not in self._cache:
+                _, files = self.files(name, version)
+                self._cache[key] = loader(files, version)
+            return self._cache[key]
+
+    def loaded(self):
+        """Return the ``(name, version)`` pairs loaded in this process."""
+        return sorted(self._cache)
+
+    def unload(self, name, version=None):
+        """Drop a cached model; ``version=None`` drops every version of ``name``."""
+        with self._lock:
+            for key in list(self._cache):
+                if key[0] == name and (version is None or key[1] == version):
+                    del self._cache[key]
+
+
+default_registry = ModelRegistry()
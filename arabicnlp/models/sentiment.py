@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Sentiment classification with a hashed-feature logistic regression.
+
+Messages are turned into hashed stem n-gram vectors
+(:class:`arabicnlp.features.HashingVectorizer`) and scored with a single
+sparse matrix product against a ``(n_features, n_classes)`` weight array,
+so a batch of thousands of messages costs one product and one softmax.
+Models are trained offline on a CPU from a labeled CSV file::
+
+    python -m arabicnlp sentiment-train tweets.csv sentiment.npz --epochs 5
+    python -m arabicnlp sentiment-benchmark sentiment.npz tweets.csv
+
+and installed like any other model, as ``<model dir>/sentiment/<version>/``
+with a manifest whose ``model`` role is the ``.npz`` file.
+"""
+
+import csv
+import time
+from itertools import islice
+
+import numpy as np
+
+from ..features import HashingVectorizer
+from .registry import default_registry
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def read_csv(filename, text_column='text', label_column='label', encoding='utf-8'):
+    """Yield the ``(text, label)`` rows of a CSV file with a header line."""
+    with open(filename, newline='', encoding=encoding) as f:
+        for row in csv.DictReader(f):
+            yield row[text_column], row[label_column]
+
+
+def _chunks(rows, chunk_size):
+    """Yield the ``(texts, labels)`` of consecutive chunks of ``(text, label)`` rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield tuple(zip(*chunk))
+
+
+class SentimentModel():
+    """
+    Multinomial logistic regression over hashed stem n-grams.
+
+    :param classes: labels, e.g. ``['negative', 'neutral', 'positive']``
+    :param n_features: number of hashed features
+    :param ngram_range: ``(min_n, max_n)`` of the stem n-grams
+    :param analyzer: callable mapping a message to its tokens, defaults
+                     to :func:`arabicnlp.stems`
+    """
+
+    def __init__(self, classes, n_features=2 ** 18, ngram_range=(1, 2), analyzer=None):
+        self.classes = np.array(sorted(set(classes)))
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range,
+                                            sublinear_tf=True, analyzer=analyzer)
+        self.coef = np.zeros((n_features, len(self.classes)), dtype=np.float32)
+        self.intercept = np.zeros(len(self.classes), dtype=np.float32)
+        self._squared = np.zeros(n_features, dtype=np.float32)
+
+    def transform(self, texts):
+        """Return the hashed feature matrix of ``texts``."""
+        return self.vectorizer.transform(texts)
+
+    def predict_proba(self, texts):
+        """Return the ``(len(texts), n_classes)`` class probabilities."""
+        return _softmax(self.transform(texts).dot(self.coef) + self.intercept)
+
+    def predict(self, texts):
+        """Return the most likely label of every text."""
+        return self.classes[self.predict_proba(texts).argmax(axis=1)].tolist()
+
+    def _labels(self, labels):
+        positions = np.searchsorted(self.classes, labels)
+        positions = np.minimum(positions, len(self.classes) - 1)
+        if not (self.classes[positions] == np.asarray(labels)).all():
+            raise ValueError('Labels outside of %s.' % ', '.join(map(str, self.classes)))
+        return positions
+
+    def partial_fit(self, texts, labels, learning_rate=0.5, alpha=1e-6, batch_size=256, seed=None):
+        """Run one pass of mini-batch AdaGrad over labeled texts."""
+        return self._epoch(self.transform(texts), self._labels(labels), learning_rate, alpha,
+                           batch_size, np.random.RandomState(seed))
+
+    def _epoch(self, X, y, learning_rate=0.5, alpha=1e-6, batch_size=256, rng=None):
+        # only the weight rows of features present in a batch are read and
+        # written, so the cost of a step does not depend on n_features
+        order = np.arange(X.shape[0]) if rng is None else rng.permutation(X.shape[0])
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = X[rows]
+            columns = np.unique(batch.indices)
+            batch = batch[:, columns]
+            errors = _softmax(batch.dot(self.coef[columns]) + self.intercept)
+            errors[np.arange(len(rows)), y[rows]] -= 1
+            errors /= len(rows)
+            gradient = batch.T.dot(errors) + alpha * self.coef[columns]
+            self._squared[columns] += (gradient ** 2).sum(axis=1)
+            step = learning_rate / np.sqrt(self._squared[columns] + 1e-8)
+            self.coef[columns] -= (step[:, None] * gradient).astype(np.float32)
+            self.intercept -= (learning_rate * errors.sum(axis=0)).astype(np.float32)
+        return self
+
+    def fit(self, texts, labels, epochs=5, learning_rate=0.5, alpha=1e-6, batch_size=256, seed=None):
+        """Train on in-memory texts, hashing every text once."""
+        X = self.transform(texts)
+        y = self._labels(labels)
+        rng = np.random.RandomState(seed)
+        for _ in range(epochs):
+            self._epoch(X, y, learning_rate, alpha, batch_size, rng)
+        return self
+
+    @classmethod
+    def fit_csv(cls, filename, epochs=5, chunk_size=100000, text_column='text', label_column='label',
+                seed=None, **kwargs):
+        """
+        Train on a labeled CSV file, holding ``chunk_size`` rows in memory at a time.
+
+        ``kwargs`` go to the constructor, except ``learning_rate``,
+        ``alpha`` and ``batch_size`` which go to the optimizer.
+        """
+        options = {k: kwargs.pop(k) for k in ('learning_rate', 'alpha', 'batch_size') if k in kwargs}
+        classes = set(label for _, label in read_csv(filename, text_column, label_column))
+        model = cls(classes, **kwargs)
+        rng = np.random.RandomState(seed)
+        for _ in range(epochs):
+            for texts, labels in _chunks(read_csv(filename, text_column, label_column), chunk_size):
+                model._epoch(model.transform(texts), model._labels(labels), rng=rng, **options)
+        return model
+
+    def score(self, texts, labels):
+        """Return the accuracy on labeled texts."""
+        return float(np.mean(np.array(self.predict(texts)) == np.asarray(labels)))
+
+    def score_rows(self, rows, chunk_size=100000):
+        """
+        Return the accuracy on a stream of ``(text, label)`` rows, e.g.
+        :func:`read_csv`, holding ``chunk_size`` rows in memory at a time.
+        """
+        correct = total = 0
+        for texts, labels in _chunks(rows, chunk_size):
+            correct += int((np.array(self.predict(texts)) == np.asarray(labels)).sum())
+            total += len(texts)
+        return correct / total if total else 0.0
+
+    def save(self, filename):
+        """Save the model (``.npz``)."""
+        np.savez(filename, coef=self.coef, intercept=self.intercept, classes=self.classes,
+                 ngram_range=np.array(self.vectorizer.ngram_range))
+
+    @classmethod
+    def load(cls, filename, analyzer=None):
+        data = np.load(filename)
+        model = cls(data['classes'].tolist(), n_features=data['coef'].shape[0],
+                    ngram_range=tuple(data['ngram_range'].tolist()), analyzer=analyzer)
+        model.coef = data['coef']
+        model.intercept = data['intercept']
+        return model
+
+    def __repr__(self):
+        return '<SentimentModel %s>' % ', '.join(map(str, self.classes))
+
+
+def benchmark(model, texts, batch_size=1024, repeat=3):
+    """
+    Measure the scoring throughput of ``model`` on ``texts``.
+
+    The first batch is scored once beforehand so that stem caches are
+    warm, as in a long-running service.
+
+    :return: dict with the best ``messages_per_second`` over ``repeat``
+             runs and the number of messages
+    """
+    texts = list(texts)
+    model.predict(texts[:batch_size])
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            model.predict(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'messages': len(texts), 'messages_per_second': len(texts) / best if best else float('inf')}
+
+
+def evaluate(model, rows, batch_size=1024):
+    """
+    Measure the scoring throughput and accuracy of ``model`` in one pass
+    over a stream of ``(text, label)`` rows, e.g. :func:`read_csv`.
+
+    The first batch is scored once beforehand so that stem caches are
+    warm, as in a long-running service.
+
+    :return: dict with the number of ``messages``, ``messages_per_second``
+             and ``accuracy``
+    """
+    correct = total = 0
+    elapsed = 0.0
+    for i, (texts, labels) in enumerate(_chunks(rows, batch_size)):
+        if not i:
+            model.predict(texts)
+        start = time.perf_counter()
+        predicted = model.predict(texts)
+        elapsed += time.perf_counter() - start
+        correct += int((np.array(predicted) == np.asarray(labels)).sum())
+        total += len(texts)
+    return {'messages': total, 'messages_per_second': total / elapsed if elapsed else float('inf'),
+            'accuracy': correct / total if total else 0.0}
+
+
+def _load_sentiment_model(files, version):
+    return SentimentModel.load(files['model'])
+
+
+default_registry.register('sentiment', _load_sentiment_model)
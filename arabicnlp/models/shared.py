@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only, memory-mapped tagger store shared between worker processes.
+
+The store is a directory of ``.npy`` files (layer weights, a sorted
+vocabulary and the tag names) plus a ``manifest.json``. Every process
+that attaches to it maps the same files read-only, so the operating
+system keeps a single copy of the weights in the page cache no matter
+how many workers are running. Inference runs in NumPy directly on the
+mapped arrays, which means attached workers never load Keras or
+TensorFlow at all.
+
+Prefork servers (gunicorn, uwsgi, ``multiprocessing``) should call
+:func:`preload` once in the parent before forking::
+
+    # gunicorn.conf.py
+    from arabicnlp.models import shared
+
+    def on_starting(server):
+        shared.preload('/dev/shm/arabicnlp')
+
+Forked workers inherit the attached store. Spawned workers attach on
+their first call to ``tags`` when ``ARABICNLP_SHARED_STORE`` points at
+the store directory (:func:`preload` sets it for child processes).
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+STORE_ENV = 'ARABICNLP_SHARED_STORE'
+MANIFEST = 'manifest.json'
+_FORMAT = 1
+
+_store = None
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'softmax': _softmax,
+}
+
+
+def _activation(name):
+    try:
+        return _ACTIVATIONS[name]
+    except KeyError:
+        raise ValueError("Unsupported activation '%s' in shared store." % name)
+
+
+def export(directory, model, word2index, tag2index, max_length, version=None):
+    """
+    Write ``model`` and its vocabularies to ``directory`` as a shared store.
+
+    The store is written to a temporary sibling directory first and then
+    renamed into place, so concurrent readers never see a partial store.
+
+    :param directory: target store directory, must not exist yet
+    :param model: a loaded Keras tagger model
+    :param word2index: dict mapping words to embedding indexes
+    :param tag2index: dict mapping tag names to output indexes
+    :param max_length: sequence length the model was trained with
+    :param version: registry version of the exported model
+    :return: directory
+    """
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    staging = tempfile.mkdtemp(prefix='.arabicnlp-store-', dir=parent)
+    try:
+        layers = []
+        n = 0
+        for layer in model.layers:
+            files = []
+            for weight in layer.get_weights():
+                name = 'w%03d.npy' % n
+                np.save(os.path.join(staging, name), np.asarray(weight, dtype=np.float32))
+                files.append(name)
+                n += 1
+            layers.append({
+                'class_name': type(layer).__name__,
+                'config': layer.get_config(),
+                'weights': files,
+            })
+
+        words = sorted(word2index)
+        np.save(os.path.join(staging, 'vocab_words.npy'), np.array(words, dtype=np.str_))
+        np.save(os.path.join(staging, 'vocab_ids.npy'),
+                np.array([word2index[w] for w in words], dtype=np.int32))
+
+        names = [''] * (max(tag2index.values()) + 1)
+        for tag, i in tag2index.items():
+            names[i] = tag
+        np.save(os.path.join(staging, 'tag_names.npy'), np.array(names, dtype=np.str_))
+
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump({
+                'format': _FORMAT,
+                'version': version,
+                'max_length': int(max_length),
+                'oov': int(word2index['-OOV-']),
+                'layers': layers,
+            }, f)
+        os.rename(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return directory
+
+
+class SharedStore():
+    """
+    A tagger attached to a memory-mapped store.
+
+    All arrays are opened with ``mmap_mode='r'``; nothing is copied into
+    the process and the object is safe to use from several threads.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        with open(os.path.join(self.directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != _FORMAT:
+            raise ValueError("Unsupported shared store format in '%s'." % self.directory)
+
+        self.version = manifest.get('version')
+        self.max_length = manifest['max_length']
+        self.oov = manifest['oov']
+        self.words = self._map('vocab_words.npy')
+        self.ids = self._map('vocab_ids.npy')
+        self.tag_names = self._map('tag_names.npy')
+        self.layers = [
+            (layer['class_name'], layer['config'], [self._map(w) for w in layer['weights']])
+            for layer in manifest['layers']
+        ]
+
+    def _map(self, name):
+        return np.load(os.path.join(self.directory, name), mmap_mode='r')
+
+    def lookup(self, words):
+        """
+        Map a sequence of (lower-cased) words to vocabulary ids.
+
+        :param words: list of strings
+        :return: int32 array, ``oov`` for unknown words
+        """
+        result = np.full(len(words), self.oov, dtype=np.int32)
+        if not len(words):
+            return result
+        query = np.array(words, dtype=np.str_)
+        pos = np.searchsorted(self.words, query)
+        pos[pos == len(self.words)] = 0
+        found = self.words[pos] == query
+        result[found] = self.ids[pos[found]]
+        return result
+
+    def predict(self, sequences):
+        """
+        Run the tagger on a padded ``(batch, max_length)`` id matrix.
+
+        When the embedding masks zeros, the recurrent layers only step up to
+        the longest real sequence in the batch; the trailing padded
+        positions are reported as ``-PAD-`` (index 0) without being computed.
+
+        :return: float32 array of shape ``(batch, max_length, n_tags)``
+        """
+        x = np.asarray(sequences)
+        embedding = self.layers[0] if self.layers else None
+        if embedding and embedding[0] == 'Embedding' and embedding[1].get('mask_zero'):
+            used = np.flatnonzero((x != 0).any(axis=0))
+            steps = used[-1] + 1 if len(used) else 1
+            if steps < x.shape[1]:
+                head = self._forward(x[:, :steps])
+                result = np.zeros(x.shape + head.shape[2:], dtype=head.dtype)
+                result[:, :steps] = head
+                result[:, steps:, 0] = 1.0
+                return result
+        return self._forward(x)
+
+    def _forward(self, x):
+        mask = None
+        for class_name, config, weights in self.layers:
+            if class_name == 'Embedding':
+                if config.get('mask_zero'):
+                    mask = x != 0
+                x = weights[0][x]
+            elif class_name == 'Bidirectional':
+                x = self._bidirectional(x, mask, config, weights)
+            elif class_name == 'LSTM':
+                x = self._lstm(x, mask, config, weights)
+            elif class_name in ('TimeDistributed', 'Dense'):
+                inner = config['layer']['config'] if class_name == 'TimeDistributed' else config
+                x = np.dot(x, weights[0])
+                if len(weights) > 1:
+                    x = x + weights[1]
+                x = _activation(inner.get('activation', 'linear'))(x)
+            elif class_name == 'Activation':
+                x = _activation(config['activation'])(x)
+            elif class_name in ('InputLayer', 'Dropout', 'SpatialDropout1D'):
+                continue
+            else:
+                raise ValueError("Unsupported layer '%s' in shared store." % class_name)
+        return x
+
+    def _bidirectional(self, x, mask, config, weights):
+        inner = config['layer']['config']
+        half = len(weights) // 2
+        forward = self._lstm(x, mask, inner, weights[:half])
+        backward = self._lstm(x, mask, inner, weights[half:], go_backwards=True)
+        merge = config.get('merge_mode', 'concat')
+        if merge == 'concat':
+            return np.concatenate([forward, backward], axis=-1)
+        if merge == 'sum':
+            return forward + backward
+        if merge == 'mul':
+            return forward * backward
+        if merge == 'ave':
+            return (forward + backward) / 2
+        raise ValueError("Unsupported merge mode '%s' in shared store." % merge)
+
+    def _lstm(self, x, mask, config, weights, go_backwards=False):
+        kernel, recurrent = weights[0], weights[1]
+        bias = weights[2] if len(weights) > 2 else 0.0
+        act = _activation(config.get('activation', 'tanh'))
+        rec_act = _activation(config.get('recurrent_activation', 'hard_sigmoid'))
+        units = recurrent.shape[0]
+        batch, steps = x.shape[0], x.shape[1]
+
+        z = np.dot(x, kernel) + bias
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        outputs = np.zeros((batch, steps, units), dtype=np.float32)
+        order = range(steps - 1, -1, -1) if go_backwards else range(steps)
+        for t in order:
+            gates = z[:, t] + np.dot(h, recurrent)
+            i = rec_act(gates[:, :units])
+            f = rec_act(gates[:, units:2 * units])
+            g = act(gates[:, 2 * units:3 * units])
+            o = rec_act(gates[:, 3 * units:])
+            c_new = f * c + i * g
+            h_new = o * act(c_new)
+            if mask is not None:
+                m = mask[:, t, None]
+                c_new = np.where(m, c_new, c)
+                h_new = np.where(m, h_new, h)
+            h, c = h_new, c_new
+            outputs[:, t] = h
+        return outputs if config.get('return_sequences', True) else h
+
+
+def _export_registered(directory, version):
+    from .pos_tagger import default_registry
+    version, _ = default_registry.resolve('pos', version)
+    pos = default_registry.load('pos', version)
+    export(directory, pos.model, pos.word2index, pos.tag2index, pos.max_length, version)
+
+
+def preload(directory, version=None):
+    """
+    Prefork hook: make sure a shared store exists in ``directory`` and attach it.
+
+    If the store is missing it is exported from the registry's Keras model
+    in a short-lived spawned child, so the calling (parent) process never
+    imports TensorFlow. Call this before forking workers.
+
+    :param directory: store directory, ideally on a tmpfs such as /dev/shm
+    :param version: POS model version to export, defaults to the registry default
+    :return: the attached :class:`SharedStore`
+    """
+    if not os.path.exists(os.path.join(directory, MANIFEST)):
+        child = multiprocessing.get_context('spawn').Process(
+            target=_export_registered, args=(directory, version))
+        child.start()
+        child.join()
+        if child.exitcode != 0:
+            raise RuntimeError("Exporting the shared tagger store to '%s' failed." % directory)
+    os.environ[STORE_ENV] = os.path.abspath(directory)
+    return attach(directory)
+
+
+def attach(directory):
+    """
+    Attach this process to an existing shared store.
+
+    :return: the attached :class:`SharedStore`
+    """
+    global _store
+    _store = SharedStore(directory)
+    return _store
+
+
+def detach():
+    """Stop using the shared store; ``tags`` falls back to the Keras model."""
+    global _store
+    _store = None
+
+
+def current():
+    """Return the attached store, attaching from ``ARABICNLP_SHARED_STORE`` if set."""
+    if _store is None and os.environ.get(STORE_ENV):
+        attach(os.environ[STORE_ENV])
+    return _store
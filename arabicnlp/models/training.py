@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Training data pipeline for retraining the POS tagger.
+
+A tagged corpus is any iterable of sentences, each sentence a list of
+``(word, tag)`` pairs. Sentences are converted to index arrays in bulk
+and streamed to Keras in length-bucketed batches, either with sparse
+integer targets (for ``sparse_categorical_crossentropy``, no one-hot at
+all) or with one-hot targets built by a single fancy-indexing operation::
+
+    batches = training.batches(corpus, word2index, tag2index, batch_size=64,
+                               max_length=398, repeat=True)
+    model.fit_generator(batches, steps_per_epoch=n_sentences // 64, epochs=10)
+"""
+
+import random
+from itertools import islice
+
+import numpy as np
+
+
+def to_categorical(sequences, categories, dtype=np.float32):
+    """
+    One-hot encode a padded ``(n, length)`` matrix of indexes.
+
+    :return: array of shape ``(n, length, categories)``
+    """
+    return np.eye(categories, dtype=dtype)[np.asarray(sequences)]
+
+
+def _index(values, mapping, default):
+    """Map a flat list of strings through ``mapping`` looking up each distinct value once."""
+    if not values:
+        return np.zeros(0, dtype=np.int32)
+    unique, inverse = np.unique(np.array(values, dtype=np.str_), return_inverse=True)
+    ids = np.array([mapping.get(v, default) for v in unique.tolist()], dtype=np.int32)
+    return ids[inverse.reshape(-1)]
+
+
+def encode(sentences, word2index, tag2index, max_length=None):
+    """
+    Convert tagged sentences to padded index matrices.
+
+    Words are lower-cased like at tagging time and unknown words map to
+    ``-OOV-``; unknown tags raise a ``KeyError``. Sentences longer than
+    ``max_length`` are truncated.
+
+    :param sentences: list of sentences of ``(word, tag)`` pairs
+    :param max_length: padded length, defaults to the longest sentence
+    :return: ``(x, y)`` int32 arrays of shape ``(n, max_length)``
+    """
+    sentences = [s[:max_length] if max_length else s for s in sentences]
+    lengths = np.array([len(s) for s in sentences], dtype=np.int64)
+    if max_length is None:
+        max_length = int(lengths.max()) if len(lengths) else 0
+
+    words = [w.lower() for s in sentences for w, _ in s]
+    tags = [t for s in sentences for _, t in s]
+    unknown = set(tags) - set(tag2index)
+    if unknown:
+        raise KeyError('Unknown tags: %s' % ', '.join(sorted(unknown)))
+
+    x = np.zeros((len(sentences), max_length), dtype=np.int32)
+    y = np.zeros((len(sentences), max_length), dtype=np.int32)
+    mask = np.arange(max_length) < lengths[:, None]
+    x[mask] = _index(words, word2index, word2index['-OOV-'])
+    y[mask] = _index(tags, tag2index, 0)
+    return x, y
+
+
+def _buckets(sentences, batch_size, pool_batches, shuffle, rng):
+    # read a pool of sentences, sort it by length and cut it into batches,
+    # so every batch holds sentences of similar length
+    iterator = iter(sentences)
+    while True:
+        pool = list(islice(iterator, batch_size * pool_batches))
+        if not pool:
+            return
+        pool.sort(key=len)
+        chunks = [pool[i:i + batch_size] for i in range(0, len(pool), batch_size)]
+        if shuffle:
+            rng.shuffle(chunks)
+        for chunk in chunks:
+            yield chunk
+
+
+def batches(sentences, word2index, tag2index, batch_size=32, max_length=None,
+            sparse=True, pool_batches=50, shuffle=True, repeat=False, seed=None):
+    """
+    Stream ``(x, y)`` training batches from a tagged corpus.
+
+    Only ``batch_size * pool_batches`` sentences are held in memory at a
+    time. Within that pool sentences are bucketed by length; batches are
+    padded to their longest sentence unless ``max_length`` fixes the
+    width (required for models built with a fixed ``input_length``).
+
+    :param sentences: iterable of sentences of ``(word, tag)`` pairs; must
+                      be re-iterable (e.g. a list or a corpus reader) when
+                      ``repeat`` is set
+    :param sparse: yield integer targets of shape ``(n, length, 1)``
+                   instead of one-hot targets
+    :param repeat: loop over the corpus forever, as ``fit_generator`` expects
+    """
+    if repeat and iter(sentences) is sentences:
+        # a one-shot iterator would be exhausted after the first pass
+        raise TypeError('repeat=True needs a re-iterable corpus, such as a list or a ConlluCorpus, '
+                        'not an iterator.')
+    return _batches(sentences, word2index, tag2index, batch_size, max_length, sparse, pool_batches, shuffle,
+                    repeat, random.Random(seed))
+
+
+def _batches(sentences, word2index, tag2index, batch_size, max_length, sparse, pool_batches, shuffle, repeat, rng):
+    categories = max(tag2index.values()) + 1
+    while True:
+        empty = True
+        for chunk in _buckets(sentences, batch_size, pool_batches, shuffle, rng):
+            empty = False
+            x, y = encode(chunk, word2index, tag2index, max_length)
+            if sparse:
+                yield x, y[:, :, None]
+            else:
+                yield x, to_categorical(y, categories)
+        if not repeat:
+            return
+        if empty:
+            raise ValueError('The corpus has no sentences.')
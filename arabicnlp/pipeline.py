@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Document processing pipelines with content-addressed results.
+
+A :class:`Pipeline` runs named steps (``tokens``, ``stems``, ``tags`` or
+any ``package.module:function``) over documents. Its :attr:`~Pipeline.fingerprint`
+covers everything the results depend on: the package version, the
+source code of the modules implementing the steps (tokenizer tables,
+stemmer rules...) and, for ``tags``, the version and checksums of the
+POS model in the registry. A document's key is a hash of the fingerprint
+and its content, so with a :class:`~arabicnlp.store.ResultStore` only
+new or changed documents are processed, and a rule or model change
+invalidates every stored result::
+
+    pipeline = Pipeline(['tokens', 'stems', 'tags'])
+    store = ResultStore('/var/cache/arabicnlp/results.db', max_bytes=2 ** 30)
+    results = pipeline.process(documents, store)   # one dict per document
+"""
+
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import struct
+import zlib
+from functools import partial
+
+from . import core
+
+STEPS = {
+    'tokens': core.tokens,
+    'stems': core.stems,
+    'tags': core.tags,
+}
+
+# modules whose code the results of a step depend on; the package
+# tokenizer is configured in pos_tagger
+_TOKENIZER = ('arabicnlp.core', 'arabicnlp.models.pos_tagger', 'arabicnlp.preprocessing.tokenizer')
+_SOURCES = {
+    'tokens': _TOKENIZER,
+    'stems': _TOKENIZER + ('arabicnlp.preprocessing.stemmer', 'arabicnlp.preprocessing.script',
+                           'arabicnlp.preprocessing.porter'),
+    # shared holds the NumPy forward pass used when a shared store is
+    # attached; clitics builds its rules from the stemmer's tables
+    'tags': _TOKENIZER + ('arabicnlp.preprocessing.segmenter', 'arabicnlp.preprocessing.clitics',
+                          'arabicnlp.preprocessing.stemmer', 'arabicnlp.models.shared'),
+}
+# models the results of a step depend on
+_MODELS = {
+    'tags': 'pos',
+}
+
+_SEPARATOR = '\x1f'  # a space character, never part of a token
+_LIST, _MAPPING, _JSON = b'L', b'D', b'J'
+_COMPRESS = 256  # records longer than this are compressed
+
+
+def resolve_step(name):
+    """Return the function of a step name, see :data:`STEPS`."""
+    if name in STEPS:
+        return STEPS[name]
+    module, _, function = name.partition(':')
+    if not function:
+        raise ValueError("Unknown step %r, expected one of %s or 'module:function'." % (name, ', '.join(STEPS)))
+    return getattr(importlib.import_module(module), function)
+
+
+def _source_digest(module):
+    with open(inspect.getsourcefile(importlib.import_module(module)), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _model_digest(name, version=None):
+    from .models.registry import MANIFEST, default_registry
+
+    version, directory = default_registry.resolve(name, version)
+    with open(os.path.join(directory, MANIFEST), 'rb') as f:
+        return '%s:%s:%s' % (name, version, hashlib.sha1(f.read()).hexdigest())
+
+
+def fingerprint(steps, version=None):
+    """
+    Return the fingerprint of the results of ``steps``.
+
+    :param version: POS model version used by ``tags``
+    :return: hex digest
+    """
+    from . import __version__
+
+    parts = [__version__]
+    for name in steps:
+        function = resolve_step(name)
+        modules = _SOURCES.get(name, (function.__module__,))
+        parts.append('%s=%s' % (name, ','.join(_source_digest(m) for m in modules)))
+        if name in _MODELS:
+            parts.append(_model_digest(_MODELS[name], version))
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _encode_value(value):
+    # token lists and token -> tag dicts are stored as separated strings,
+    # anything else as JSON
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        joined = _SEPARATOR.join(value)
+        if joined.count(_SEPARATOR) == max(len(value) - 1, 0):
+            return _LIST + struct.pack('<I', len(value)) + joined.encode('utf-8')
+    elif isinstance(value, dict) and all(isinstance(k, str) and isinstance(v, str) for k, v in value.items()):
+        joined = _SEPARATOR.join(s for item in value.items() for s in item)
+        if joined.count(_SEPARATOR) == max(2 * len(value) - 1, 0):
+            return _MAPPING + struct.pack('<I', len(value)) + joined.encode('utf-8')
+    return _JSON + json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def _decode_value(data):
+    kind = data[:1]
+    if kind == _JSON:
+        return json.loads(data[1:].decode('utf-8'))
+    n = struct.unpack('<I', data[1:5])[0]
+    values = data[5:].decode('utf-8').split(_SEPARATOR) if n else []
+    if kind == _LIST:
+        return values
+    return dict(zip(values[::2], values[1::2]))
+
+
+def encode(values):
+    """Encode the results of the steps of one document as compact bytes."""
+    parts = [_encode_value(v) for v in values]
+    data = b''.join(struct.pack('<I', len(p)) + p for p in parts)
+    if len(data) > _COMPRESS:
+        return b'z' + zlib.compress(data, 1)
+    return b'r' + data
+
+
+def decode(data):
+    """Decode bytes made by :func:`encode` into the list of step results."""
+    data = zlib.decompress(data[1:]) if data[:1] == b'z' else data[1:]
+    values = []
+    position = 0
+    while position < len(data):
+        size = struct.unpack_from('<I', data, position)[0]
+        values.append(_decode_value(data[position + 4:position + 4 + size]))
+        position += 4 + size
+    return values
+
+
+class Pipeline():
+    """
+    Named processing steps over documents.
+
+    :param steps: step names, see :data:`STEPS`
+    :param version: POS model version used by ``tags``
+    """
+
+    def __init__(self, steps=('tokens', 'stems', 'tags'), version=None):
+        self.steps = list(steps)
+        self.version = version
+        self.functions = [partial(core.tags, version=version) if name == 'tags' else resolve_step(name)
+                          for name in self.steps]
+        self.fingerprint = fingerprint(self.steps, version)
+        self._prefix = bytes.fromhex(self.fingerprint)
+
+    def key(self, text):
+        """Return the 20 bytes key of the results of ``text``."""
+        return hashlib.sha1(self._prefix + text.encode('utf-8')).digest()
+
+    def run(self, text):
+        """Return the results of every step on ``text`` as a dict."""
+        return {name: function(text) for name, function in zip(self.steps, self.functions)}
+
+    def process(self, texts, store=None):
+        """
+        Return the results of every text, looking them up in ``store`` first.
+
+        Stored results are fetched with one bulk lookup; the other texts
+        are processed and their results stored.
+
+        :param texts: list of strings
+        :param store: :class:`~arabicnlp.store.ResultStore` or ``None``
+        :return: list of dicts, step name -> result
+        """
+        keys = [self.key(text) for text in texts]
+        found = store.get_many(keys) if store is not None else {}
+        results = []
+        computed = {}
+        for text, key in zip(texts, keys):
+            if key in found:
+                results.append(dict(zip(self.steps, decode(found[key]))))
+                continue
+            if key not in computed:
+                computed[key] = self.run(text)
+            results.append(dict(computed[key]))
+        if store is not None and computed:
+            store.put_many(((key, encode([result[name] for name in self.steps])) for key, result in computed.items()),
+                           self.fingerprint)
+        return results
+
+    def __repr__(self):
+        return '<Pipeline %s %s>' % ('+'.join(self.steps), self.fingerprint[:8])
@@ -1 +1,8 @@
-from .stemmer import ArabicStemmer
\ No newline at end of file
+from .stemmer import ArabicStemmer
+from .batch_stemmer import BatchStemmer
+from .script import ScriptStemmer
+from .segmenter import segment
+from .clitics import CliticSegmenter
+from .spelling import SpellChecker
+from .tokenizer import Tokenizer
+from .vocabulary import Vocabulary
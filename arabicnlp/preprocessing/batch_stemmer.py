@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Batch Arabic stemming over code-point matrices.
+
+:class:`BatchStemmer` gives the same stems as :meth:`ArabicStemmer.stem`
+for a whole vocabulary at once. The words are loaded into a padded
+``uint32`` code-point matrix with a start and an end offset per row, and
+every suffix and prefix rule of the stemmer becomes a masked column
+comparison over the rows it applies to: removing a suffix moves the end
+offset, removing a prefix moves the start offset, and nothing is copied
+until the stems are decoded once at the end::
+
+    stemmer = BatchStemmer()
+    stemmer.stem_batch(vocabulary)   # same as [ArabicStemmer().stem(w) for w in vocabulary]
+
+The rule tables and character classes are read from
+:class:`ArabicStemmer`, so both stemmers change together.
+"""
+
+import numpy as np
+
+from .stemmer import ArabicStemmer
+
+_S = '_ArabicStemmer__'
+
+
+def _table(name):
+    return getattr(ArabicStemmer, _S + name)
+
+
+def _codes_of(s):
+    return tuple(ord(c) for c in s)
+
+
+def _char_tables():
+    """
+    Return the ``(dropped, mapped)`` tables of the stemmer normalization
+    over the Basic Multilingual Plane.
+
+    ``dropped`` marks what ``__normalize_pre`` removes (harakat, tatweel,
+    Arabic punctuation); ``mapped`` is the letter each character becomes in
+    ``__normalize_post`` (hamza seats and alef forms), read from the
+    stemmer's own regular expressions.
+    """
+    pre = [_table(name) for name in ('vocalization', 'kasheeda', 'arabic_punctuation_marks')]
+    # the initial hamzat replacement is a subset of the alefat one
+    post = [(_table('waw_hamza'), 'و'), (_table('yeh_hamza'), 'ي'), (_table('alefat'), 'ا')]
+    dropped = np.zeros(0x10000, dtype=bool)
+    mapped = np.arange(0x10000, dtype=np.uint32)
+    for code in range(0x10000):
+        char = chr(code)
+        dropped[code] = any(pattern.match(char) for pattern in pre)
+        for pattern, replacement in post:
+            char = pattern.sub(replacement, char)
+        mapped[code] = ord(char)
+    return dropped, mapped
+
+
+_DROPPED, _MAPPED = _char_tables()
+
+
+def _grouped(suffixes, groups):
+    """Rules ``(suffix, min_length, cut)`` for suffixes whose length condition depends on their group."""
+    rules = []
+    for suffix in suffixes:
+        for group, min_length in groups:
+            if suffix in group:
+                rules.append((_codes_of(suffix), min_length, len(suffix)))
+                break
+    return rules
+
+
+def _build_rules():
+    conjugation_noun = [(_table('conjugation_suffix_noun_%d' % i), i + 3) for i in (1, 2, 3)]
+    conjugation_verb = [(_table('conjugation_suffix_verb_%d' % i), i + 3) for i in (1, 2, 3)]
+    verb_step2a = []
+    for suffix in _table('suffix_verb_step2a'):
+        if suffix == 'ت':
+            min_length = 4
+        elif suffix in _table('conjugation_suffix_verb_4'):
+            min_length = 4
+        elif suffix in _table('conjugation_suffix_verb_past'):
+            min_length = 5
+        elif suffix in _table('conjugation_suffix_verb_present'):
+            min_length = 6
+        else:  # تما
+            min_length = 6
+        verb_step2a.append((_codes_of(suffix), min_length, len(suffix)))
+    prepositions2 = _table('prepositions2')
+    return {
+        'verb_step1': _grouped(_table('suffix_verb_step1'), conjugation_verb),
+        'verb_step2a': verb_step2a,
+        'verb_step2b': [(_codes_of(s), 5, 2) for s in _table('suffix_verb_step2b')],
+        'verb_step2c': [(_codes_of(s), 6 if len(s) == 3 else 4, len(s)) for s in _table('suffix_verb_step2c')],
+        # the single-suffix noun steps iterate over the characters of their
+        # suffix string, and step 2b then cuts two letters
+        'noun_step2c2': [(_codes_of(s), 3, 1) for s in _table('suffix_noun_step2c2')],
+        'noun_step1a': _grouped(_table('suffix_noun_step1a'), conjugation_noun),
+        'noun_step2a': [(_codes_of(s), 5, 1) for s in _table('suffix_noun_step2a')],
+        'noun_step2b': [(_codes_of(s), 5, 2) for s in _table('suffix_noun_step2b')],
+        'noun_step2c1': [(_codes_of(s), 4, 1) for s in _table('suffix_noun_step2c1')],
+        'noun_step1b': [(_codes_of(s), 6, 1) for s in _table('suffix_noun_step1b')],
+        'noun_step3': [(_codes_of(s), 3, 1) for s in _table('suffix_noun_step3')],
+        # أأ أآ أؤ أا أإ keep their second letter; a lone أ is left alone
+        'prefix_step1': [(_codes_of(p), 4, 1) for p in _table('prefix_step1') if len(p) == 2],
+        'prefix_step2a': [(_codes_of(p), 6, len(p)) for p in _table('prefix_step2a')],
+        'prefix_step2b': [(_codes_of(p), 4, len(p)) for p in _table('prefix_step2b')],
+        'prefix_step3a_noun': [(_codes_of(p), 5 if p in _table('articles_2len') else 6, len(p))
+                               for p in _table('prefix_step3a_noun')],
+        # بب كك keep their second letter
+        'prefix_step3b_noun': [(_codes_of(p), 5 if p in _table('prepositions1') else 4,
+                                1 if p in prepositions2 else len(p))
+                               for p in _table('prefix_step3b_noun')],
+        'prefix_step3_verb': [(_codes_of(p), 5, 1) for p in _table('prefix_step3_verb')],
+        'prefix_step4_verb': [(_codes_of(p), 5, 0) for p in _table('prefix_step4_verb')],
+    }
+
+
+_RULES = _build_rules()
+# only the article rules (ال لل) of prefix step 3a count as a success
+_ARTICLE_RULES = np.array([p in _table('articles_2len') for p in _table('prefix_step3a_noun')])
+_PREFIXES1 = [_codes_of(p) for p in _table('prefixes1')]
+_CHECKS1 = [(_codes_of(p), 5 if p in _table('articles_3len') else 4) for p in _table('checks1')]
+_CHECKS2 = [(_codes_of(s), 3 if len(s) == 1 else 4) for s in _table('checks2')]
+_LAST_HAMZAT = np.array([ord(c) for c in _table('last_hamzat')], dtype=np.uint32)
+_HAMZA = ord('ء')
+_ALEF = ord('ا')
+_ALEF_MAQSURA = ord(_table('suffix_all_alef_maqsura'))
+_YEH = ord('ي')
+
+
+class _Batch():
+    """Padded code-point matrix of a batch of words with per-row start and end offsets."""
+
+    def __init__(self, flat, width, starts, ends):
+        self.flat = flat
+        self.width = width
+        self.starts = starts
+        self.ends = ends
+
+    def ends_with(self, rows, suffix):
+        ends = self.ends[rows]
+        result = ends - self.starts[rows] >= len(suffix)
+        last = rows * self.width + ends - 1
+        for k, code in enumerate(reversed(suffix)):
+            result &= self.flat[np.maximum(last - k, 0)] == code
+        return result
+
+    def starts_with(self, rows, prefix):
+        starts = self.starts[rows]
+        result = self.ends[rows] - starts >= len(prefix)
+        first = rows * self.width + starts
+        for k, code in enumerate(prefix):
+            result &= self.flat[np.minimum(first + k, len(self.flat) - 1)] == code
+        return result
+
+    def apply(self, rows, rules, prefix=False, unless=()):
+        """
+        Apply to every row the first rule ``(affix, min_length, cut)`` it
+        matches, like the loops of :class:`ArabicStemmer` that ``break``
+        after the first change.
+
+        :param unless: prefixes of rows a rule does not apply to
+        :return: index of the rule applied to every row, -1 for none
+        """
+        which = np.full(len(rows), -1, dtype=np.int64)
+        lengths = self.ends[rows] - self.starts[rows]
+        # only rows whose first (last) letter starts (ends) one of the rules
+        # are tested any further
+        edges = np.array(sorted({affix[0] if prefix else affix[-1] for affix, _, _ in rules}), dtype=np.uint32)
+        positions = rows * self.width + (self.starts[rows] if prefix else self.ends[rows] - 1)
+        candidates = lengths >= min(min_length for _, min_length, _ in rules)
+        candidates &= np.isin(self.flat[np.clip(positions, 0, len(self.flat) - 1)], edges)
+        pending = np.flatnonzero(candidates)
+        test = self.starts_with if prefix else self.ends_with
+        for i, (affix, min_length, cut) in enumerate(rules):
+            if not len(pending):
+                break
+            subset = rows[pending]
+            match = (lengths[pending] >= min_length) & test(subset, affix)
+            for other in unless:
+                match &= ~self.starts_with(subset, other)
+            hit = pending[match]
+            if prefix:
+                self.starts[rows[hit]] += cut
+            else:
+                self.ends[rows[hit]] -= cut
+            which[hit] = i
+            pending = pending[~match]
+        return which
+
+
+class BatchStemmer():
+    """
+    Vectorized :class:`ArabicStemmer` for large batches of words.
+
+    :param chunk_size: number of words stemmed at a time, which bounds
+                       the size of the code-point matrix
+    :param max_width: words longer than this are stemmed one at a time
+                      with :class:`ArabicStemmer` instead of widening the
+                      matrix of the whole chunk
+    """
+
+    def __init__(self, chunk_size=2 ** 16, max_width=32):
+        self.chunk_size = chunk_size
+        self.max_width = max_width
+        self._stemmer = ArabicStemmer()
+
+    def stem(self, word):
+        return self.stem_batch([word])[0]
+
+    def stem_batch(self, words):
+        """Stem a list of words."""
+        words = list(words)
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        long = np.flatnonzero(lengths > self.max_width).tolist()
+        if long:
+            short = np.flatnonzero(lengths <= self.max_width)
+            stems = self.stem_batch([words[i] for i in short.tolist()])
+            result = [None] * len(words)
+            for i, stem in zip(short.tolist(), stems):
+                result[i] = stem
+            for i in long:
+                result[i] = self._stemmer.stem(words[i])
+            return result
+        result = []
+        for start in range(0, len(words), self.chunk_size):
+            end = start + self.chunk_size
+            result.extend(self._stem_chunk(words[start:end], lengths[start:end]))
+        return result
+
+    def _stem_chunk(self, words, lengths):
+        flat, width = _encode(words, lengths)
+        n = len(words)
+        rows = np.arange(n)
+        batch = _Batch(flat, width, np.zeros(n, dtype=np.int64), lengths.copy())
+
+        # the word type is guessed on the word before normalization
+        is_noun = np.ones(n, dtype=bool)
+        is_defined = np.zeros(n, dtype=bool)
+        for prefix, min_length in _CHECKS1:
+            is_defined |= (lengths >= min_length) & batch.starts_with(rows, prefix)
+        is_noun_suffix = np.zeros(n, dtype=bool)
+        for suffix, min_length in _CHECKS2:
+            is_noun_suffix |= (lengths >= min_length) & batch.ends_with(rows, suffix)
+        is_verb = ~(is_defined | is_noun_suffix)
+
+        batch = _normalize_pre(batch)
+        self._suffixes(batch, is_verb, is_noun, is_defined)
+        self._prefixes(batch, is_verb, is_noun)
+        return _decode(_normalize_post(batch))
+
+    def _suffixes(self, batch, is_verb, is_noun, is_defined):
+        rules = _RULES
+        verbs = np.flatnonzero(is_verb)
+        step1 = batch.apply(verbs, rules['verb_step1']) >= 0
+        conjugated = verbs[step1]
+        step2a = batch.apply(conjugated, rules['verb_step2a']) >= 0
+        batch.apply(conjugated[~step2a], rules['verb_step2c'])
+        plain = verbs[~step1]
+        step2b = batch.apply(plain, rules['verb_step2b']) >= 0
+        batch.apply(plain[~step2b], rules['verb_step2a'])
+
+        nouns = np.flatnonzero(is_noun)
+        step2c2 = batch.apply(nouns, rules['noun_step2c2']) >= 0
+        rest = nouns[~step2c2]
+        undefined = rest[~is_defined[rest]]
+        batch.apply(undefined, rules['noun_step1a'])
+        self._noun_step2(batch, undefined)
+        defined = rest[is_defined[rest]]
+        step1b = batch.apply(defined, rules['noun_step1b']) >= 0
+        self._noun_step2(batch, defined[step1b])
+        # the remaining rows are all defined, which skips step 2a
+        batch.apply(defined[~step1b], rules['noun_step2b'])
+        batch.apply(nouns, rules['noun_step3'])
+
+        verbs_only = np.flatnonzero(~is_noun & is_verb)
+        hit = verbs_only[batch.ends_with(verbs_only, (_ALEF_MAQSURA,))]
+        batch.flat[hit * batch.width + batch.ends[hit] - 1] = _YEH
+
+    def _noun_step2(self, batch, rows):
+        step2a = batch.apply(rows, _RULES['noun_step2a']) >= 0
+        step2b = np.zeros(len(rows), dtype=bool)
+        step2b[~step2a] = batch.apply(rows[~step2a], _RULES['noun_step2b']) >= 0
+        batch.apply(rows[~step2a & ~step2b], _RULES['noun_step2c1'])
+
+    def _prefixes(self, batch, is_verb, is_noun):
+        rules = _RULES
+        rows = np.arange(len(batch.starts))
+        batch.apply(rows, rules['prefix_step1'], prefix=True)
+        step2a = batch.apply(rows, rules['prefix_step2a'], prefix=True) >= 0
+        batch.apply(rows[~step2a], rules['prefix_step2b'], prefix=True, unless=_PREFIXES1)
+        step3a = batch.apply(rows, rules['prefix_step3a_noun'], prefix=True)
+        step3a = (step3a >= 0) & _ARTICLE_RULES[step3a]
+        nouns = rows[~step3a & is_noun]
+        batch.apply(nouns, rules['prefix_step3b_noun'], prefix=True)
+        verbs = rows[(step3a | ~is_noun) & is_verb]
+        batch.apply(verbs, rules['prefix_step3_verb'], prefix=True)
+        step4 = verbs[batch.apply(verbs, rules['prefix_step4_verb'], prefix=True) >= 0]
+        # يست نست تست become است
+        batch.flat[step4 * batch.width + batch.starts[step4]] = _ALEF
+
+    def __repr__(self):
+        return '<BatchStemmer>'
+
+
+def _encode(words, lengths):
+    """Return the flat padded code-point matrix of ``words`` and its width."""
+    width = max(int(lengths.max()) if len(words) else 0, 1)
+    codes = np.frombuffer(''.join(words).encode('utf-32-le'), dtype=np.uint32)
+    flat = np.zeros(len(words) * width, dtype=np.uint32)
+    offsets = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(words)) * width - offsets, lengths)
+    flat[rows + np.arange(len(codes))] = codes
+    return flat, width
+
+
+def _normalize_pre(batch):
+    """Drop harakat, tatweel and Arabic punctuation, packing the rows that had any to the left."""
+    width = batch.width
+    matrix = batch.flat.reshape(-1, width)
+    dropped = _DROPPED[np.minimum(matrix, 0xffff)] & (matrix < 0x10000)
+    rows = np.flatnonzero(dropped.any(axis=1))
+    if not len(rows):
+        return batch
+    keep = ~dropped[rows] & (np.arange(width) < batch.ends[rows, None])
+    packed = np.zeros((len(rows), width), dtype=matrix.dtype)
+    columns = np.cumsum(keep, axis=1) - 1
+    packed[np.nonzero(keep)[0], columns[keep]] = matrix[rows][keep]
+    matrix[rows] = packed
+    batch.ends[rows] = keep.sum(axis=1)
+    return batch
+
+
+def _normalize_post(batch):
+    """Turn a final hamza seat into ``ء``, then unify the remaining hamza seats and alef forms."""
+    rows = np.arange(len(batch.starts))
+    nonempty = rows[batch.ends > batch.starts]
+    last = nonempty * batch.width + batch.ends[nonempty] - 1
+    last = last[np.isin(batch.flat[last], _LAST_HAMZAT)]
+    batch.flat[last] = _HAMZA
+    flat = batch.flat
+    batch.flat = np.where(flat < 0x10000, _MAPPED[np.minimum(flat, 0xffff)], flat)
+    return batch
+
+
+def _decode(batch):
+    """Return the ``starts:ends`` slice of every row as a string."""
+    columns = np.arange(batch.width)
+    inside = (columns >= batch.starts[:, None]) & (columns < batch.ends[:, None])
+    codes = batch.flat.reshape(-1, batch.width)[inside]
+    lengths = batch.ends - batch.starts
+    if len(lengths) and not (codes == 0).any():
+        # stems joined by NUL characters, split in one call
+        joined = np.zeros(len(codes) + len(lengths) - 1, dtype='<u4')
+        joined[np.arange(len(codes)) + np.repeat(np.arange(len(lengths)), lengths)] = codes
+        return joined.tobytes().decode('utf-32-le').split('\x00')
+    text = codes.astype('<u4').tobytes().decode('utf-32-le')
+    offsets = np.concatenate(([0], np.cumsum(lengths))).tolist()
+    return [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Clitic segmentation against a vocabulary.
+
+The tagger vocabulary holds surface forms, so agglutinated words such as
+``والمعلومات`` or ``بالمدرسة`` are out of vocabulary even when
+``المعلومات`` and ``المدرسة`` are known. :class:`CliticSegmenter` splits
+the conjunctions, prepositions and article that the
+:class:`~arabicnlp.preprocessing.ArabicStemmer` strips (its ``فال``/``وال``,
+``ك``/``ل``/``ب`` and ``ال``/``لل`` prefix tables) into separate tokens,
+but only for unknown words and only when what remains is a known word::
+
+    segmenter = CliticSegmenter(vocabulary)
+    segmenter.split(['والمعلومات', 'وقت', 'للمدرسة'])
+    # ['و', 'المعلومات', 'وقت', 'ل', 'المدرسة']
+
+Candidate splits of all the unknown words of a batch are looked up in
+the sorted vocabulary with a single search.
+"""
+
+import numpy as np
+
+from .stemmer import ArabicStemmer
+
+# the prefix tables of the stemmer, without their name mangling
+_ARTICLES = ArabicStemmer._ArabicStemmer__articles_2len  # ال لل
+_DEFINITE, _ELIDED = _ARTICLES
+# فال وال: a conjunction in front of the article
+CONJUNCTIONS = tuple(p[:-len(_DEFINITE)] for p in ArabicStemmer._ArabicStemmer__prefix_step2a)
+# ك ل, and the ب of بال
+PREPOSITIONS = ArabicStemmer._ArabicStemmer__prepositions1 + tuple(
+    p[:-len(_DEFINITE)] for p in ArabicStemmer._ArabicStemmer__articles_3len
+    if p[:-len(_DEFINITE)] not in ArabicStemmer._ArabicStemmer__prepositions1)
+
+
+def _build_rules():
+    """
+    Return the splits of every clitic prefix, keyed by the prefix, as
+    ``(order, pieces, restored)``: the clitic pieces, and the letters to
+    put back in front of the remainder.
+    """
+    rules = {}
+    order = 0
+    for conjunction in ('',) + CONJUNCTIONS:
+        for preposition in ('',) + PREPOSITIONS:
+            pieces = []
+            for clitic in (conjunction, preposition):
+                if clitic:
+                    start = pieces[-1][2] if pieces else 0
+                    pieces.append((clitic, start, start + len(clitic)))
+            prefix = conjunction + preposition
+            splits = [(prefix, pieces, '')] if pieces else []
+            if preposition == _ELIDED[0]:
+                # لل is ل in front of an article that lost its alef
+                splits.append((prefix + _ELIDED[1:], pieces, _DEFINITE[:-1]))
+            else:
+                end = len(prefix) + len(_DEFINITE)
+                splits.append((prefix + _DEFINITE, pieces + [(_DEFINITE, len(prefix), end)], ''))
+            for surface, split, restored in splits:
+                rules.setdefault(surface, []).append(((len(split), order), split, restored))
+                order += 1
+    return rules
+
+
+_RULES = _build_rules()
+_LONGEST = max(len(prefix) for prefix in _RULES)
+
+
+class CliticSegmenter():
+    """
+    Split proclitics from the words a vocabulary does not know.
+
+    :param vocabulary: iterable of known words
+    :param min_stem: shortest remainder of a split
+    """
+
+    def __init__(self, vocabulary, min_stem=2):
+        self.words = np.unique(np.array(list(vocabulary), dtype=np.str_))
+        self.min_stem = min_stem
+
+    def known(self, words):
+        """Return a boolean array telling which of ``words`` are in the vocabulary."""
+        words = np.array(words, dtype=np.str_)
+        if not len(self.words) or not len(words):
+            return np.zeros(len(words), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.words, words), len(self.words) - 1)
+        return self.words[positions] == words
+
+    def _candidates(self, word):
+        """
+        Return the possible splits of ``word``, fewest pieces first, as
+        lists of ``(form, start, end)``; the last piece is the remainder.
+        """
+        found = []
+        for length in range(1, min(_LONGEST, len(word) - self.min_stem) + 1):
+            for order, pieces, restored in _RULES.get(word[:length], ()):
+                # with a restored article, the remainder starts with the ل of the elided article
+                cut = length - 1 if restored else length
+                found.append((order, pieces + [(restored + word[cut:], cut, len(word))]))
+        found.sort()
+        return [pieces for _, pieces in found]
+
+    def analyze(self, words):
+        """
+        Return the pieces of every word as a list of ``(form, start, end)``,
+        with character offsets in the word.
+
+        Known words, and words without a split into a known remainder, are
+        a single piece. Every distinct unknown word is looked up once.
+        """
+        result = [[(w, 0, len(w))] for w in words]
+        distinct = sorted(set(words))
+        unknown = [w for w, k in zip(distinct, self.known(distinct).tolist()) if not k]
+        candidates = []
+        owners = []
+        for word in unknown:
+            for pieces in self._candidates(word):
+                candidates.append(pieces)
+                owners.append(word)
+        known = self.known([pieces[-1][0] for pieces in candidates]).tolist()
+        splits = {}
+        for word, pieces, is_known in zip(owners, candidates, known):
+            if is_known and word not in splits:
+                splits[word] = pieces
+        for i, word in enumerate(words):
+            if word in splits:
+                result[i] = splits[word]
+        return result
+
+    def split(self, words):
+        """Return ``words`` with the clitics split into separate tokens."""
+        return [form for pieces in self.analyze(words) for form, _, _ in pieces]
+
+    def split_batch(self, word_lists):
+        """Split a list of word lists, looking up every distinct word of the batch once."""
+        flat = [w for words in word_lists for w in words]
+        pieces = self.analyze(flat)
+        result = []
+        position = 0
+        for words in word_lists:
+            result.append([form for p in pieces[position:position + len(words)] for form, _, _ in p])
+            position += len(words)
+        return result
+
+    def report(self, words):
+        """
+        Measure the effect of the segmentation on the out-of-vocabulary rate.
+
+        :return: dict with the number of tokens, of out-of-vocabulary
+                 tokens and the out-of-vocabulary rate before and after
+                 splitting (``tokens_before``, ``oov_after``,
+                 ``oov_rate_after``...) and the number of ``split`` words
+        """
+        words = list(words)
+        pieces = self.analyze(words)
+        after = [form for p in pieces for form, _, _ in p]
+        oov_before = int(len(words) - self.known(words).sum())
+        oov_after = int(len(after) - self.known(after).sum())
+        return {
+            'tokens_before': len(words),
+            'tokens_after': len(after),
+            'oov_before': oov_before,
+            'oov_after': oov_after,
+            'oov_rate_before': oov_before / len(words) if words else 0.0,
+            'oov_rate_after': oov_after / len(after) if after else 0.0,
+            'split': sum(len(p) > 1 for p in pieces),
+        }
+
+    def __repr__(self):
+        return '<CliticSegmenter %d words>' % len(self.words)
@@ -90,6 +90,34 @@ available from <http://nltk.sourceforge.net>
 """
 
 
+from functools import lru_cache
+
+_VOWELS = frozenset('aeiou')
+
+
+@lru_cache(maxsize=4096)
+def _cv_pattern(word):
+    """
+    Return the consonant/vowel pattern of ``word`` as a string of 'c' and 'v'.
+
+    'y' is a consonant at the start of the word or after a vowel, and a
+    vowel after a consonant. Every letter only depends on the letters
+    before it, so the pattern of a prefix of ``word`` is the same prefix
+    of its pattern; the stemming steps query it many times per word.
+    """
+    pattern = []
+    cons = True
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            cons = False
+        elif ch == 'y':
+            cons = i == 0 or not cons
+        else:
+            cons = True
+        pattern.append('c' if cons else 'v')
+    return ''.join(pattern)
+
+
 ## --NLTK--
 ## Declare this module's documentation format.
 
@@ -160,14 +188,7 @@ class PorterStemmer():
 
     def _cons(self, word, i):
         """cons(i) is TRUE <=> b[i] is a consonant."""
-        if word[i] in self.vowels:
-            return False
-        if word[i] == 'y':
-            if i == 0:
-                return True
-            else:
-                return (not self._cons(word, i - 1))
-        return True
+        return _cv_pattern(word)[i] == 'c'
 
     def _m(self, word, j):
         """m() measures the number of consonant sequences between k0 and j.
@@ -179,41 +200,16 @@ class PorterStemmer():
            <c>vcvc<v>   gives 2
            <c>vcvcvc<v> gives 3
            ....
+
+        i.e. the number of vowel -> consonant transitions in b[0..j].
         """
-        n = 0
-        i = 0
-        while True:
-            if i > j:
-                return n
-            if not self._cons(word, i):
-                break
-            i = i + 1
-        i = i + 1
-
-        while True:
-            while True:
-                if i > j:
-                    return n
-                if self._cons(word, i):
-                    break
-                i = i + 1
-            i = i + 1
-            n = n + 1
-
-            while True:
-                if i > j:
-                    return n
-                if not self._cons(word, i):
-                    break
-                i = i + 1
-            i = i + 1
+        if j < 0:
+            return 0
+        return _cv_pattern(word)[:j + 1].count('vc')
 
     def _vowelinstem(self, stem):
         """vowelinstem(stem) is TRUE <=> stem contains a vowel"""
-        for i in range(len(stem)):
-            if not self._cons(stem, i):
-                return True
-        return False
+        return 'v' in _cv_pattern(stem)
 
     def _doublec(self, word):
         """doublec(word) is TRUE <=> word ends with a double consonant"""
@@ -221,7 +217,7 @@ class PorterStemmer():
             return False
         if (word[-1] != word[-2]):
             return False
-        return self._cons(word, len(word)-1)
+        return _cv_pattern(word)[-1] == 'c'
 
     def _cvc(self, word, i):
         """cvc(i) is TRUE <=>
@@ -237,8 +233,9 @@ class PorterStemmer():
                snow, box, tray.
         """
         if i == 0: return False  # i == 0 never happens perhaps
-        if i == 1: return (not self._cons(word, 0) and self._cons(word, 1))
-        if not self._cons(word, i) or self._cons(word, i-1) or not self._cons(word, i-2): return False
+        cv = _cv_pattern(word)
+        if i == 1: return cv[0] == 'v' and cv[1] == 'c'
+        if cv[i] != 'c' or cv[i-1] == 'c' or cv[i-2] != 'c': return False
 
         ch = word[i]
         if ch == 'w' or ch == 'x' or ch == 'y':
@@ -594,15 +591,11 @@ class PorterStemmer():
 
     def _adjust_case(self, word, stem):
         lower = word.lower()
+        if word == lower:
+            # nothing to restore, the stem is already in the word's case
+            return stem
 
-        ret = ""
-        for x in range(len(stem)):
-            if lower[x] == stem[x]:
-                ret += word[x]
-            else:
-                ret += stem[x]
-
-        return ret
+        return ''.join([w if l == s else s for w, l, s in zip(word, lower, stem)])
 
     ## --NLTK--
     ## Don't use this procedure; we want to work with individual
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Script-aware stemming for mixed Arabic/Latin text.
+
+Every token is classified by the script of its first letter using a
+precomputed table over the Basic Multilingual Plane, then Arabic tokens
+go to :class:`ArabicStemmer`, Latin tokens to :class:`PorterStemmer`, and
+digits, punctuation and anything else pass through untouched.
+"""
+
+from functools import lru_cache
+
+from .porter import PorterStemmer
+from .stemmer import ArabicStemmer
+
+OTHER = 0
+ARABIC = 1
+LATIN = 2
+DIGIT = 3
+PUNCTUATION = 4
+
+_RANGES = (
+    (ARABIC, 0x0621, 0x065F),  # letters and harakat
+    (ARABIC, 0x066E, 0x06D3),
+    (ARABIC, 0x06D5, 0x06DC),
+    (ARABIC, 0x06DF, 0x06E8),
+    (ARABIC, 0x06EA, 0x06EF),
+    (ARABIC, 0x06FA, 0x06FF),
+    (ARABIC, 0x0750, 0x077F),  # Arabic Supplement
+    (ARABIC, 0x08A0, 0x08FF),  # Arabic Extended-A
+    (ARABIC, 0xFB50, 0xFDFF),  # presentation forms A
+    (ARABIC, 0xFE70, 0xFEFF),  # presentation forms B
+    (LATIN, 0x0041, 0x005A),
+    (LATIN, 0x0061, 0x007A),
+    (LATIN, 0x00C0, 0x024F),  # Latin-1 letters and Latin Extended-A/B
+    (DIGIT, 0x0030, 0x0039),
+    (DIGIT, 0x0660, 0x0669),  # Arabic-Indic digits
+    (DIGIT, 0x06F0, 0x06F9),  # Extended Arabic-Indic digits
+    (PUNCTUATION, 0x0021, 0x002F),
+    (PUNCTUATION, 0x003A, 0x0040),
+    (PUNCTUATION, 0x005B, 0x0060),
+    (PUNCTUATION, 0x007B, 0x007E),
+    (PUNCTUATION, 0x00A1, 0x00BF),
+    (PUNCTUATION, 0x060C, 0x060D),  # ، ؍
+    (PUNCTUATION, 0x061B, 0x061F),  # ؛ ؟
+    (PUNCTUATION, 0x066A, 0x066D),  # ٪ ٫ ٬ ٭
+    (PUNCTUATION, 0x06D4, 0x06D4),  # ۔
+    (PUNCTUATION, 0x2010, 0x205E),  # general punctuation
+)
+
+
+def _build_table():
+    table = bytearray(0x10000)
+    for script, first, last in _RANGES:
+        table[first:last + 1] = bytes([script]) * (last - first + 1)
+    # × and ÷ sit inside the Latin-1 letter block
+    table[0x00D7] = table[0x00F7] = PUNCTUATION
+    return bytes(table)
+
+
+SCRIPT_TABLE = _build_table()
+
+
+def script_of(token):
+    """
+    Return the script class of ``token``.
+
+    The first Arabic or Latin letter decides; tokens without letters are
+    classified by their first character.
+    """
+    table = SCRIPT_TABLE
+    first = None
+    for ch in token:
+        code = ord(ch)
+        script = table[code] if code < 0x10000 else OTHER
+        if script == ARABIC or script == LATIN:
+            return script
+        if first is None:
+            first = script
+    return OTHER if first is None else first
+
+
+class MemoizedStemmer():
+    """
+    Bounded LRU cache in front of a stemmer's ``stem`` method.
+
+    Stems are pure functions of the word, and vocabularies are heavily
+    skewed, so most calls are answered from the cache.
+    """
+
+    def __init__(self, stemmer, max_size=2 ** 18):
+        self.stemmer = stemmer
+        self.stem = lru_cache(maxsize=max_size)(stemmer.stem)
+
+    def stem_batch(self, words):
+        """Stem a list of words, stemming every distinct word once."""
+        stem = self.stem
+        stems = {w: stem(w) for w in set(words)}
+        return [stems[w] for w in words]
+
+    def cache_info(self):
+        return self.stem.cache_info()
+
+    def __repr__(self):
+        return '<MemoizedStemmer %r>' % self.stemmer
+
+
+class ScriptStemmer():
+    """
+    Dispatch tokens to the stemmer of their script.
+
+    :param arabic: stemmer for Arabic tokens, defaults to :class:`ArabicStemmer`
+    :param latin: stemmer for Latin tokens, defaults to :class:`PorterStemmer`
+    :param cache_size: size of the per-script stem caches
+    """
+
+    def __init__(self, arabic=None, latin=None, cache_size=2 ** 18):
+        self.stemmers = {
+            ARABIC: MemoizedStemmer(arabic or ArabicStemmer(), cache_size),
+            LATIN: MemoizedStemmer(latin or PorterStemmer(), cache_size),
+        }
+
+    def stem(self, token):
+        stemmer = self.stemmers.get(script_of(token))
+        return token if stemmer is None else stemmer.stem(token)
+
+    def stem_batch(self, tokens):
+        """
+        Stem a list of tokens.
+
+        Every distinct token is classified and stemmed once, however many
+        times it occurs in ``tokens``.
+        """
+        stems = {}
+        for token in set(tokens):
+            stemmer = self.stemmers.get(script_of(token))
+            stems[token] = token if stemmer is None else stemmer.stem(token)
+        return [stems[t] for t in tokens]
+
+    def __repr__(self):
+        return '<ScriptStemmer>'
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Sentence and segment splitting of token streams.
+
+Long documents are cut into segments no longer than the tagger's input
+length so that every token gets tagged and the documents can be tagged
+as a batch of short sequences instead of one huge one.
+"""
+
+# . ؟ ? !
+SENTENCE_ENDS = frozenset('.؟?!')
+
+# ، ؛ , ;
+CLAUSE_ENDS = frozenset('،؛,;')
+
+
+def _ends_with(token, marks):
+    return not token[:1].isalnum() and any(ch in marks for ch in token)
+
+
+def _ends_sentence(tokens, i):
+    if not _ends_with(tokens[i], SENTENCE_ENDS):
+        return False
+    # a decimal point tokenized apart from its number: 4 . 54
+    return not (tokens[i] == '.' and 0 < i < len(tokens) - 1
+                and tokens[i - 1][-1:].isdigit() and tokens[i + 1][:1].isdigit())
+
+
+def segment(tokens, max_length=398):
+    """
+    Split ``tokens`` into consecutive segments of at most ``max_length`` tokens.
+
+    Tokens that fit in ``max_length`` are a single segment, so the tagger
+    sees the context across sentences. Longer token lists are cut into
+    segments ending after sentence punctuation (a ``.`` between digits is
+    a decimal point, not the end of a sentence). Sentences longer than
+    ``max_length`` are cut after their last clause mark (``،`` ``؛``) that
+    fits, and cut hard at ``max_length`` when there is none. No token is
+    ever dropped: the segments always cover ``tokens`` exactly.
+
+    :param tokens: list of tokens
+    :param max_length: maximum number of tokens in a segment
+    :return: list of ``(start, end)`` token index pairs
+    """
+    if max_length < 1:
+        raise ValueError('max_length must be positive')
+
+    n = len(tokens)
+    if n <= max_length:
+        return [(0, n)] if n else []
+    spans = []
+    start = 0
+    last_clause = None
+    for i, token in enumerate(tokens):
+        if _ends_sentence(tokens, i):
+            spans.append((start, i + 1))
+            start, last_clause = i + 1, None
+            continue
+        if _ends_with(token, CLAUSE_ENDS):
+            last_clause = i + 1
+        if i + 1 - start == max_length and i + 1 < n:
+            cut = last_clause if last_clause is not None and last_clause > start else i + 1
+            spans.append((start, cut))
+            start, last_clause = cut, None
+    if start < n:
+        spans.append((start, n))
+    return spans
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Spelling correction with a symmetric-delete index.
+
+Every vocabulary word is stored under all the strings obtained by deleting
+up to ``max_distance`` of its letters. A misspelled word is looked up by
+its own deletes: any vocabulary word within ``max_distance`` edits shares
+at least one of them, so candidates are found with a handful of lookups
+whatever the size of the vocabulary, and only those candidates are
+checked with a real edit distance.
+
+Two cheap pre-passes run before the lookup: runs of three or more
+identical letters are squeezed (``تتتتوصية`` → ``توصية``), and words are
+indexed by a key in which the hamza seats and alef forms are unified, so
+``املاءية`` and ``املائية`` are the same key.
+
+The index is a set of ``.npy`` arrays (sorted words, counts, sorted
+delete hashes with the word and number of deletions of each) that :meth:`SpellChecker.load`
+memory-maps, so worker processes share a single copy::
+
+    checker = SpellChecker.from_corpus(articles)
+    checker.correct('ذهبت الى المدرسسسسة')
+    checker.save('/data/spelling')
+"""
+
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from .script import ARABIC, script_of
+
+_META = 'meta.json'
+_FORMAT = 1
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# three or more repetitions of the same letter
+_REPEATS_RE = re.compile(r'(\w)\1{2,}', re.UNICODE)
+
+_HAMZA = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'ء', 'ئ': 'ء',
+    'ى': 'ي',
+    'ـ': None,  # tatweel
+})
+_HAMZA.update((code, None) for code in range(0x064B, 0x0653))  # harakat
+
+
+def squeeze(word, keep=1):
+    """Collapse runs of three or more identical letters to ``keep`` letters."""
+    return _REPEATS_RE.sub(lambda m: m.group(1) * keep, word)
+
+
+def normalize(word):
+    """Return the index key of ``word``: hamza seats, alef forms and ``ى`` unified, harakat removed."""
+    return word.translate(_HAMZA)
+
+
+def deletes(word, max_distance):
+    """
+    Return ``word`` and every string obtained by deleting up to
+    ``max_distance`` letters, mapped to the fewest deletions producing it.
+    """
+    result = {word: 0}
+    edge = {word}
+    for level in range(1, max_distance + 1):
+        edge = {w[:i] + w[i + 1:] for w in edge for i in range(len(w))}.difference(result)
+        result.update(dict.fromkeys(edge, level))
+    return result
+
+
+def _hash(s):
+    return zlib.crc32(s.encode('utf-8'))
+
+
+def distance(a, b, limit=None):
+    """
+    Optimal string alignment distance (Levenshtein plus transpositions).
+
+    :param limit: stop early and return ``limit + 1`` once the distance
+                  is known to exceed ``limit``
+    """
+    # a shared prefix or suffix never changes the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return len(a) + len(b)
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(row[j] + 1, current[j - 1] + 1, row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous, row = row, current
+    return row[-1]
+
+
+class SpellChecker():
+    """
+    Symmetric-delete spelling corrector.
+
+    :param words: vocabulary
+    :param counts: frequency of each word, used to break ties; all words
+                   are equally likely by default
+    :param max_distance: maximum number of edits of a correction
+    """
+
+    def __init__(self, words, counts=None, max_distance=2):
+        words = np.array(list(words), dtype=np.str_)
+        counts = np.ones(len(words), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        order = np.argsort(words, kind='mergesort')
+        self.max_distance = max_distance
+        self.words = words[order]
+        self.counts = counts[order]
+        self.lengths = np.char.str_len(self.words)
+        keys = []
+        ids = []
+        levels = []
+        for i, word in enumerate(self.words.tolist()):
+            found = deletes(normalize(word), max_distance)
+            keys.extend(_hash(d) for d in found)
+            levels.extend(found.values())
+            ids.extend([i] * len(found))
+        keys = np.array(keys, dtype=np.uint32)
+        order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[order]
+        self.ids = np.array(ids, dtype=np.int32)[order]
+        self.levels = np.array(levels, dtype=np.uint8)[order]
+
+    @classmethod
+    def from_corpus(cls, texts, min_count=1, max_distance=2):
+        """Build a checker from the words of an iterable of texts, weighted by their frequency."""
+        counter = Counter()
+        for text in texts:
+            counter.update(_WORD_RE.findall(text))
+        words = [w for w, c in counter.items() if c >= min_count]
+        return cls(words, [counter[w] for w in words], max_distance)
+
+    @classmethod
+    def from_word2index(cls, filename, max_distance=2):
+        """Build a checker from the vocabulary of a pickled ``word2index`` mapping."""
+        with open(filename, 'rb') as f:
+            word2index = pickle.load(f)
+        return cls([w for w in word2index if not w.startswith('-')], max_distance=max_distance)
+
+    def known(self, words):
+        """Return a boolean array telling which of ``words`` are in the vocabulary."""
+        words = np.array(words, dtype=np.str_)
+        if not len(self.words) or not len(words):
+            return np.zeros(len(words), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.words, words), len(self.words) - 1)
+        return self.words[positions] == words
+
+    def _limit(self, word):
+        # short words have too many neighbours to be corrected reliably
+        return min(self.max_distance, (len(word) - 1) // 2)
+
+    def _candidates(self, queries):
+        """
+        Return the candidates of every query key as ``(ids, bounds)`` arrays,
+        with a single search over the index.
+
+        A word reached through ``k`` deletions of the query and ``m``
+        deletions of the word is at least ``max(k, m)`` edits away.
+        """
+        hashes = []
+        query_levels = []
+        owners = []
+        for n, query in enumerate(queries):
+            found = deletes(query, self._limit(query))
+            hashes.extend(_hash(d) for d in found)
+            query_levels.extend(found.values())
+            owners.extend([n] * len(found))
+        hashes = np.array(hashes, dtype=np.uint32)
+        lo = np.searchsorted(self.keys, hashes, side='left')
+        sizes = np.searchsorted(self.keys, hashes, side='right') - lo
+        # positions of all the matching entries, grouped by query delete
+        matches = np.repeat(lo - np.concatenate(([0], np.cumsum(sizes)[:-1])), sizes) + np.arange(sizes.sum())
+        ids = self.ids[matches]
+        bounds = np.maximum(self.levels[matches], np.repeat(np.array(query_levels, dtype=np.uint8), sizes))
+        owners = np.repeat(np.array(owners, dtype=np.int64), sizes)
+        # group by query, then by increasing bound
+        order = np.lexsort((bounds, owners))
+        splits = np.searchsorted(owners[order], np.arange(1, len(queries)))
+        return list(zip(np.split(ids[order], splits), np.split(bounds[order], splits)))
+
+    def _best(self, word, ids, bounds):
+        key = normalize(word)
+        limit = self._limit(key)
+        best, best_rank = word, None
+        seen = set()
+        for i, bound in zip(ids.tolist(), bounds.tolist()):
+            if bound > limit:
+                break
+            if i in seen or abs(int(self.lengths[i]) - len(key)) > limit:
+                continue
+            seen.add(i)
+            candidate = str(self.words[i])
+            d = distance(key, normalize(candidate), limit)
+            if d > limit:
+                continue
+            rank = (d, distance(word, candidate), -int(self.counts[i]), candidate)
+            if best_rank is None or rank < best_rank:
+                # worse candidates need not be looked at any more
+                best, best_rank, limit = candidate, rank, d
+        return best
+
+    def correct_words(self, words):
+        """
+        Correct a list of words.
+
+        Known words are returned unchanged, and every distinct unknown word
+        is corrected once. Words without Arabic letters are left alone.
+        """
+        distinct = sorted(set(words))
+        known = self.known(distinct)
+        corrections = {}
+        pending = []
+        for word, is_known in zip(distinct, known.tolist()):
+            if is_known or script_of(word) != ARABIC:
+                corrections[word] = word
+                continue
+            squeezed = [squeeze(word, 1), squeeze(word, 2)] if _REPEATS_RE.search(word) else []
+            found = [s for s, k in zip(squeezed, self.known(squeezed).tolist()) if k]
+            if found:
+                corrections[word] = found[0]
+            else:
+                pending.append((word, squeezed[0] if squeezed else word))
+        candidates = self._candidates([normalize(query) for _, query in pending])
+        for (word, query), (ids, bounds) in zip(pending, candidates):
+            corrections[word] = self._best(query, ids, bounds)
+        return [corrections[w] for w in words]
+
+    def lookup(self, word):
+        """Return the best correction of ``word``, or ``word`` when none is found."""
+        return self.correct_words([word])[0]
+
+    def correct(self, text):
+        """Correct every word of ``text``, leaving spacing and punctuation untouched."""
+        return self.correct_batch([text])[0]
+
+    def correct_batch(self, texts):
+        """Correct a list of texts, looking up every distinct word of the batch once."""
+        words = sorted({w for text in texts for w in _WORD_RE.findall(text)})
+        corrections = dict(zip(words, self.correct_words(words)))
+        return [_WORD_RE.sub(lambda m: corrections[m.group(0)], text) for text in texts]
+
+    def save(self, directory):
+        """
+        Write the index to ``directory`` (replaced if it exists).
+
+        The files are written to a temporary sibling directory and renamed
+        into place together, so processes loading the index never see
+        words and deletion keys of different versions.
+        """
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        arrays = {'words.npy': self.words, 'counts.npy': self.counts, 'keys.npy': self.keys,
+                  'ids.npy': self.ids, 'levels.npy': self.levels}
+        staging = tempfile.mkdtemp(prefix='.arabicnlp-spelling-', dir=parent)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, name), array)
+            with open(os.path.join(staging, _META), 'w') as f:
+                json.dump({'format': _FORMAT, 'max_distance': self.max_distance}, f)
+            if os.path.isdir(directory):
+                old = tempfile.mkdtemp(prefix='.arabicnlp-spelling-old-', dir=parent)
+                os.rename(directory, os.path.join(old, 'index'))
+                os.rename(staging, directory)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Open an index written by :meth:`save`.
+
+        :param mmap: memory-map the arrays instead of reading them
+        """
+        with open(os.path.join(directory, _META)) as f:
+            meta = json.load(f)
+        if meta.get('format') != _FORMAT:
+            raise ValueError("Unsupported spelling index format in '%s'." % directory)
+        mode = 'r' if mmap else None
+        checker = cls.__new__(cls)
+        checker.max_distance = meta['max_distance']
+        for name in ('words', 'counts', 'keys', 'ids', 'levels'):
+            setattr(checker, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode))
+        checker.lengths = np.char.str_len(checker.words)
+        return checker
+
+    def __repr__(self):
+        return '<SpellChecker %d words>' % len(self.words)
@@ -20,7 +20,9 @@ developed by Martin Porter.
 """
 
 import re
-from .porter import PorterStemmer
+import threading
+from importlib import import_module
+from .porter import PorterStemmer as _PorterStemmer
 
 def suffix_replace(original, old, new):
     """
@@ -45,12 +47,9 @@ class SnowballStemmer():
     """
     Snowball Stemmer
 
-    The following languages are supported:
-    Danish, Dutch, English, Finnish, French, German,
-    Hungarian, Italian, Norwegian, Portuguese, Romanian, Russian,
-    Spanish and Swedish.
-
-    The algorithm for English is documented here:
+    The languages that are actually available are listed in
+    ``SnowballStemmer.languages``; out of the box these are Arabic and
+    the original Porter algorithm for English:
 
         Porter, M. \"An algorithm for suffix stripping.\"
         Program 14.3 (1980): 130-137.
@@ -63,21 +62,24 @@ class SnowballStemmer():
 
     The stemmer is invoked as shown below:
 
-    >>> from summa.preprocessing.snowball import SnowballStemmer
+    >>> from arabicnlp.preprocessing.stemmer import SnowballStemmer
     >>> print(" ".join(SnowballStemmer.languages)) # See which languages are supported
-    ...
-    >>> stemmer = SnowballStemmer("german") # Choose a language
-    >>> stemmer.stem("Autobahnen") # Stem a word
-    'autobahn'
+    arabic porter
+    >>> stemmer = SnowballStemmer("porter") # Choose a language
+    >>> stemmer.stem("running") # Stem a word
+    'run'
+
+    Each language stemmer is built once (per thread) by :func:`get_stemmer`
+    and shared by every SnowballStemmer of that language, so creating
+    one per request is cheap. More languages can be added with
+    :func:`register_stemmer`; their modules are imported on first use.
 
-    Invoking the stemmers that way is useful if you do not know the
-    language to be stemmed at runtime. Alternatively, if you already know
-    the language, then you can invoke the language specific stemmer directly:
+    Alternatively, if you already know the language, then you can invoke
+    the language specific stemmer directly:
 
-    >>> from summa.preprocessing.snowball import GermanStemmer
-    >>> stemmer = GermanStemmer()
-    >>> stemmer.stem("Autobahnen")
-    'autobahn'
+    >>> from arabicnlp.preprocessing.stemmer import PorterStemmer
+    >>> PorterStemmer().stem("running")
+    'run'
 
     :param language: The language whose subclass is instantiated.
     :type language: str or unicode
@@ -85,33 +87,64 @@ class SnowballStemmer():
                            language, a ValueError is raised.
     """
 
-    languages = (
-        "arabic",
-        "danish",
-        "dutch",
-        "english",
-        "finnish",
-        "french",
-        "german",
-        "hungarian",
-        "italian",
-        "norwegian",
-        "polish",
-        "portuguese",
-        "romanian",
-        "russian",
-        "spanish",
-        "swedish",
-    )
+    languages = ()
 
     def __init__(self, language):
-        if language not in self.languages:
-            raise ValueError("The language '%s' is not supported." % language)
-        stemmerclass = globals()[language.capitalize() + "Stemmer"]
-        self.stemmer = stemmerclass()
+        self.stemmer = get_stemmer(language)
         self.stem = self.stemmer.stem
 
 
+# language -> (module relative to this package, class name). Modules are
+# imported the first time one of their stemmers is requested.
+_STEMMERS = {
+    "arabic": (".stemmer", "ArabicStemmer"),
+    "porter": (".stemmer", "PorterStemmer"),
+}
+
+_instances = threading.local()
+
+
+def register_stemmer(language, module, class_name):
+    """
+    Make a stemmer class available to :func:`get_stemmer` and SnowballStemmer.
+
+    :param language: language name, e.g. "english"
+    :param module: module path, absolute or relative to this package
+    :param class_name: name of the stemmer class in ``module``
+    """
+    _STEMMERS[language] = (module, class_name)
+    SnowballStemmer.languages = tuple(sorted(_STEMMERS))
+
+
+def get_stemmer(language):
+    """
+    Return the stemmer of ``language``, built once and then reused.
+
+    Stemmers keep per-word state on the instance while stemming, so each
+    thread gets its own instance; in a single-threaded process that is
+    one instance per language.
+
+    :raise ValueError: If there is no stemmer for the specified
+                       language, a ValueError is raised.
+    """
+    cache = getattr(_instances, "stemmers", None)
+    if cache is None:
+        cache = _instances.stemmers = {}
+    try:
+        return cache[language]
+    except KeyError:
+        pass
+    try:
+        module, class_name = _STEMMERS[language]
+    except KeyError:
+        raise ValueError("The language '%s' is not supported." % language)
+    stemmer = cache[language] = getattr(import_module(module, __package__), class_name)()
+    return stemmer
+
+
+SnowballStemmer.languages = tuple(sorted(_STEMMERS))
+
+
 class _LanguageSpecificStemmer():
 
     """
@@ -136,7 +169,7 @@ class _LanguageSpecificStemmer():
         return "<%s>" % type(self).__name__
 
 
-class PorterStemmer(_LanguageSpecificStemmer, PorterStemmer):
+class PorterStemmer(_LanguageSpecificStemmer, _PorterStemmer):
     """
     A word stemmer based on the original Porter stemming algorithm.
 
@@ -150,7 +183,7 @@ class PorterStemmer(_LanguageSpecificStemmer, PorterStemmer):
     """
     def __init__(self):
         _LanguageSpecificStemmer.__init__(self)
-        PorterStemmer.__init__(self)
+        _PorterStemmer.__init__(self)
 
 
 class _StandardStemmer(_LanguageSpecificStemmer):
@@ -483,6 +516,16 @@ class ArabicStemmer(_StandardStemmer, _LanguageSpecificStemmer):
         token = self.__alefat.sub('\u0627', token)
         return token
 
+    def normalize(self, word):
+        """
+        Normalize a word the way :meth:`stem` does, without stemming it:
+        harakat, tatweel and punctuation marks are removed and the hamza
+        forms unified.
+        :param word: string
+        :return: string
+        """
+        return self.__normalize_post(self.__normalize_pre(word))
+
     def __checks_1(self, token):
         for prefix in self.__checks1:
             if token.startswith(prefix):
@@ -749,6 +792,7 @@ class ArabicStemmer(_StandardStemmer, _LanguageSpecificStemmer):
         self.is_noun = True
         self.is_defined = False
 
+        self.suffixes_verb_step1_success = False
         self.suffix_verb_step2a_success = False
         self.suffix_verb_step2b_success = False
         self.suffix_noun_step2c2_success = False
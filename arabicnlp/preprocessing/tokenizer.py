@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Table-driven tokenizer for Arabic text.
+
+Every code point is classified with a precomputed lookup table (letters,
+harakat, tatweel, digits, number separators, punctuation, spaces), and
+token boundaries are found with array operations over the whole text
+instead of one regular expression step per character. The same pass
+produces the normalized text (harakat and tatweel removed, Arabic-Indic
+digits mapped to ASCII), so every token comes with its normalized form::
+
+    tokenizer = Tokenizer()
+    tokenizer.tokenize('قالَ الرئيـــس ٤٫٥ مليون.')
+    # ['قالَ', 'الرئيـــس', '٤٫٥', 'مليون', '.']
+    tokenizer.tokenize(text, normalized=True)[1]
+    # ['قال', 'الرئيس', '4.5', 'مليون', '.']
+
+Words are runs of letters, harakat and tatweel; numbers are runs of
+digits with single ``.`` ``,`` ``٫`` ``٬`` separators between digits;
+every other character that is not a space is a token of its own.
+
+Proclitics (``و`` ``ف`` ``ب`` ``ل`` ``ال``) can be split from the words
+they are attached to. Without a lexicon a clitic is split when at least
+``min_stem`` letters remain; with a lexicon only when the remainder is in
+it and the whole word is not.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+
+SPACE = 0
+WORD = 1
+DIGIT = 2
+SEPARATOR = 3  # . , ٫ ٬ : part of a number between two digits
+SYMBOL = 4  # punctuation and everything else, one token per character
+
+MARK = 1  # harakat and other combining marks, removed when normalizing
+TATWEEL = 2
+
+CLITICS = ('و', 'ف', 'ب', 'ل', 'ال')
+
+# particles and pronouns: a و or ف in front of them is always a conjunction
+FUNCTION_WORDS = frozenset((
+    'قد', 'لا', 'لم', 'لن', 'ما', 'من', 'في', 'عن', 'على', 'إلى', 'الى', 'مع', 'إن', 'أن', 'ان', 'إذا',
+    'اذا', 'لقد', 'كان', 'كانت', 'ليس', 'هو', 'هي', 'هما', 'أنا', 'انا', 'نحن', 'أنت', 'انت',
+    'أنتم', 'انتم', 'هذا', 'هذه', 'ذلك', 'تلك', 'هؤلاء', 'الذي', 'التي', 'الذين', 'كل', 'بعد', 'قبل',
+    'لكن', 'لو', 'ثم', 'حتى', 'بين', 'عند', 'منذ', 'إلا', 'الا', 'كما', 'أيضا', 'ايضا',
+))
+
+
+def _build_tables():
+    classes = np.zeros(0x10000, dtype=np.uint8)
+    marks = np.zeros(0x10000, dtype=np.uint8)
+    normalized = np.arange(0x10000, dtype=np.uint32)
+    for code in range(0x10000):
+        category = unicodedata.category(chr(code))
+        if category[0] in 'LM':
+            classes[code] = WORD
+            if category[0] == 'M':
+                marks[code] = MARK
+        elif category == 'Nd':
+            classes[code] = DIGIT
+            normalized[code] = ord('0') + unicodedata.digit(chr(code))
+        elif category[0] == 'Z' or chr(code).isspace():
+            classes[code] = SPACE
+        else:
+            classes[code] = SYMBOL
+    classes[[ord(c) for c in '.,٫٬']] = SEPARATOR
+    # tatweel is a letter-like modifier (Lm)
+    marks[0x0640] = TATWEEL
+    normalized[0x066b] = ord('.')  # ٫
+    normalized[0x066c] = ord(',')  # ٬
+    return classes, marks, normalized
+
+
+CHAR_CLASSES, CHAR_MARKS, NORMALIZED_CHARS = _build_tables()
+
+# texts shorter than this are tokenized with a regular expression generated
+# from the same tables: the array pass has a fixed cost of a few microseconds
+# per call that only pays off on longer texts
+SHORT_TEXT = 256
+
+
+def _ranges(mask):
+    """Return a regular expression character set of the code points in ``mask``."""
+    codes = np.flatnonzero(mask)
+    breaks = np.flatnonzero(np.diff(codes) != 1)
+    firsts = codes[np.concatenate(([0], breaks + 1))].tolist()
+    lasts = codes[np.concatenate((breaks, [len(codes) - 1]))].tolist()
+    return ''.join(re.escape(chr(a)) if a == b else '%s-%s' % (re.escape(chr(a)), re.escape(chr(b)))
+                   for a, b in zip(firsts, lasts))
+
+
+def _build_pattern():
+    word = _ranges(CHAR_CLASSES == WORD)
+    digit = _ranges(CHAR_CLASSES == DIGIT)
+    separator = _ranges(CHAR_CLASSES == SEPARATOR)
+    space = _ranges(CHAR_CLASSES == SPACE)
+    return re.compile('[%s]+|[%s]+(?:[%s][%s]+)*|[^%s]' % (word, digit, separator, digit, space))
+
+
+_TOKEN_RE = _build_pattern()
+
+_NORMALIZE = {code: None for code in np.flatnonzero(CHAR_MARKS).tolist()}
+_NORMALIZE.update((code, int(NORMALIZED_CHARS[code]))
+                  for code in np.flatnonzero(NORMALIZED_CHARS != np.arange(0x10000)).tolist())
+
+
+def _codes(text):
+    return np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+
+def _classify(codes):
+    # astral code points (emoji, historic scripts) are looked up as U+FFFF,
+    # a symbol
+    return CHAR_CLASSES[np.minimum(codes, 0xffff)]
+
+
+class Tokenizer():
+    """
+    Split text into words, numbers and single-character symbols.
+
+    :param clitics: proclitics to split from words, checked in order, e.g.
+                    :data:`CLITICS`; a word loses at most one conjunction
+                    (``و`` ``ف``), then one preposition, then ``ال``
+    :param lexicon: set of words; when given, a clitic is only split if
+                    what remains is in it and the whole word is not
+    :param min_stem: shortest remainder of a split without a lexicon
+    """
+
+    def __init__(self, clitics=(), lexicon=None, min_stem=3):
+        self.clitics = tuple(clitics)
+        self.lexicon = lexicon
+        self.min_stem = min_stem
+        groups = (('و', 'ف'), ('ب', 'ل', 'ك'), ('ال',))
+        self._groups = [tuple(c for c in group if c in self.clitics) for group in groups]
+        self._first = np.array(sorted(set(ord(c[0]) for c in self.clitics)), dtype=np.uint32)
+        self._first_letters = frozenset(c[0] for c in self.clitics)
+
+    def spans(self, text, clitics=False):
+        """
+        Return the ``(starts, ends)`` character offsets of the tokens of ``text``.
+
+        :param clitics: split the clitics too, giving the spans of the
+                        tokens of :meth:`tokenize`
+        """
+        codes = _codes(text)
+        starts, ends, kinds = self._spans(codes)
+        if clitics and self.clitics:
+            starts, ends = self._split_clitics(text, codes, starts, ends, kinds)
+        return starts, ends
+
+    def _spans(self, codes):
+        n = len(codes)
+        if not n:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.uint8)
+        classes = _classify(codes)
+        # separators between two digits belong to the number
+        separators = classes == SEPARATOR
+        if separators.any():
+            inside = np.zeros(n, dtype=bool)
+            inside[1:-1] = (classes[:-2] == DIGIT) & (classes[2:] == DIGIT)
+            classes[separators] = np.where(inside[separators], DIGIT, SYMBOL)
+        filled = classes != SPACE
+        # a token starts where the class changes (every symbol is a token)
+        boundary = np.ones(n + 1, dtype=bool)
+        boundary[1:-1] = (classes[1:] != classes[:-1]) | (classes[1:] == SYMBOL)
+        starts = np.flatnonzero(boundary[:-1] & filled)
+        ends = np.flatnonzero(boundary[1:] & filled) + 1
+        return starts, ends, classes[starts]
+
+    def _split(self, token):
+        """Return the lengths of the clitics at the start of ``token``."""
+        lexicon = self.lexicon
+        if lexicon is not None and token in lexicon:
+            return ()
+        lengths = []
+        rest = token
+        for group in self._groups:
+            for clitic in group:
+                if rest.startswith(clitic) and len(rest) - len(clitic) >= (1 if lexicon is not None else self.min_stem):
+                    lengths.append(len(clitic))
+                    rest = rest[len(clitic):]
+                    break
+            if lexicon is not None and lengths and rest in lexicon:
+                return lengths
+        return lengths if lexicon is None else ()
+
+    def _split_clitics(self, text, codes, starts, ends, kinds):
+        words = np.flatnonzero((kinds == WORD) & np.isin(codes[starts], self._first))
+        if not len(words):
+            return starts, ends
+        extra_starts = []
+        extra_ends = []
+        for i in words.tolist():
+            start, end = int(starts[i]), int(ends[i])
+            position = start
+            for length in self._split(text[start:end]):
+                extra_starts.append(position)
+                extra_ends.append(position + length)
+                position += length
+            if position != start:
+                # the remainder takes the place of the original token
+                starts[i] = position
+        if not extra_starts:
+            return starts, ends
+        starts = np.concatenate((starts, extra_starts))
+        ends = np.concatenate((ends, extra_ends))
+        order = np.argsort(starts, kind='mergesort')
+        return starts[order], ends[order]
+
+    def tokenize(self, text, normalized=False):
+        """
+        Return the tokens of ``text``.
+
+        :param normalized: also return the normalized form of every token
+        :return: list of tokens, or ``(tokens, normalized_tokens)``
+        """
+        if len(text) < SHORT_TEXT:
+            return self._tokenize_short(text, normalized)
+        codes = _codes(text)
+        starts, ends, kinds = self._spans(codes)
+        if self.clitics:
+            starts, ends = self._split_clitics(text, codes, starts, ends, kinds)
+        starts = starts.tolist()
+        ends = ends.tolist()
+        tokens = [text[s:e] for s, e in zip(starts, ends)]
+        if not normalized:
+            return tokens
+        return tokens, self._normalized(codes, starts, ends, tokens)
+
+    def _tokenize_short(self, text, normalized):
+        tokens = _TOKEN_RE.findall(text)
+        if self.clitics:
+            first = self._first_letters
+            split = []
+            for token in tokens:
+                if token[0] in first and CHAR_CLASSES[ord(token[0])] == WORD:
+                    for length in self._split(token):
+                        split.append(token[:length])
+                        token = token[length:]
+                split.append(token)
+            tokens = split
+        if not normalized:
+            return tokens
+        return tokens, [token.translate(_NORMALIZE) for token in tokens]
+
+    def _normalized(self, codes, starts, ends, tokens):
+        bmp = np.where(codes < 0x10000, codes, 0)
+        mapped = np.where(codes < 0x10000, NORMALIZED_CHARS[bmp], codes)
+        keep = CHAR_MARKS[bmp] == 0
+        changed = (mapped != codes) | ~keep
+        if not changed.any():
+            return list(tokens)
+        normalized = mapped[keep].astype('<u4').tobytes().decode('utf-32-le', 'surrogatepass')
+        # positions in the normalized text, and tokens touched by normalization
+        offsets = np.concatenate(([0], np.cumsum(keep)))
+        touched = np.concatenate(([0], np.cumsum(changed)))
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.array(ends, dtype=np.int64)
+        dirty = (touched[ends] - touched[starts]).tolist()
+        n_starts = offsets[starts].tolist()
+        n_ends = offsets[ends].tolist()
+        return [normalized[s:e] if d else t for t, d, s, e in zip(tokens, dirty, n_starts, n_ends)]
+
+    def __repr__(self):
+        return '<Tokenizer clitics=%r>' % (self.clitics,)
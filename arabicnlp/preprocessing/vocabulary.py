@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Interning vocabulary mapping tokens and stems to integer ids.
+
+A corpus held as lists of strings costs a Python object per token; as
+ids it costs four bytes per token and feeds feature extraction without
+any conversion::
+
+    vocabulary = Vocabulary()
+    tokens(text, vocabulary=vocabulary)                   # int32 array
+    stems(text, vocabulary=vocabulary, output='array')    # array('i')
+    ids, offsets = vocabulary.ids_batch(documents)        # flat ids of many documents
+    vocabulary.words(ids[:5])
+
+Ids are given in order of first appearance and never change. A saved
+vocabulary is a directory of ``.npy`` files that every process maps
+read-only, so workers share one copy in the page cache; words a process
+adds after loading get the following ids, and the vocabularies grown by
+several workers are reconciled with :meth:`Vocabulary.merge`.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+_FORMAT = 1
+
+OUTPUTS = ('numpy', 'array')
+
+
+class Vocabulary():
+    """
+    Growable word -> id mapping with a frozen, memory-mappable base.
+
+    :param words: initial words, given ids in order
+    """
+
+    def __init__(self, words=()):
+        # saved words: by id, sorted, and the ids of the sorted words
+        self._base = np.zeros(0, dtype=np.str_)
+        self._sorted = self._base
+        self._sorted_ids = np.zeros(0, dtype=np.int32)
+        # ids of the words added in this process, and of the saved words
+        # looked up so far (only the words in use are ever held in it)
+        self._index = {}
+        self._added = []
+        self.update(words)
+
+    def __len__(self):
+        return len(self._base) + len(self._added)
+
+    def __contains__(self, word):
+        return self.ids([word], grow=False)[0] >= 0
+
+    def _add(self, word):
+        i = self._index[word] = len(self)
+        self._added.append(word)
+        return i
+
+    def update(self, words):
+        """Add ``words`` that are not in the vocabulary yet."""
+        self.ids(words)
+
+    def ids(self, words, grow=True, output='numpy', unknown=-1):
+        """
+        Return the ids of ``words``.
+
+        :param grow: add the unknown words; otherwise they get ``unknown``
+        :param output: ``'numpy'`` for an int32 array, ``'array'`` for an
+                       ``array('i')``
+        """
+        if output not in OUTPUTS:
+            raise ValueError('Unknown output %r, expected one of %s.' % (output, ', '.join(OUTPUTS)))
+        words = list(words)
+        index = self._index
+        try:
+            ids = [index[w] for w in words]
+        except KeyError:
+            if len(self._base):
+                self._lookup_saved(set(w for w in words if w not in index))
+            add = self._add if grow else lambda w: unknown
+            ids = [index[w] if w in index else add(w) for w in words]
+        return np.array(ids, dtype=np.int32) if output == 'numpy' else array('i', ids)
+
+    def _lookup_saved(self, words):
+        """Look ``words`` up in the saved words at once and remember the ids of the found ones."""
+        query = np.array(sorted(words), dtype=np.str_)
+        positions = np.minimum(np.searchsorted(self._sorted, query), len(self._sorted) - 1)
+        found = self._sorted[positions] == query
+        self._index.update(zip(query[found].tolist(), self._sorted_ids[positions[found]].tolist()))
+
+    def ids_batch(self, word_lists, grow=True, unknown=-1):
+        """
+        Return the ids of many lists of words at once.
+
+        :return: ``(ids, offsets)``: the int32 ids of all the words, and
+                 the ``len(word_lists) + 1`` offsets of every list in them
+        """
+        lengths = [len(words) for words in word_lists]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return self.ids([w for words in word_lists for w in words], grow=grow, unknown=unknown), offsets
+
+    def word(self, i):
+        """Return the word of id ``i``."""
+        return str(self._base[i]) if i < len(self._base) else self._added[i - len(self._base)]
+
+    def words(self, ids):
+        """Return the words of an array of ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) and (ids.min() < 0 or ids.max() >= len(self)):
+            raise IndexError('word id out of range')
+        base = len(self._base)
+        if not len(self._added):
+            return self._base[ids].tolist()
+        added = self._added
+        return [str(self._base[i]) if i < base else added[i - base] for i in ids.tolist()]
+
+    def merge(self, other):
+        """
+        Add the words of another vocabulary.
+
+        :return: int32 array mapping the ids of ``other`` to ids of this
+                 vocabulary, to translate id arrays with ``mapping[ids]``
+        """
+        return self.ids(other.words(np.arange(len(other))))
+
+    def save(self, directory):
+        """
+        Write the vocabulary to ``directory`` (replaced if it exists).
+
+        The files are written to a temporary sibling directory and renamed
+        into place, so processes loading it never see a partial vocabulary.
+        """
+        directory = os.path.abspath(directory)
+        parent = os.path.dirname(directory)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.arabicnlp-vocabulary-', dir=parent)
+        try:
+            words = np.concatenate((self._base, np.array(self._added, dtype=np.str_))) if self._added else self._base
+            words = np.asarray(words, dtype=np.str_)
+            order = np.argsort(words, kind='stable').astype(np.int32)
+            np.save(os.path.join(staging, 'words.npy'), words)
+            np.save(os.path.join(staging, 'sorted.npy'), words[order])
+            np.save(os.path.join(staging, 'sorted_ids.npy'), order)
+            with open(os.path.join(staging, MANIFEST), 'w') as f:
+                json.dump({'format': _FORMAT, 'size': len(words)}, f)
+            if os.path.isdir(directory):
+                old = tempfile.mkdtemp(prefix='.arabicnlp-vocabulary-old-', dir=parent)
+                os.rename(directory, os.path.join(old, 'vocabulary'))
+                os.rename(staging, directory)
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a saved vocabulary.
+
+        :param mmap: map the files read-only instead of reading them, so
+                     that processes loading the same vocabulary share it
+        """
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != _FORMAT:
+            raise ValueError("Unsupported vocabulary format in '%s'." % directory)
+        mode = 'r' if mmap else None
+        vocabulary = cls()
+        vocabulary._base = np.load(os.path.join(directory, 'words.npy'), mmap_mode=mode)
+        vocabulary._sorted = np.load(os.path.join(directory, 'sorted.npy'), mmap_mode=mode)
+        vocabulary._sorted_ids = np.load(os.path.join(directory, 'sorted_ids.npy'), mmap_mode=mode)
+        return vocabulary
+
+    def __repr__(self):
+        return '<Vocabulary %d words>' % len(self)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Size-bounded on-disk store of processing results.
+
+A :class:`ResultStore` maps content-addressed keys (see
+:meth:`arabicnlp.pipeline.Pipeline.key`) to compact binary values in a
+SQLite file shared by every process of a machine. Lookups and inserts
+are done in bulk, and once the stored keys and values exceed
+``max_bytes`` the least recently used entries are evicted::
+
+    store = ResultStore('/var/cache/arabicnlp/results.db', max_bytes=2 ** 30)
+    pipeline.process(documents, store)
+
+Batch jobs use a store with ``python -m arabicnlp job-run /data/job --store results.db``.
+
+Entries of older pipeline fingerprints are never looked up again; they
+age out through eviction, or are dropped at once with :meth:`ResultStore.invalidate`.
+"""
+
+import sqlite3
+import threading
+import time
+
+# rough per-entry cost of a row and its index entries
+_ENTRY_OVERHEAD = 64
+# SQLite limits the number of parameters of a statement
+_CHUNK = 500
+# last-use times are only refreshed when older than this (seconds): an
+# update per hit would cost more than the lookup itself
+_TOUCH = 3600
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS results '
+    '(key BLOB PRIMARY KEY, pipeline TEXT, value BLOB, size INTEGER, used REAL)',
+    'CREATE INDEX IF NOT EXISTS results_used ON results (used)',
+    'CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)',
+    'INSERT OR IGNORE INTO totals VALUES (0, 0)',
+    # the running total of the stored sizes, kept by the database itself
+    'CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results '
+    'BEGIN UPDATE totals SET bytes = bytes + NEW.size WHERE id = 0; END',
+    'CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results '
+    'BEGIN UPDATE totals SET bytes = bytes - OLD.size WHERE id = 0; END',
+)
+
+
+class ResultStore():
+    """
+    Content-addressed store of binary results with LRU eviction.
+
+    Values are never replaced: a key identifies both the content and the
+    pipeline that processed it, so its value cannot change.
+
+    :param path: SQLite file
+    :param max_bytes: approximate budget of the stored keys and values
+    """
+
+    def __init__(self, path, max_bytes=2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._db() as db:
+            for statement in _SCHEMA:
+                db.execute(statement)
+
+    def _db(self):
+        # sqlite connections may not be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=60)
+        return db
+
+    def get_many(self, keys):
+        """
+        Look up many keys at once.
+
+        :return: dict of the found keys and their values (bytes)
+        """
+        keys = list(set(keys))
+        found = {}
+        stale = []
+        now = time.time()
+        db = self._db()
+        for start in range(0, len(keys), _CHUNK):
+            chunk = keys[start:start + _CHUNK]
+            rows = db.execute('SELECT key, value, used FROM results WHERE key IN (%s)' % ','.join('?' * len(chunk)),
+                              chunk)
+            for key, value, used in rows:
+                found[bytes(key)] = bytes(value)
+                if now - used > _TOUCH:
+                    stale.append(key)
+        if stale:
+            with db:
+                for start in range(0, len(stale), _CHUNK):
+                    chunk = stale[start:start + _CHUNK]
+                    db.execute('UPDATE results SET used = ? WHERE key IN (%s)' % ','.join('?' * len(chunk)),
+                               [now] + chunk)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key):
+        """Return the value of ``key`` or ``None``."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items, pipeline=''):
+        """
+        Store many ``(key, value)`` pairs at once, then evict the least
+        recently used entries beyond ``max_bytes``.
+
+        :param pipeline: fingerprint of the pipeline the values come from
+        """
+        now = time.time()
+        rows = ((key, pipeline, value, len(key) + len(value) + _ENTRY_OVERHEAD, now) for key, value in items)
+        with self._db() as db:
+            db.executemany('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+        self._evict()
+
+    def put(self, key, value, pipeline=''):
+        self.put_many([(key, value)], pipeline)
+
+    @property
+    def bytes(self):
+        return self._db().execute('SELECT bytes FROM totals').fetchone()[0]
+
+    def _evict(self):
+        excess = self.bytes - self.max_bytes
+        if excess <= 0:
+            return
+        # evict down to 90% of the budget, so that eviction is not run on every insert
+        excess += self.max_bytes // 10
+        with self._db() as db:
+            while excess > 0:
+                rows = db.execute('SELECT key, size FROM results ORDER BY used LIMIT ?', (_CHUNK,)).fetchall()
+                if not rows:
+                    break
+                evicted = []
+                for key, size in rows:
+                    evicted.append(key)
+                    excess -= size
+                    if excess <= 0:
+                        break
+                db.execute('DELETE FROM results WHERE key IN (%s)' % ','.join('?' * len(evicted)), evicted)
+                with self._lock:
+                    self.evictions += len(evicted)
+
+    def invalidate(self, keep=None):
+        """
+        Drop the entries of every pipeline but ``keep``.
+
+        :param keep: pipeline fingerprint to keep, ``None`` drops everything
+        :return: number of dropped entries
+        """
+        with self._db() as db:
+            return db.execute('DELETE FROM results WHERE pipeline IS NOT ?', (keep,)).rowcount
+
+    def __len__(self):
+        return self._db().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def stats(self):
+        """Return the store counters as a dict."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __repr__(self):
+        return '<ResultStore %s>' % self.path
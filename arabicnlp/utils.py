@@ -1,6 +1,6 @@
+import os
 from pathlib import Path
 
 # set home dir for default
 HOME_DIR = str(Path.home())
 DEFAULT_MODEL_DIR = os.path.join(HOME_DIR,'arabicnlp_models')
-
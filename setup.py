@@ -24,6 +24,8 @@ setup(
     packages=find_packages(),
     install_requires=[
         'keras',
+        'numpy',
+        'scipy',
         'tensorflow'
     ],
     include_package_data=True,
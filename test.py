@@ -1,5 +1,63 @@
+import os
+import tempfile
+from array import array
+import threading
+import time
 import unittest
+from unittest import mock
+
+import numpy as np
+
 import arabicnlp
+from arabicnlp import jobs, pipeline
+from arabicnlp.pipeline import Pipeline, decode, encode, fingerprint
+from arabicnlp.store import ResultStore
+from arabicnlp.features import Gazetteer, HashingVectorizer, InvertedIndex, MinHashLSH, TfidfVectorizer, similarity_matrix, top_k
+from arabicnlp.features.search import decode_varints, encode_varints
+from arabicnlp.models import PerceptronTagger, ReplicaPool, SentimentModel, cache, perceptron, pool, sentiment, shared, training
+from arabicnlp.models import ConlluCorpus, evaluation, read_conllu, tag_names, tag_probabilities, write_conllu
+from arabicnlp.models.pos_tagger import tag_document
+from arabicnlp.models.registry import ModelRegistry, default_registry, write_manifest
+from arabicnlp.preprocessing import clitics
+from arabicnlp.preprocessing import ArabicStemmer, BatchStemmer, CliticSegmenter, ScriptStemmer, SpellChecker, Tokenizer, Vocabulary, segment
+from arabicnlp.preprocessing.porter import PorterStemmer
+from arabicnlp.preprocessing.tokenizer import SHORT_TEXT
+from arabicnlp.preprocessing.stemmer import SnowballStemmer, get_stemmer
+from arabicnlp.preprocessing.script import ARABIC, DIGIT, LATIN, PUNCTUATION, MemoizedStemmer, script_of
+
+
+class _ToyLayer():
+    """Stands in for a Keras layer when exporting a shared store"""
+
+    def __init__(self, config, weights):
+        self.config = config
+        self.weights = weights
+
+    def get_config(self):
+        return self.config
+
+    def get_weights(self):
+        return self.weights
+
+
+def _toy_store(directory, vocab=('-PAD-', '-OOV-', 'كتب', 'في', 'البيت'), n_tags=4, units=3):
+    """Export a tiny random Embedding/BiLSTM/Dense tagger as a shared store"""
+    rng = np.random.RandomState(0)
+    lstm = {'units': units, 'return_sequences': True}
+    layers = [
+        type('Embedding', (_ToyLayer,), {})({'mask_zero': True}, [rng.randn(len(vocab), 4)]),
+        type('Bidirectional', (_ToyLayer,), {})(
+            {'layer': {'class_name': 'LSTM', 'config': lstm}, 'merge_mode': 'concat'},
+            [rng.randn(4, 4 * units), rng.randn(units, 4 * units), rng.randn(4 * units)] * 2),
+        type('TimeDistributed', (_ToyLayer,), {})(
+            {'layer': {'class_name': 'Dense', 'config': {}}},
+            [rng.randn(2 * units, n_tags), rng.randn(n_tags)]),
+        type('Activation', (_ToyLayer,), {})({'activation': 'softmax'}, []),
+    ]
+    model = type('Model', (), {'layers': layers})()
+    word2index = {w: i for i, w in enumerate(vocab)}
+    tag2index = {t: i for i, t in enumerate(['-PAD-', 'NOUN', 'VERB', 'ADP'][:n_tags])}
+    return shared.export(directory, model, word2index, tag2index, 8)
 
 
 class IntegrationTest(unittest.TestCase):
@@ -32,10 +90,11 @@ class UnitTest(unittest.TestCase):
         
         result = []
         cases= {'توصية' : 'تتتتتتتتوصية' , 'الهام' : 'الهم', 'املائية' : 'املاءية' }
+        checker = SpellChecker.from_corpus(['كتب توصية عن الهام القواعد املائية'])
         for _, val in cases.items():
-            result.append(arabicnlp.correct(val))
+            result.append(arabicnlp.correct(val, checker))
               
-        self.assertEqual(cases.keys(),result)
+        self.assertEqual(list(cases.keys()),result)
 
     def test_stemming(self):
         dictionary = {
@@ -76,7 +135,7 @@ class UnitTest(unittest.TestCase):
         ,"على","ذلك","نجده","في","نجم","الشعرى","اليمانية","."],
 
         "يبلغ عمر كوكب الأرض حوالي 4.54 مليار سنة (4.54 × 109 سنة ± 1%).":
-        ["عمر","الأرض","حوالي","4.54","مليار","سنة","(","4.54"
+        ["يبلغ","عمر","كوكب","الأرض","حوالي","4.54","مليار","سنة","(","4.54"
         ,"×","109","سنة","±","1","%",")","."]
         }
 
@@ -91,5 +150,890 @@ class UnitTest(unittest.TestCase):
         text = "وقد تتكون النجوم في أزواج تدور حول بعضها البعض، مثال على ذلك نجده في نجم الشعرى اليمانية."
         self.assertGreater(len(arabicnlp.tags(text)), 0)
 
+
+class SharedStoreTest(unittest.TestCase):
+    """Tests for the memory-mapped tagger store"""
+
+    def setUp(self):
+        self.store = shared.SharedStore(_toy_store(os.path.join(tempfile.mkdtemp(), 'store')))
+
+    def test_lookup(self):
+        self.assertEqual(list(self.store.lookup(['في', 'مجهول', 'كتب'])), [3, 1, 2])
+        self.assertIsInstance(self.store.words, np.memmap)
+
+    def test_predict_ignores_padding(self):
+        padded = np.array([[2, 3, 4, 0, 0, 0, 0, 0]])
+        full = self.store.predict(padded)
+        self.assertEqual(full.shape, (1, 8, 4))
+        self.assertTrue(np.allclose(full[0, :3], self.store.predict(padded[:, :3])[0]))
+        self.assertTrue((full[0, 3:].argmax(-1) == 0).all())
+
+    def test_tags_uses_attached_store(self):
+        shared.attach(self.store.directory)
+        try:
+            result = arabicnlp.tags('كتب في البيت')
+        finally:
+            shared.detach()
+        self.assertEqual(set(result), {'كتب', 'في', 'البيت'})
+
+    def test_clitics(self):
+        shared.attach(self.store.directory)
+        try:
+            result = tag_document('وكتب في للبيت', clitics=True)
+        finally:
+            shared.detach()
+        self.assertEqual([(token, start, end) for token, _, start, end in result],
+                         [('و', 0, 1), ('كتب', 1, 4), ('في', 5, 7), ('ل', 8, 9), ('البيت', 9, 13)])
+
+
+class TagProbabilitiesTest(unittest.TestCase):
+    """Tests for the per-token tag probabilities"""
+
+    def setUp(self):
+        shared.attach(_toy_store(os.path.join(tempfile.mkdtemp(), 'store')))
+
+    def tearDown(self):
+        shared.detach()
+
+    def test_views(self):
+        probabilities = tag_probabilities(['كتب في البيت', '', 'في'])
+        self.assertEqual(probabilities.lengths.tolist(), [3, 0, 1])
+        self.assertEqual(probabilities[0].shape, (3, len(tag_names())))
+        self.assertTrue(np.shares_memory(probabilities[2], probabilities.values))
+        self.assertTrue(np.allclose(probabilities.values.sum(axis=1), 1.0))
+        self.assertEqual(probabilities.tags()[0], [tag for _, tag, _, _ in tag_document('كتب في البيت')])
+        self.assertEqual(probabilities.tokens, [['كتب', 'في', 'البيت'], [], ['في']])
+
+    def test_top_k_and_confidence(self):
+        probabilities = tag_probabilities(['كتب في البيت', '', 'في'])
+        ids, p = probabilities.top_k(2)
+        self.assertEqual(ids[:, 0].tolist(), probabilities.tag_ids().tolist())
+        self.assertTrue((p[:, 0] >= p[:, 1]).all())
+        best = probabilities.values.max(axis=1)
+        confidence = probabilities.confidence('min')
+        self.assertAlmostEqual(confidence[0], best[:3].min(), places=6)
+        self.assertTrue(np.isnan(confidence[1]))
+        self.assertAlmostEqual(probabilities.confidence('product')[2], best[3], places=6)
+        with self.assertRaises(ValueError):
+            probabilities.confidence('max')
+
+
+class ConlluTest(unittest.TestCase):
+    """Tests for the CoNLL-U reader, writer and the tagger evaluation"""
+
+    text = ('# sent_id = 1\n'
+            '1-2\tوكتب\t_\t_\t_\t_\t_\t_\t_\t_\n'
+            '1\tو\tو\tCCONJ\tC\t_\t2\tcc\t_\t_\n'
+            '2\tكتب\tكتب\tVERB\tV\t_\t0\troot\t_\t_\n'
+            '3\tفي\tفي\tADP\tP\t_\t4\tcase\t_\t_\n'
+            '4\tالبيت\tبيت\tNOUN\tN\t_\t2\tobl\t_\t_\n'
+            '\n'
+            '1\tفي\tفي\tADP\tP\t_\t0\troot\t_\t_\n')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.conllu')
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(self.text)
+
+    def test_read_write(self):
+        corpus = ConlluCorpus(self.filename, tag='xpos')
+        self.assertEqual(list(corpus), [[('و', 'C'), ('كتب', 'V'), ('في', 'P'), ('البيت', 'N')], [('في', 'P')]])
+        self.assertEqual(list(corpus), list(corpus))
+        output = os.path.join(self.directory, 'copy.conllu.gz')
+        self.assertEqual(write_conllu(read_conllu(self.filename), output), 2)
+        self.assertEqual(list(read_conllu(output)), list(read_conllu(self.filename)))
+        write_conllu([[('في', 'ADP')]], output)
+        self.assertEqual(list(ConlluCorpus(output)), [[('في', 'ADP')]])
+
+    def test_evaluate(self):
+        shared.attach(_toy_store(os.path.join(self.directory, 'store')))
+        try:
+            predicted = os.path.join(self.directory, 'predicted.conllu')
+            result = evaluation.evaluate(ConlluCorpus(self.filename), chunk_size=1, output=predicted)
+        finally:
+            shared.detach()
+        self.assertEqual((result['sentences'], result['tokens']), (2, 5))
+        self.assertEqual(sum(sum(row.values()) for row in result['confusion'].values()), 5)
+        self.assertAlmostEqual(result['oov_rate'], 0.2)
+        self.assertEqual([w for w, _ in next(iter(ConlluCorpus(predicted)))], ['و', 'كتب', 'في', 'البيت'])
+
+
+class ReplicaPoolTest(unittest.TestCase):
+    """Tests for the pool of tagger replicas"""
+
+    def setUp(self):
+        self.directory = _toy_store(os.path.join(tempfile.mkdtemp(), 'store'))
+
+    def test_concurrent_predictions(self):
+        replicas = ReplicaPool([shared.SharedStore(self.directory) for _ in range(2)])
+        x = np.array([[2, 3, 4, 0, 0, 0, 0, 0]])
+        expected = replicas.predict(x)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(replicas.predict(x))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(np.allclose(r, expected) for r in results))
+        self.assertEqual(replicas.stats()['checkouts'], 9)
+        self.assertEqual(replicas.stats()['available'], 2)
+
+    def test_timeout(self):
+        replicas = ReplicaPool([shared.SharedStore(self.directory)], timeout=0.01, max_waiting=1)
+        with replicas.replica():
+            with self.assertRaises(TimeoutError):
+                replicas.checkout()
+        self.assertEqual(replicas.stats()['timeouts'], 1)
+        replicas.checkin(replicas.checkout())
+
+    def test_tags_uses_pool(self):
+        pool.enable(size=2, loader=lambda version, intra, inter: shared.SharedStore(self.directory))
+        try:
+            self.assertEqual(set(arabicnlp.tags('كتب في البيت')), {'كتب', 'في', 'البيت'})
+            self.assertEqual(pool.current().stats()['checkouts'], 1)
+        finally:
+            pool.disable()
+
+
+class RegistryTest(unittest.TestCase):
+    """Tests for the versioned model registry"""
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        for version in ('v1', 'v2'):
+            directory = os.path.join(self.model_dir, 'toy', version)
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'weights.txt'), 'w') as f:
+                f.write(version)
+            write_manifest(directory, {'weights': 'weights.txt'})
+        self.registry = ModelRegistry(self.model_dir)
+        self.registry.register('toy', lambda files, version: open(files['weights']).read())
+
+    def test_versions_side_by_side(self):
+        self.assertEqual(self.registry.versions('toy'), ['v1', 'v2'])
+        self.assertEqual(self.registry.load('toy', 'v1'), 'v1')
+        self.assertEqual(self.registry.load('toy'), 'v2')
+        self.assertEqual(self.registry.loaded(), [('toy', 'v1'), ('toy', 'v2')])
+
+    def test_checksum_mismatch(self):
+        with open(os.path.join(self.model_dir, 'toy', 'v1', 'weights.txt'), 'a') as f:
+            f.write('tampered')
+        self.assertRaises(ValueError, self.registry.load, 'toy', 'v1')
+
+    def test_missing_version(self):
+        self.assertRaises(LookupError, self.registry.load, 'toy', 'v3')
+
+    def test_empty_file(self):
+        directory = os.path.join(self.model_dir, 'toy', 'v1')
+        open(os.path.join(directory, 'empty.h5'), 'w').close()
+        self.assertRaises(ValueError, write_manifest, directory, {'weights': 'empty.h5'})
+        open(os.path.join(directory, 'weights.txt'), 'w').close()
+        self.assertRaises(ValueError, self.registry.load, 'toy', 'v1')
+
+
+class TaggerCacheTest(unittest.TestCase):
+    """Tests for the tagger result cache"""
+
+    def test_lru_eviction_by_bytes(self):
+        tag_cache = cache.TaggerCache(max_bytes=3 * 230)
+        for i in range(4):
+            tag_cache.put(cache.sentence_key(['w%d' % i]), b'\x01\x02')
+        self.assertIsNone(tag_cache.get(cache.sentence_key(['w0'])))
+        self.assertEqual(tag_cache.get(cache.sentence_key(['w3'])), b'\x01\x02')
+        self.assertEqual(tag_cache.stats()['evictions'], 1)
+        self.assertEqual(tag_cache.hit_rate, 0.5)
+
+    def test_ttl(self):
+        tag_cache = cache.TaggerCache(ttl=-1)
+        tag_cache.put(b'key', b'\x01')
+        self.assertIsNone(tag_cache.get(b'key'))
+
+    def test_disk_tier(self):
+        path = os.path.join(tempfile.mkdtemp(), 'tags.db')
+        cache.TaggerCache(path=path).put(b'key', b'\x01\x02')
+        restarted = cache.TaggerCache(path=path)
+        self.assertEqual(restarted.get(b'key'), b'\x01\x02')
+        self.assertEqual(restarted.disk_hits, 1)
+
+    def test_disk_budget(self):
+        path = os.path.join(tempfile.mkdtemp(), 'tags.db')
+        tag_cache = cache.TaggerCache(path=path, disk_bytes=10 * 100)
+        for i in range(50):
+            tag_cache.put(cache.sentence_key(['w%d' % i]), b'\x01' * 10)
+        self.assertLessEqual(tag_cache.disk_size, 1000)
+        self.assertGreater(tag_cache.stats()['disk_evictions'], 0)
+        restarted = cache.TaggerCache(path=path, disk_bytes=10 * 100)
+        self.assertIsNone(restarted.get(cache.sentence_key(['w0'])))
+        self.assertIsNotNone(restarted.get(cache.sentence_key(['w49'])))
+        tag_cache.put(cache.sentence_key(['w49']), b'\x01' * 10)
+        self.assertLessEqual(tag_cache.disk_size, 1000)
+
+    def test_tags_skip_inference(self):
+        shared.attach(_toy_store(os.path.join(tempfile.mkdtemp(), 'store')))
+        tag_cache = cache.enable()
+        try:
+            first = arabicnlp.tags('كتب في البيت')
+            second = arabicnlp.tags('كتب في البيت')
+        finally:
+            cache.disable()
+            shared.detach()
+        self.assertEqual(first, second)
+        self.assertEqual((tag_cache.hits, tag_cache.misses), (1, 1))
+
+
+class SegmenterTest(unittest.TestCase):
+    """Tests for sentence segmentation ahead of the tagger"""
+
+    def test_sentences(self):
+        tokens = arabicnlp.tokens('ذهب الولد. هل عاد؟ نعم')
+        self.assertEqual(segment(tokens, max_length=4), [(0, 3), (3, 6), (6, 7)])
+
+    def test_short_input_is_one_segment(self):
+        tokens = arabicnlp.tokens('ذهب الولد. هل عاد؟ نعم')
+        self.assertEqual(segment(tokens), [(0, 7)])
+        self.assertEqual(segment([]), [])
+
+    def test_decimal_point(self):
+        tokens = ['سعر', 'السهم', '4', '.', '54', 'دولار', '.', 'ثم']
+        self.assertEqual(segment(tokens, max_length=7), [(0, 7), (7, 8)])
+
+    def test_long_sentences_are_bounded(self):
+        tokens = ['كلمة'] * 5 + ['،'] + ['كلمة'] * 20
+        spans = segment(tokens, max_length=8)
+        self.assertEqual(spans[0], (0, 6))
+        self.assertTrue(all(0 < b - a <= 8 for a, b in spans))
+        self.assertEqual([i for a, b in spans for i in range(a, b)], list(range(len(tokens))))
+
+    def test_tag_document_keeps_every_token(self):
+        text = ' '.join(['كتب في البيت'] * 10)
+        shared.attach(_toy_store(os.path.join(tempfile.mkdtemp(), 'store')))
+        try:
+            tagged = tag_document(text)
+        finally:
+            shared.detach()
+        self.assertEqual(len(tagged), 30)
+        token, _, start, end = tagged[-1]
+        self.assertEqual(text[start:end], token)
+
+    def test_tagger_tokens_are_package_tokens(self):
+        text = 'سعر السهم 4.54 دولار وقد ارتفع!!'
+        shared.attach(_toy_store(os.path.join(tempfile.mkdtemp(), 'store')))
+        try:
+            tagged = tag_document(text)
+        finally:
+            shared.detach()
+        self.assertEqual([token for token, _, _, _ in tagged], list(arabicnlp.tokens(text)))
+        self.assertIn('4.54', [token for token, _, _, _ in tagged])
+
+
+class TrainingDataTest(unittest.TestCase):
+    """Tests for the tagger training data pipeline"""
+
+    word2index = {'-PAD-': 0, '-OOV-': 1, 'كتب': 2, 'في': 3}
+    tag2index = {'-PAD-': 0, 'NOUN': 1, 'VERB': 2, 'ADP': 3}
+    corpus = [
+        [('كتب', 'VERB'), ('في', 'ADP'), ('البيت', 'NOUN')],
+        [('كتب', 'NOUN')],
+    ]
+
+    def test_to_categorical(self):
+        result = training.to_categorical([[2, 0]], 4)
+        self.assertEqual(result.shape, (1, 2, 4))
+        self.assertEqual(result[0].argmax(-1).tolist(), [2, 0])
+
+    def test_encode(self):
+        x, y = training.encode(self.corpus, self.word2index, self.tag2index)
+        self.assertEqual(x.tolist(), [[2, 3, 1], [2, 0, 0]])
+        self.assertEqual(y.tolist(), [[2, 3, 1], [1, 0, 0]])
+
+    def test_batches(self):
+        batches = list(training.batches(self.corpus, self.word2index, self.tag2index,
+                                        batch_size=1, max_length=5, sparse=False))
+        self.assertEqual(len(batches), 2)
+        self.assertEqual([(x.shape, y.shape) for x, y in batches], [((1, 5), (1, 5, 4))] * 2)
+
+    def test_repeat(self):
+        batches = training.batches(self.corpus, self.word2index, self.tag2index, batch_size=1, repeat=True)
+        self.assertEqual(len([next(batches) for _ in range(5)]), 5)
+        with self.assertRaises(TypeError):
+            training.batches(iter(self.corpus), self.word2index, self.tag2index, repeat=True)
+        with self.assertRaises(ValueError):
+            next(training.batches([], self.word2index, self.tag2index, repeat=True))
+
+
+class ScriptStemmerTest(unittest.TestCase):
+    """Tests for script-aware stemming of mixed Arabic/Latin text"""
+
+    def test_script_of(self):
+        cases = {'الشجاعة': ARABIC, 'iPhone': LATIN, '٤٥': DIGIT, '١٢abc': LATIN, '،': PUNCTUATION, '٪': PUNCTUATION}
+        for token, script in cases.items():
+            self.assertEqual(script_of(token), script)
+
+    def test_dispatch(self):
+        tokens = ['الشجاعة', 'running', '2019', '،', 'running']
+        self.assertEqual(ScriptStemmer().stem_batch(tokens), [
+            ArabicStemmer().stem('الشجاعة'), PorterStemmer().stem('running'), '2019', '،', 'run'])
+
+    def test_arabic_stemmer_is_stateless(self):
+        stemmer = ArabicStemmer()
+        stemmer.stem('كتبها')
+        self.assertEqual(stemmer.stem('شعروا'), ArabicStemmer().stem('شعروا'))
+
+
+class BatchStemmerTest(unittest.TestCase):
+    """Differential tests of the vectorized stemmer against ArabicStemmer"""
+
+    def test_same_stems(self):
+        rng = np.random.RandomState(0)
+        letters = list('ابتثجحخدذرسشصضطظعغفقكلمنهويءأإآؤئىةـَُِّ،')
+        prefixes = ['', 'و', 'ف', 'ب', 'ك', 'ل', 'ال', 'لل', 'وال', 'فال', 'بال', 'كال', 'أأ', 'سي', 'يست', 'بب', 'كك', 'وا']
+        suffixes = ['', 'ه', 'ني', 'ها', 'هما', 'كمو', 'ت', 'ا', 'تن', 'ون', 'تما', 'وا', 'تم', 'و', 'تمو', 'ة', 'ات', 'ى', 'أ', 'ئ']
+        words = [rng.choice(prefixes) + ''.join(rng.choice(letters, rng.randint(0, 6))) + rng.choice(suffixes)
+                 for _ in range(3000)]
+        words += ['', 'abc', 'المعلومات', 'والمدرسة', 'ـ', 'كتبتموها', 'x' * 40]
+        stemmer = ArabicStemmer()
+        self.assertEqual(BatchStemmer(chunk_size=1000).stem_batch(words), [stemmer.stem(w) for w in words])
+
+    def test_stem(self):
+        self.assertEqual(BatchStemmer().stem('المعلومات'), ArabicStemmer().stem('المعلومات'))
+
+
+class PorterStemmerTest(unittest.TestCase):
+    """Regression tests for the Porter stemmer fast path"""
+
+    cases = {
+        'caresses': 'caress', 'ponies': 'poni', 'agreed': 'agre', 'disabled': 'disabl',
+        'matting': 'mat', 'mating': 'mate', 'meeting': 'meet', 'happy': 'happi',
+        'enjoy': 'enjoy', 'sky': 'sky', 'dying': 'die', 'relational': 'relat',
+        'conditional': 'condit', 'rationalization': 'ration', 'hopefulness': 'hope',
+        'yearly': 'yearli', 'syzygy': 'syzygi', 'buoyancy': 'buoyanc', 'eyeing': 'eye',
+        'generalizations': 'gener', 'probabilities': 'probabl', 'says': 'say',
+        'Playing': 'Play', 'McDonalds': 'McDonald', 'iPhones': 'iPhon', 'RUNNING': 'RUN',
+    }
+
+    def test_stem(self):
+        stemmer = PorterStemmer()
+        for word, stem in self.cases.items():
+            self.assertEqual(stemmer.stem(word), stem)
+
+    def test_memoized(self):
+        stemmer = MemoizedStemmer(PorterStemmer())
+        words = list(self.cases) * 2
+        self.assertEqual(stemmer.stem_batch(words), [self.cases[w] for w in words])
+
+
+class SnowballStemmerTest(unittest.TestCase):
+    """Tests for the language stemmer factory"""
+
+    def test_languages_are_available(self):
+        for language in SnowballStemmer.languages:
+            self.assertTrue(SnowballStemmer(language).stem('running'))
+
+    def test_instances_are_reused(self):
+        self.assertIs(SnowballStemmer('arabic').stemmer, get_stemmer('arabic'))
+        self.assertEqual(SnowballStemmer('porter').stem('running'), 'run')
+
+    def test_unknown_language(self):
+        self.assertRaises(ValueError, SnowballStemmer, 'klingon')
+
+
+class SimilarityTest(unittest.TestCase):
+    """Tests for stem vector similarity"""
+
+    docs = [
+        'ذهب الولد إلى المدرسة',
+        'ذهب الأولاد إلى المدارس',
+        'القطة السوداء نائمة',
+        'قطة سوداء تنام',
+        'الطقس جميل اليوم',
+    ]
+
+    def test_similarity(self):
+        self.assertAlmostEqual(arabicnlp.core.similarity(self.docs[0], self.docs[0]), 1.0, places=5)
+        self.assertGreater(arabicnlp.core.similarity(self.docs[0], self.docs[1]), 0)
+        self.assertEqual(arabicnlp.core.similarity(self.docs[0], self.docs[4]), 0)
+
+    def test_top_k(self):
+        X = TfidfVectorizer().fit_transform(self.docs)
+        indices, scores = top_k(X, k=2)
+        self.assertEqual(indices[:4, 0].tolist(), [1, 0, 3, 2])
+        self.assertEqual(indices[4].tolist(), [-1, -1])
+        self.assertTrue((scores[:, 0] >= scores[:, 1]).all())
+
+    def test_similarity_matrix(self):
+        matrix = similarity_matrix(self.docs, k=1)
+        self.assertEqual(matrix.shape, (5, 5))
+        self.assertEqual(matrix.nnz, 4)
+
+
+class HashingVectorizerTest(unittest.TestCase):
+    """Tests for the hashed stem n-gram vectorizer"""
+
+    docs = ['ذهب الولد إلى المدرسة', 'ذهب الأولاد إلى المدارس', 'القطة السوداء نائمة'] * 5
+
+    def test_stems(self):
+        X = HashingVectorizer(n_features=2 ** 10, norm=None, alternate_sign=False).transform(self.docs[:1])
+        stems = arabicnlp.core.stems(self.docs[0])
+        self.assertEqual(X.sum(), len(stems))
+        self.assertEqual(HashingVectorizer().transform([]).shape, (0, 2 ** 20))
+
+    def test_chunks(self):
+        vectorizer = HashingVectorizer(ngram_range=(1, 2), chunk_size=4)
+        X = vectorizer.transform(self.docs)
+        chunks = list(vectorizer.transform_chunks(iter(self.docs)))
+        self.assertEqual([c.shape[0] for c in chunks], [4, 4, 4, 3])
+        parallel = HashingVectorizer(ngram_range=(1, 2), chunk_size=4, n_jobs=2).transform(iter(self.docs))
+        self.assertEqual((X != parallel).nnz, 0)
+
+    def test_params(self):
+        vectorizer = HashingVectorizer(n_jobs=2)
+        params = vectorizer.get_params()
+        self.assertEqual(params['n_jobs'], 2)
+        self.assertEqual(type(vectorizer)(**params).get_params(), params)
+        self.assertEqual(vectorizer.set_params(n_features=16).transform(self.docs[:2]).shape, (2, 16))
+        with self.assertRaises(ValueError):
+            vectorizer.set_params(lowercase=True)
+
+
+class MinHashLSHTest(unittest.TestCase):
+    """Tests for the near-duplicate index"""
+
+    docs = [
+        'ذهب الولد إلى المدرسة صباح اليوم مع أخيه الصغير ثم عاد إلى البيت بعد الظهر',
+        'القطة السوداء نائمة على الأريكة في غرفة الجلوس منذ الصباح',
+    ]
+    duplicate = 'ذهب الولد إلى المدرسة صباح اليوم مع أخيه الصغير ثم عاد إلى البيت بعد العصر'
+
+    def test_query(self):
+        index = MinHashLSH(threshold=0.5)
+        self.assertEqual(index.insert_batch(self.docs), [0, 1])
+        self.assertEqual([i for i, _ in index.query(self.duplicate)], [0])
+        self.assertEqual(index.query('الطقس جميل اليوم'), [])
+
+    def test_save_load(self):
+        index = MinHashLSH(threshold=0.5)
+        index.insert_batch(self.docs)
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = MinHashLSH.load(directory)
+            self.assertEqual(loaded.query(self.duplicate), index.query(self.duplicate))
+            self.assertEqual(loaded.insert(self.duplicate), 2)
+            self.assertEqual(sorted(i for i, _ in loaded.query(self.docs[0])), [0, 2])
+            path = os.path.join(directory, 'index')
+            index.save(path)
+            loaded.save(path)
+            self.assertEqual(len(MinHashLSH.load(path)), 3)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(['index', 'meta.json', 'signatures.npy',
+                                                                    'band_keys.npy', 'band_ids.npy']))
+
+
+class SpellCheckerTest(unittest.TestCase):
+    """Tests for the symmetric-delete spell checker"""
+
+    checker = SpellChecker.from_corpus(['ذهب الولد إلى المدرسة', 'كتب الولد توصية املائية', 'المدرسة'])
+
+    def test_default_vocabulary(self):
+        self.assertEqual(arabicnlp.correct('تتتتتتتتوصية'), 'توصية')
+
+    def test_correct(self):
+        self.assertEqual(self.checker.lookup('المدرسسسسة'), 'المدرسة')
+        self.assertEqual(self.checker.lookup('املاءية'), 'املائية')
+        self.assertEqual(self.checker.lookup('الولذ'), 'الولد')
+        self.assertEqual(self.checker.lookup('شمس'), 'شمس')
+        self.assertEqual(self.checker.correct('ذهب الولذ، الى المدرسه!'), 'ذهب الولد، إلى المدرسة!')
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.checker.save(directory)
+            loaded = SpellChecker.load(directory)
+            texts = ['ذهب الولذ الى المدرسه', 'كتب توصيه املاءية']
+            self.assertEqual(loaded.correct_batch(texts), self.checker.correct_batch(texts))
+
+    def test_save_replaces_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index')
+            self.checker.save(path)
+            SpellChecker.from_corpus(['شمس']).save(path)
+            self.assertEqual(SpellChecker.load(path).lookup('شمز'), 'شمس')
+            self.assertEqual(os.listdir(directory), ['index'])
+
+
+class TokenizerTest(unittest.TestCase):
+    """Tests for the table-driven tokenizer"""
+
+    def test_tokens(self):
+        text = 'قالَ الرئيـــس: ٤٫٥ مليون، 1,000 دولار... 😀'
+        tokens, normalized = Tokenizer().tokenize(text, normalized=True)
+        self.assertEqual(tokens, ['قالَ', 'الرئيـــس', ':', '٤٫٥', 'مليون', '،', '1,000', 'دولار', '.', '.', '.', '😀'])
+        self.assertEqual(normalized[:4], ['قال', 'الرئيس', ':', '4.5'])
+
+    def test_long_text(self):
+        """Long texts go through the array pass, which must agree with the short text path"""
+        text = 'وقد قالَ الرئيـــس ٤٫٥ مليون، فالكتاب 3.14 (وهو) ' * 20
+        tokenizer = Tokenizer(clitics=('و', 'ف', 'ال'))
+        starts, ends = tokenizer.spans(text)
+        self.assertEqual([text[s:e] for s, e in zip(starts.tolist(), ends.tolist())], Tokenizer().tokenize(text))
+        starts, ends = tokenizer.spans(text, clitics=True)
+        self.assertEqual([text[s:e] for s, e in zip(starts.tolist(), ends.tolist())], tokenizer.tokenize(text))
+        sentence = text[:len(text) // 20]
+        self.assertEqual(tokenizer.tokenize(text, normalized=True),
+                         tuple(l * 20 for l in tokenizer.tokenize(sentence, normalized=True)))
+
+    def test_surrogates(self):
+        """Lone surrogates (text read with errors='surrogateescape') are tokenized by both paths"""
+        sentence = 'وقال abc \udc80 def '
+        text = sentence * 50
+        self.assertGreater(len(text), SHORT_TEXT)
+        tokenizer = Tokenizer(clitics=('و',))
+        self.assertEqual(tokenizer.tokenize(text), tokenizer.tokenize(sentence) * 50)
+        self.assertEqual(tokenizer.tokenize(text, normalized=True),
+                         tuple(l * 50 for l in tokenizer.tokenize(sentence, normalized=True)))
+
+    def test_clitics(self):
+        tokenizer = Tokenizer(clitics=('و', 'ف'), lexicon={'قد', 'هو'})
+        self.assertEqual(tokenizer.tokenize('وقد وقت فهو فهم'), ['و', 'قد', 'وقت', 'ف', 'هو', 'فهم'])
+        tokenizer = Tokenizer(clitics=('و', 'ب', 'ال'))
+        self.assertEqual(tokenizer.tokenize('وبالمدرسة'), ['و', 'ب', 'ال', 'مدرسة'])
+
+
+class VocabularyTest(unittest.TestCase):
+    """Tests for the interning vocabulary"""
+
+    def test_ids(self):
+        vocabulary = Vocabulary(['ذهب'])
+        ids = arabicnlp.tokens('ذهب الولد ذهب', vocabulary=vocabulary)
+        self.assertEqual((ids.dtype, ids.tolist()), (np.int32, [0, 1, 0]))
+        self.assertIsInstance(arabicnlp.stems('الولد', vocabulary=vocabulary, output='array'), array)
+        self.assertEqual(vocabulary.ids(['جديد'], grow=False).tolist(), [-1])
+        ids, offsets = vocabulary.ids_batch([['ذهب', 'إلى'], [], ['إلى']])
+        self.assertEqual((ids.tolist(), offsets.tolist()), ([0, 3, 3], [0, 2, 2, 3]))
+        self.assertEqual(vocabulary.words(ids), ['ذهب', 'إلى', 'إلى'])
+
+    def test_save_load_merge(self):
+        vocabulary = Vocabulary(['ذهب', 'الولد', 'إلى'])
+        directory = vocabulary.save(os.path.join(tempfile.mkdtemp(), 'vocabulary'))
+        loaded = Vocabulary.load(directory)
+        self.assertIsInstance(loaded._base, np.memmap)
+        self.assertEqual(loaded.ids(['إلى', 'جديد', 'ذهب']).tolist(), [2, 3, 0])
+        self.assertIn('جديد', loaded)
+        other = Vocabulary(['جديد', 'كتاب', 'ذهب'])
+        self.assertEqual(loaded.merge(other).tolist(), [3, 4, 0])
+        loaded.save(directory)
+        self.assertEqual(Vocabulary.load(directory).words([4, 1]), ['كتاب', 'الولد'])
+
+
+class CliticSegmenterTest(unittest.TestCase):
+    """Tests for the vocabulary-guided clitic segmenter"""
+
+    segmenter = CliticSegmenter(['و', 'ب', 'ل', 'المعلومات', 'المدرسة', 'كتاب', 'وقت'])
+
+    def test_split(self):
+        self.assertEqual(self.segmenter.split(['والمعلومات', 'وقت', 'للمدرسة', 'وبالمدرسة', 'فالكتاب', 'ولد']),
+                         ['و', 'المعلومات', 'وقت', 'ل', 'المدرسة', 'و', 'ب', 'المدرسة', 'ف', 'ال', 'كتاب', 'ولد'])
+        self.assertEqual(self.segmenter.split_batch([['بالمدرسة'], [], ['وقت', 'والمعلومات']]),
+                         [['ب', 'المدرسة'], [], ['وقت', 'و', 'المعلومات']])
+
+    def test_report(self):
+        report = self.segmenter.report(['والمعلومات', 'وقت', 'ولد'])
+        self.assertEqual((report['oov_before'], report['oov_after'], report['split']), (2, 1, 1))
+        self.assertEqual(report['tokens_after'], 4)
+
+    def test_rules_after_a_restored_article(self):
+        rules = dict(clitics._RULES)
+        rules['لل'] = rules['لل'] + [((1, 99), [('لل', 0, 2)], '')]
+        with mock.patch.object(clitics, '_RULES', rules):
+            candidates = self.segmenter._candidates('للمدرسة')
+        self.assertIn([('ل', 0, 1), ('المدرسة', 1, 7)], candidates)
+        self.assertIn([('لل', 0, 2), ('مدرسة', 2, 7)], candidates)
+
+
+class SentimentModelTest(unittest.TestCase):
+    """Tests for the hashed-feature sentiment classifier"""
+
+    texts = ['يوم رائع وجميل', 'خبر سيء ومزعج', 'فيلم رائع', 'طعام سيء', 'كتاب جميل', 'طقس مزعج']
+    labels = ['positive', 'negative', 'positive', 'negative', 'positive', 'negative']
+
+    def test_fit_predict(self):
+        model = SentimentModel(['negative', 'positive'], n_features=2 ** 12).fit(self.texts, self.labels, epochs=20, seed=0)
+        self.assertEqual(model.predict(self.texts), self.labels)
+        self.assertEqual(model.predict_proba(self.texts).shape, (6, 2))
+        with self.assertRaises(ValueError):
+            model.fit(self.texts, ['neutral'] * 6)
+
+    def test_streaming_score(self):
+        model = SentimentModel(['negative', 'positive'], n_features=2 ** 12).fit(self.texts, self.labels, epochs=20, seed=0)
+        rows = iter(zip(self.texts, self.labels))
+        self.assertEqual(model.score_rows(rows, chunk_size=4), model.score(self.texts, self.labels))
+        result = sentiment.evaluate(model, iter(zip(self.texts, self.labels)), batch_size=4)
+        self.assertEqual((result['messages'], result['accuracy']), (6, 1.0))
+
+    def test_registry(self):
+        model = SentimentModel(['negative', 'positive'], n_features=2 ** 12).fit(self.texts, self.labels, epochs=20, seed=0)
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, 'sentiment', 'v1')
+            os.makedirs(directory)
+            model.save(os.path.join(directory, 'sentiment.npz'))
+            write_manifest(directory, {'model': 'sentiment.npz'})
+            registry = ModelRegistry(model_dir=root)
+            registry.register('sentiment', sentiment._load_sentiment_model)
+            loaded = registry.load('sentiment')
+            np.testing.assert_allclose(loaded.predict_proba(self.texts), model.predict_proba(self.texts))
+
+
+class PerceptronTaggerTest(unittest.TestCase):
+    """Tests for the averaged perceptron tagger"""
+
+    def test_threads_share_the_feature_cache(self):
+        model = PerceptronTagger(['NOUN'], n_features=2 ** 10, max_cache=50)
+        documents = [['w%d_%d' % (t, i % 40) for i in range(200)] for t in range(8)]
+        expected = [model.features(words) for words in documents]
+        results = [None] * len(documents)
+
+        def run(t):
+            for _ in range(20):
+                results[t] = model.features(documents[t])
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in range(len(documents))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for got, want in zip(results, expected):
+            np.testing.assert_array_equal(got, want)
+
+    sentences = [
+        [('ذهب', 'VERB'), ('الولد', 'NOUN'), ('إلى', 'ADP'), ('المدرسة', 'NOUN'), ('.', 'PUNCT')],
+        [('كتب', 'VERB'), ('الطالب', 'NOUN'), ('في', 'ADP'), ('الكتاب', 'NOUN'), ('.', 'PUNCT')],
+        [('قرأ', 'VERB'), ('المعلم', 'NOUN'), ('من', 'ADP'), ('الدرس', 'NOUN'), ('.', 'PUNCT')],
+        [],
+    ]
+
+    def test_fit_predict(self):
+        model = PerceptronTagger(['ADP', 'NOUN', 'PUNCT', 'VERB'], n_features=2 ** 12).fit(self.sentences, seed=0)
+        self.assertEqual(model.score(self.sentences), 1.0)
+        self.assertEqual(model.predict(['ذهب', 'الطالب', 'إلى', 'الدرس', '.']), ['VERB', 'NOUN', 'ADP', 'NOUN', 'PUNCT'])
+        self.assertEqual(model.predict([]), [])
+        with self.assertRaises(ValueError):
+            PerceptronTagger(['NOUN']).fit(self.sentences)
+
+    def test_registry(self):
+        model = PerceptronTagger(['ADP', 'NOUN', 'PUNCT', 'VERB'], n_features=2 ** 12).fit(self.sentences, seed=0)
+        model_dir = default_registry.model_dir
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, 'pos-fast', 'v1')
+            os.makedirs(directory)
+            model.save(os.path.join(directory, 'pos_fast.npz'))
+            write_manifest(directory, {'model': 'pos_fast.npz'})
+            default_registry.model_dir = root
+            try:
+                result = tag_document('ذهب الولد إلى المدرسة. كتب الطالب', backend='fast')
+                self.assertEqual([tag for _, tag, _, _ in result], ['VERB', 'NOUN', 'ADP', 'NOUN', 'PUNCT', 'VERB', 'NOUN'])
+                split = arabicnlp.tags('والمدرسة', backend='fast', clitics=True)
+                self.assertEqual((sorted(split), split['المدرسة']), (['المدرسة', 'و'], 'NOUN'))
+                with self.assertRaises(ValueError):
+                    tag_document('ذهب', backend='crf')
+            finally:
+                default_registry.model_dir = model_dir
+                default_registry.unload('pos-fast')
+
+
+class JobTest(unittest.TestCase):
+    """Tests for the resumable sharded job runner"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.input = os.path.join(self.root, 'docs.txt')
+        with open(self.input, 'w', encoding='utf-8') as f:
+            f.write(''.join('ذهب الولد إلى المدرسة %d\n' % i for i in range(25)))
+        self.directory = os.path.join(self.root, 'job')
+        jobs.create_manifest(self.directory, [self.input], ['tokens'], documents_per_shard=10)
+
+    def _outputs(self):
+        lines = []
+        for shard in ('00000', '00001', '00002'):
+            with open(os.path.join(self.directory, shard + '.jsonl'), encoding='utf-8') as f:
+                lines.extend(f)
+        return lines
+
+    def test_run_and_resume(self):
+        reports = []
+        self.assertEqual(jobs.run(self.directory, workers=0, report=reports.append)['documents_done'], 25)
+        self.assertEqual([r['documents'] for r in reports], [10, 10, 5])
+        self.assertEqual(reports[-1]['eta'], 0.0)
+        outputs = self._outputs()
+        self.assertEqual(len(outputs), 25)
+        self.assertIn('"24"', outputs[-1])
+        # an interrupted shard is the only one processed again
+        os.remove(os.path.join(self.directory, '00001.done'))
+        reports = []
+        jobs.run(self.directory, workers=0, report=reports.append)
+        self.assertEqual([r['id'] for r in reports], ['00001'])
+        self.assertEqual(self._outputs(), outputs)
+
+    def test_store(self):
+        store = os.path.join(self.root, 'results.db')
+        jobs.run(self.directory, workers=0, store=store)
+        outputs = self._outputs()
+        for shard in ('00000', '00001', '00002'):
+            os.remove(os.path.join(self.directory, shard + '.done'))
+        jobs.run(self.directory, workers=0, store=store)
+        self.assertEqual(self._outputs(), outputs)
+        self.assertEqual(len(ResultStore(store)), 25)
+        self.assertEqual(jobs._stores[store].stats()['hits'], 25)
+
+    def test_claims(self):
+        lock = os.path.join(self.directory, '00000.lock')
+        with open(lock, 'w') as f:
+            f.write('other-host:1')
+        reports = []
+        result = jobs.run(self.directory, workers=0, report=reports.append)
+        self.assertEqual(reports[0]['status'], 'skipped')
+        self.assertEqual((result['done'], result['claimed']), (2, 1))
+        # the claim of a worker silent for longer than the lease is taken over
+        os.utime(lock, (time.time() - 3600, time.time() - 3600))
+        self.assertEqual(jobs.run(self.directory, workers=0)['done'], 3)
+        self.assertFalse(os.path.exists(lock))
+
+
+class ResultStoreTest(unittest.TestCase):
+    """Tests for the content-addressed result store"""
+
+    def setUp(self):
+        self.store = ResultStore(os.path.join(tempfile.mkdtemp(), 'results.db'), max_bytes=2 ** 20)
+
+    def test_encode(self):
+        values = [['ذهب', 'الولد'], [], {'ذهب': 'VERB', '': 'X'}, {}, [''], {'n': 1}, ['a\x1fb'] * 100]
+        self.assertEqual(decode(encode(values)), values)
+
+    def test_process(self):
+        pipeline = Pipeline(['tokens', 'stems'])
+        texts = ['ذهب الولد إلى المدرسة', 'كتب الطالب', 'ذهب الولد إلى المدرسة']
+        first = pipeline.process(texts, self.store)
+        self.assertEqual(first[0], {'tokens': arabicnlp.tokens(texts[0]), 'stems': arabicnlp.stems(texts[0])})
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(pipeline.process(texts, self.store), first)
+        self.assertEqual(self.store.stats()['hits'], 2)
+        # other steps, other keys
+        other = Pipeline(['tokens'])
+        self.assertNotEqual(other.key(texts[0]), pipeline.key(texts[0]))
+        other.process(texts, self.store)
+        self.assertEqual(self.store.invalidate(keep=other.fingerprint), 2)
+        self.assertEqual(len(self.store), 2)
+
+    def test_eviction(self):
+        self.store.max_bytes = 10000
+        self.store.put_many((('%05d' % i).encode(), b'x' * 100) for i in range(500))
+        self.assertLessEqual(self.store.bytes, 10000)
+        self.assertGreater(self.store.stats()['evictions'], 0)
+        self.assertEqual(self.store.get(b'00499'), b'x' * 100)
+        self.assertIsNone(self.store.get(b'00000'))
+
+    def test_fingerprint_covers_the_tagger_code(self):
+        before = fingerprint(['tags'])
+        digest = pipeline._source_digest
+        for module in ('arabicnlp.models.shared', 'arabicnlp.preprocessing.clitics'):
+            changed = lambda m: 'changed' if m == module else digest(m)
+            with mock.patch.object(pipeline, '_source_digest', changed):
+                self.assertNotEqual(fingerprint(['tags']), before)
+
+
+class GazetteerTest(unittest.TestCase):
+    """Tests for the Aho-Corasick gazetteer"""
+
+    phrases = [('محمد بن سلمان', 'PERSON'), ('سلمان', 'NAME'), ('الرياض', 'LOCATION')]
+    text = 'وصل مُحمّد بن سلمان إلى الرياض'
+
+    def test_find(self):
+        gazetteer = Gazetteer(self.phrases)
+        matches = gazetteer.find(self.text)
+        self.assertEqual([(self.text[s:e], label) for s, e, label in matches],
+                         [('مُحمّد بن سلمان', 'PERSON'), ('سلمان', 'NAME'), ('الرياض', 'LOCATION')])
+        self.assertEqual([label for _, _, label in gazetteer.find(self.text, overlapping=False)],
+                         ['PERSON', 'LOCATION'])
+        self.assertEqual(gazetteer.find('ذهب الولد إلى المدرسة'), [])
+
+    def test_stem(self):
+        gazetteer = Gazetteer(['المدرسة'], stem=True)
+        self.assertEqual(len(gazetteer.find('ذهب إلى المدرسة ثم والمدرسة')), 2)
+        self.assertEqual(Gazetteer(['المدرسة']).find('والمدرسة'), [])
+
+    def test_save_load(self):
+        gazetteer = Gazetteer(self.phrases)
+        with tempfile.TemporaryDirectory() as directory:
+            gazetteer.save(os.path.join(directory, 'gazetteer'))
+            loaded = Gazetteer.load(os.path.join(directory, 'gazetteer'))
+            self.assertEqual(loaded.find(self.text), gazetteer.find(self.text))
+            self.assertEqual(loaded.add('إلى الرياض', 'TRIP'), 3)
+            self.assertIn('TRIP', [label for _, _, label in loaded.find(self.text)])
+
+
+class InvertedIndexTest(unittest.TestCase):
+    """Tests for the BM25 inverted index"""
+
+    docs = [
+        'ذهب الولد إلى المدرسة',
+        'الانتخابات البرلمانية في مصر',
+        'نتائج الانتخابات المحلية',
+        'المدرسة الجديدة في المدينة',
+    ]
+
+    def test_varints(self):
+        values = np.array([0, 1, 127, 128, 300, 2 ** 21, 2 ** 32 - 1], dtype=np.uint64)
+        self.assertEqual(encode_varints(values[:3]).tolist(), [0, 1, 127])
+        self.assertEqual(decode_varints(encode_varints(values)).tolist(), values.tolist())
+
+    def test_search(self):
+        index = InvertedIndex()
+        self.assertEqual(index.add_batch(self.docs), [0, 1, 2, 3])
+        self.assertEqual(sorted(i for i, _ in index.search('الانتخابات')), [1, 2])
+        self.assertEqual([i for i, _ in index.search('المدرسة الولد')], [0, 3])
+        index.delete(2)
+        self.assertEqual([i for i, _ in index.search('الانتخابات')], [1])
+        self.assertEqual(index.search('السماء'), [])
+        self.assertEqual(index.search('الانتخابات', k=0), [])
+        self.assertEqual(len(index.search('المدرسة الولد الانتخابات', k=1)), 1)
+
+    def test_segments(self):
+        index = InvertedIndex()
+        index.add_batch(self.docs[:2])
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            index = InvertedIndex.load(directory)
+            index.add_batch(self.docs[2:])
+            index.delete(0)
+            expected = index.search('المدرسة الانتخابات')
+            index.save(directory)
+            index = InvertedIndex.load(directory)
+            self.assertEqual(len(index.segments), 2)
+            self.assertEqual(index.search('المدرسة الانتخابات'), expected)
+            self.assertEqual(index.compact().tolist(), [-1, 0, 1, 2])
+            self.assertEqual(sorted(i for i, _ in index.search('الانتخابات')), [0, 1])
+            index.save(directory)
+            self.assertEqual(len(InvertedIndex.load(directory)), 3)
+
+    def test_save_replaces_index(self):
+        """A save swaps the whole directory, sharing the files of saved segments"""
+        with tempfile.TemporaryDirectory() as parent:
+            directory = os.path.join(parent, 'search')
+            index = InvertedIndex()
+            index.add_batch(self.docs[:2])
+            index.save(directory)
+            index = InvertedIndex.load(directory)
+            index.add_batch(self.docs[2:])
+            index.delete(1)
+            index.save(directory)
+            self.assertEqual(os.listdir(parent), ['search'])
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ['deleted.npy', 'meta.json', 'segment_000000', 'segment_000001'])
+            loaded = InvertedIndex.load(directory)
+            self.assertEqual(loaded.deleted, {1})
+            self.assertEqual(loaded.search('المدرسة الانتخابات'), index.search('المدرسة الانتخابات'))
+            index.compact()
+            index.save(directory)
+            self.assertEqual(sorted(os.listdir(directory)), ['deleted.npy', 'meta.json', 'segment_000000'])
+            self.assertEqual(len(InvertedIndex.load(directory)), 3)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file